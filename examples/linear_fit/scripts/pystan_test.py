@@ -17,8 +17,8 @@ generator_config = {
         "xmax": 10,
         "sigma": 1.6
     },
+    "algorithm": "Fixed_param",
     "iter": 530,
-    "warmup": 500,
     "interestParams": ['x', 'y', 'residual'],
     "diagnostics_folder": "linear_fit/plots/generator_diagnostics"
 }
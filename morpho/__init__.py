@@ -13,17 +13,25 @@ import pkg_resources
 __version__ = pkg_resources.require("morpho")[0].version.split('-')[0]
 __commit__ = pkg_resources.require("morpho")[0].version.split('-')[-1]
 
-# from . import processors
-# from . import utilities
+__all__ = ["processors", "utilities"]
 
-__all__ = []
-import pkgutil
-import inspect
 
-for loader, name, is_pkg in pkgutil.walk_packages(__path__):
-    module = loader.find_module(name).load_module(name)
-    for name, value in inspect.getmembers(module):
-        if name.startswith("__"):
-          continue
-        globals()[name] = value
-        __all__.append(name)
+def __getattr__(name):
+    '''
+    Subpackages and processors (e.g. morpho.PyStanSamplingProcessor) are only
+    imported when accessed, using the processors registry: this way ROOT or
+    pystan are not imported if no processor needs them.
+    '''
+    import importlib
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    from morpho.processors import registry
+    if registry.get_path(name) is not None:
+        value = registry.load(name)
+    else:
+        utilities = importlib.import_module(".utilities", __name__)
+        if not hasattr(utilities, name):
+            raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+        value = getattr(utilities, name)
+    globals()[name] = value
+    return value
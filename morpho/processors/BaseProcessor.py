@@ -9,6 +9,7 @@ import abc
 import six
 
 from morpho.utilities import morphologging
+from morpho.utilities.instrumentation import Measurement
 import logging
 logger = morphologging.getLogger(__name__)
 
@@ -25,6 +26,11 @@ class BaseProcessor():
 
     Parameters:
         delete: do delete processor after running
+        trace_allocations: record the top memory allocations (tracemalloc)
+            during Configure and Run (default=False)
+
+    Statistics:
+        stats: wall time, CPU time and peak RSS increase of Configure and Run
 
     Input:
         None
@@ -35,6 +41,8 @@ class BaseProcessor():
 
     def __init__(self, name, *args, **kwargs):
         self._procName = name
+        self.trace_allocations = False
+        self.stats = dict()
         logger.debug("Creating processor <{}>".format(self._procName))
 
     @property
@@ -54,7 +62,11 @@ class BaseProcessor():
             self._delete_processor = params['delete']
         else:
             self._delete_processor = True
-        if not self.InternalConfigure(params):
+        self.trace_allocations = params.get('trace_allocations', self.trace_allocations)
+        self.stats["configure"] = dict()
+        with Measurement(self.stats["configure"], self.trace_allocations):
+            success = self.InternalConfigure(params)
+        if not success:
             logger.error("Error while configuring <{}>".format(self.name))
             return False
         return True
@@ -72,10 +84,13 @@ class BaseProcessor():
         This method will be called by nymph to run the processor
         '''
         logger.info("Run <{}>...".format(self.name))
-        if not self.InternalRun():
+        self.stats["run"] = dict()
+        with Measurement(self.stats["run"], self.trace_allocations):
+            success = self.InternalRun()
+        if not success:
             logger.error("Error while running <{}>".format(self.name))
             return False
-        logger.info("Done with <{}>".format(self.name))
+        logger.info("Done with <{}> ({:.3f} s)".format(self.name, self.stats["run"]["wall"]))
         return True
 
     @abc.abstractmethod
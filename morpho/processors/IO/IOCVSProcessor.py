@@ -76,7 +76,10 @@ class IOCVSProcessor(IOProcessor):
             try:
                 writer = csv.writer(csv_file)
                 for key in self.variables:
-                    writer.writerow([key, self.data[key]])
+                    value = self.data[key]
+                    if hasattr(value, "tolist"):
+                        value = value.tolist()
+                    writer.writerow([key, value])
             except:
                 logger.error("Error while writing {}".format(self.file_name))
                 raise
@@ -77,14 +77,14 @@ class IOJSONProcessor(IOProcessor):
             if isinstance(item, str):
                 alias = item
                 var = item
-                subData.update({str(alias): self.data[var]})
+                subData.update({str(alias): _to_builtin(self.data[var])})
             elif isinstance(item, dict) and 'variable' in item.keys() and item['variable'] in self.data.keys():
                 var = str(item['variable'])
                 if "json_alias" in item:
                     alias = str(item.get("json_alias"))
                 else:
                     alias = var
-                subData.update({str(alias): self.data[var]})
+                subData.update({str(alias): _to_builtin(self.data[var])})
             else:
                 logger.error("Variable {} does not exist in {}".format(
                     self.variables, self.file_name))
@@ -116,3 +116,12 @@ class IOYAMLProcessor(IOJSONProcessor):
     '''
 
     module_name = 'yaml'
+
+
+def _to_builtin(value):
+    # numpy arrays and scalars cannot be dumped as such
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {key: _to_builtin(item) for key, item in value.items()}
+    return value
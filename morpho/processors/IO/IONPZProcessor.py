@@ -0,0 +1,71 @@
+'''
+NPZ (numpy) IO processor
+Authors: agent
+Date: 10/18/26
+'''
+
+from __future__ import absolute_import
+
+import os
+
+import numpy
+
+from morpho.processors.IO import IOProcessor
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+__all__ = []
+__all__.append(__name__)
+
+
+class IONPZProcessor(IOProcessor):
+    '''
+    IO NPZ Processor: variables are stored as numpy arrays of any shape
+    (e.g. the (n_draws, *shape) arrays of the array parameters of PyStanSamplingProcessor)
+
+    Parameters:
+        filename (required): path/name of file
+        variables (required): variables to extract
+        action: read or write (default="read")
+
+    Input:
+        None
+
+    Results:
+        data: dictionary containing the data
+    '''
+
+    def Reader(self):
+        logger.debug("Reading {}".format(self.file_name))
+        if not os.path.exists(self.file_name):
+            logger.error("File {} does not exist".format(self.file_name))
+            raise FileNotFoundError(self.file_name)
+        with numpy.load(self.file_name, allow_pickle=False) as npz_file:
+            for var in self.variables:
+                if var in npz_file.files:
+                    self.data.update({str(var): npz_file[var]})
+                else:
+                    logger.error("Variable {} does not exist in {}".format(
+                        var, self.file_name))
+                    return False
+        return True
+
+    def Writer(self):
+        logger.debug("Saving data in {}".format(self.file_name))
+        rdir = os.path.dirname(self.file_name)
+        if rdir != '' and not os.path.exists(rdir):
+            os.makedirs(rdir)
+            logger.debug("Creating folder: {}".format(rdir))
+        subData = {}
+        for var in self.variables:
+            if var not in self.data:
+                logger.error("Variable {} does not exist in data".format(var))
+                return False
+            subData.update({str(var): numpy.asarray(self.data[var])})
+        try:
+            numpy.savez(self.file_name, **subData)
+        except:
+            logger.error("Error while writing {}".format(self.file_name))
+            raise
+        logger.debug("File saved!")
+        return True
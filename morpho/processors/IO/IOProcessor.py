@@ -46,6 +46,14 @@ class IOProcessor(BaseProcessor):
         logger.error("Default Writer method: need to implement your own")
         raise
 
+    def InputFiles(self):
+        '''
+        Files read by the processor (their state is part of its cache key)
+        '''
+        if self.file_action == 'write':
+            return []
+        return [self.file_name]
+
     def InternalConfigure(self, params):
         '''
         This method will be called by nymph to configure the processor
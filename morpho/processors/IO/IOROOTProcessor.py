@@ -6,19 +6,23 @@ Date: 06/26/18
 
 from __future__ import absolute_import
 
+import numbers
 import os
 
+import numpy
+
 from morpho.utilities import morphologging, reader
 
 logger = morphologging.getLogger(__name__)
 
 from morpho.processors.IO import IOProcessor
+from morpho.processors import StreamingProcessor
 
 __all__ = []
 __all__.append(__name__)
 
 
-class IOROOTProcessor(IOProcessor):
+class IOROOTProcessor(IOProcessor, StreamingProcessor):
     '''
     Base IO ROOT Processor
     The ROOT Reader and Writer
@@ -29,12 +33,17 @@ class IOROOTProcessor(IOProcessor):
         action: read or write (default="read")
         tree_name (required): name of the tree
         file_option: option for the file (default=Recreate)
+        chunk_size: number of entries per chunk when streaming (default=100000)
 
     Input:
         None
 
     Results:
         data: dictionary containing the data
+
+    Streaming:
+        As a producer (action: read), yields chunks of the tree.
+        As a consumer (action: write), writes the chunks into the tree.
     '''
 
     def InternalConfigure(self, params):
@@ -50,36 +59,89 @@ class IOROOTProcessor(IOProcessor):
         The variables should be a list of the "variable" to read.
         '''
         logger.debug("Reading {}".format(self.file_name))
-        import uproot
         for key in self.variables:
             self.data.update({str(key): []})
+        for chunk in self._ReadChunks():
+            for varName, value in chunk.items():
+                if hasattr(value, "tolist"):
+                    value = value.tolist()
+                self.data.setdefault(varName, []).extend(value)
+        return True
+
+    def _ReadChunks(self):
+        '''
+        Yield the content of the TTree by chunks of chunk_size entries
+        '''
         try:
+            import uproot
             tree = uproot.open(self.file_name)[self.tree_name]
-            for data in tree.iterate(self.variables):
-                for key, value in data.items():
-                    varName = key.decode("utf-8")
-                    self.data.update({str(varName): self.data[str(varName)] + value.tolist()})
         except:
             logger.warning("An uproot related error was encountered. Switching to ROOT.")
-            try:
-                import ROOT
-            except ImportError:
-                logger.warning("Failed importing ROOT")
-            else:
-                infile = ROOT.TFile(self.file_name, "READ")
-                tree = infile.Get(self.tree_name)
-                for i in range(0, tree.GetEntries()):
-                    tree.GetEntry(i)
-                    for varName in self.variables:
-                        if str(varName) not in self.data.keys():
-                            logger.debug("Adding {} to data".format(varName))
-                            self.data.update({str(varName): list()})
-                        val = getattr(tree, varName)
-                        if isinstance(val, int) or isinstance(val, float) or isinstance(val, list):
-                            self.data[varName].append(val)
-                        else:
-                            self.data[varName].append(list(val))
-                            
+            for chunk in self._ReadChunksROOT():
+                yield chunk
+            return
+        for data in tree.iterate(self.variables, entrysteps=self.chunk_size):
+            chunk = dict()
+            for key, value in data.items():
+                if isinstance(key, bytes):
+                    key = key.decode("utf-8")
+                chunk.update({str(key): value})
+            yield chunk
+
+    def _ReadChunksROOT(self):
+        try:
+            import ROOT
+        except ImportError:
+            logger.warning("Failed importing ROOT")
+            return
+        infile = ROOT.TFile(self.file_name, "READ")
+        tree = infile.Get(self.tree_name)
+        chunk = dict()
+        for i in range(0, tree.GetEntries()):
+            tree.GetEntry(i)
+            for varName in self.variables:
+                if str(varName) not in chunk.keys():
+                    chunk.update({str(varName): list()})
+                val = getattr(tree, varName)
+                if isinstance(val, int) or isinstance(val, float) or isinstance(val, list):
+                    chunk[varName].append(val)
+                else:
+                    chunk[varName].append(list(val))
+            if (i+1) % self.chunk_size == 0:
+                yield chunk
+                chunk = dict()
+        if len(chunk) > 0:
+            yield chunk
+        infile.Close()
+
+    def InternalChunks(self):
+        '''
+        Stream the content of the TTree (action: read)
+        '''
+        if self.file_action == 'write':
+            logger.error("<{}> writes a file: cannot be used as a stream producer".format(self.name))
+            raise ValueError(self.name)
+        for chunk in self._ReadChunks():
+            yield chunk
+
+    def InternalStartStream(self):
+        if self.file_action != 'write':
+            logger.error("<{}> reads a file: cannot be used as a stream consumer".format(self.name))
+            return False
+        self._OpenTree()
+        return True
+
+    def InternalRunChunk(self, chunk):
+        '''
+        Write a chunk into the TTree (action: write)
+        '''
+        if self._info_data is None:
+            self._DefineBranches(chunk)
+        self._FillTree(chunk)
+        return None
+
+    def InternalStopStream(self):
+        self._CloseTree()
         return True
 
     def Writer(self):
@@ -90,6 +152,13 @@ class IOROOTProcessor(IOProcessor):
             - "root_alias" is the name of the branch in the tree,
             - "type" is the type of data to be saved.
         '''
+        self._OpenTree()
+        self._DefineBranches(self.data)
+        self._FillTree(self.data)
+        self._CloseTree()
+        return True
+
+    def _OpenTree(self):
         logger.debug("Saving data in {}".format(self.file_name))
 
         rdir = os.path.dirname(self.file_name)
@@ -103,13 +172,16 @@ class IOROOTProcessor(IOProcessor):
         except ImportError:
             pass
 
-        f = ROOT.TFile(self.file_name, self.file_option)
-        t = ROOT.TTree(self.tree_name, self.tree_name)
+        self._file = ROOT.TFile(self.file_name, self.file_option)
+        self._tree = ROOT.TTree(self.tree_name, self.tree_name)
+        self._info_data = None
+
+    def _DefineBranches(self, data):
         info_data = {}
         numberData = -1
         hasUpdatedNumberData = False
 
-        # Determine general properties of the tree: type and size of branches, number of iterations for the tree
+        # Determine general properties of the tree: type and size of branches
         logger.debug("Defining tree properties")
         for a_item in self.variables:
             if isinstance(a_item, dict) and "variable" in a_item.keys():
@@ -126,24 +198,33 @@ class IOROOTProcessor(IOProcessor):
             else:
                 logger.error("Unknown type: {}".format(a_item))
 
-            if numberData < len(self.data[varName]):
+            if numberData < len(data[varName]):
                 if hasUpdatedNumberData:
                     logger.warning(
                         "Number of datapoints updated more than once: potential problem with input data")
                 else:
                     logger.debug("Updating number datapoints")
-                numberData = len(self.data[varName])
+                numberData = len(data[varName])
                 hasUpdatedNumberData = True
-            if isinstance(self.data[varName][0], list):
+            if isinstance(data[varName], numpy.ndarray) and data[varName].ndim > 1:
+                # (n, *shape) array: fixed-length (multi-dimensional) branch
                 info_subDict = {
-                    "len": len(self.data[varName][0]),
-                    "type": _branch_element_type_from_string(varType) or _branch_element_type(self.data[varName][0][0]),
+                    "len": int(numpy.prod(data[varName].shape[1:])),
+                    "shape": data[varName].shape[1:],
+                    "type": _branch_element_type_from_string(varType) or _branch_element_type(data[varName].flat[0]),
+                    "root_alias": varRootAlias
+                }
+            elif _is_sequence(data[varName][0]):
+                info_subDict = {
+                    "len": len(data[varName][0]),
+                    "shape": (len(data[varName][0]),),
+                    "type": _branch_element_type_from_string(varType) or _branch_element_type(data[varName][0][0]),
                     "root_alias": varRootAlias
                 }
             else:
                 info_subDict = {
                     "len": 0,
-                    "type": _branch_element_type_from_string(varType) or _branch_element_type(self.data[varName][0]),
+                    "type": _branch_element_type_from_string(varType) or _branch_element_type(data[varName][0]),
                     "root_alias": varRootAlias
                 }
             info_data.update({str(varName): info_subDict})
@@ -160,39 +241,52 @@ class IOROOTProcessor(IOProcessor):
             if info_data[key]["len"] == 0:
                 setattr(tempObject, str(info_data[key]["root_alias"]), array(info_data[key]['type'].lower(), [
                     _get_zero_with_type(info_data[key]['type'])]))
-                t.Branch(str(str(info_data[key]['root_alias'])), getattr(
+                self._tree.Branch(str(str(info_data[key]['root_alias'])), getattr(
                     tempObject, str(info_data[key]["root_alias"])),
-                         '{}/{}'.format(str(info_data[key]['root_alias']), info_data[key]['type']))
+                    '{}/{}'.format(str(info_data[key]['root_alias']), info_data[key]['type']))
             else:
                 setattr(tempObject, str(info_data[key]["root_alias"]), array(info_data[key]['type'].lower(), int(
                     info_data[key]['len']) * [_get_zero_with_type(info_data[key]['type'])]))
-                t.Branch(str(str(info_data[key]['root_alias'])),
-                         getattr(tempObject, str(info_data[key]['root_alias'])),
-                         '{}[{}]/{}'.format(str(info_data[key]['root_alias']), info_data[key]['len'],
-                                            info_data[key]['type']))
+                self._tree.Branch(str(str(info_data[key]['root_alias'])),
+                                  getattr(tempObject, str(info_data[key]['root_alias'])),
+                                  '{}{}/{}'.format(str(info_data[key]['root_alias']),
+                                                   "".join("[{}]".format(dim) for dim in info_data[key]['shape']),
+                                                   info_data[key]['type']))
+        self._info_data = info_data
+        self._tempObject = tempObject
 
+    def _FillTree(self, data):
+        info_data = self._info_data
+        tempObject = self._tempObject
+        numberData = max(len(data[str(key)]) for key in info_data)
         logger.debug("Adding data")
         for i in range(numberData):
             for key in info_data:
                 temp_var = getattr(tempObject, str(info_data[key]['root_alias']))
                 if info_data[key]["len"] == 0:
-                    temp_var[0] = self.data[str(key)][i]
+                    temp_var[0] = data[str(key)][i]
                 else:
+                    values = numpy.ravel(data[str(key)][i])
                     for j in range(info_data[key]["len"]):
-                        temp_var[j] = self.data[str(key)][i][j]
+                        temp_var[j] = values[j]
                 setattr(tempObject, str(key), temp_var)
-            t.Fill()
-        f.cd()
-        t.Write()
-        f.Close()
+            self._tree.Fill()
+
+    def _CloseTree(self):
+        self._file.cd()
+        self._tree.Write()
+        self._file.Close()
         logger.debug("File saved!")
-        return True
+
+
+def _is_sequence(element):
+    return isinstance(element, (list, tuple, numpy.ndarray))
 
 
 def _branch_element_type(element):
-    if isinstance(element, int):
+    if isinstance(element, numbers.Integral):
         return "I"
-    elif isinstance(element, float):
+    elif isinstance(element, numbers.Real):
         return "F"
     else:
         logger.warning("{} not supported; using float".format(type(element)))
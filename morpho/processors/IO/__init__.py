@@ -1,10 +1,20 @@
 '''
+The members of this package are imported on first access
 '''
 
 from __future__ import absolute_import
 
 from .IOProcessor import IOProcessor
-from .IOCVSProcessor import IOCVSProcessor
-from .IOJSONProcessor import IOJSONProcessor, IOYAMLProcessor
-from .IORProcessor import IORProcessor
-from .IOROOTProcessor import IOROOTProcessor
+
+from morpho.utilities.lazy import make_lazy
+
+_lazy_members = {
+    "IOCVSProcessor": ".IOCVSProcessor:IOCVSProcessor",
+    "IOJSONProcessor": ".IOJSONProcessor:IOJSONProcessor",
+    "IOYAMLProcessor": ".IOJSONProcessor:IOYAMLProcessor",
+    "IONPZProcessor": ".IONPZProcessor:IONPZProcessor",
+    "IORProcessor": ".IORProcessor:IORProcessor",
+    "IOROOTProcessor": ".IOROOTProcessor:IOROOTProcessor"
+}
+
+make_lazy(__name__)
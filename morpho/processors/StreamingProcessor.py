@@ -0,0 +1,93 @@
+'''
+Base processor for streaming (chunk by chunk) operations
+Authors: agent
+Date: 10/18/26
+'''
+
+from __future__ import absolute_import
+
+from morpho.utilities import morphologging
+from morpho.processors import BaseProcessor
+logger = morphologging.getLogger(__name__)
+
+__all__ = []
+__all__.append(__name__)
+
+
+class StreamingProcessor(BaseProcessor):
+    '''
+    Streaming Processor
+    Processors which can be connected with streaming connections
+    (stream: True in the connection definition).
+    Instead of exchanging the whole data, the processors exchange chunks:
+    dictionaries containing a chunk of each column.
+    - a producer yields chunks via InternalChunks,
+    - a consumer receives chunks via InternalRunChunk and can
+      return a new chunk given to its own consumers,
+    - InternalStartStream and InternalStopStream are called before
+      the first and after the last chunk.
+    Memory usage then depends on the chunk size and not on the dataset size.
+
+    Parameters:
+        chunk_size: number of entries per chunk (default=100000)
+    '''
+
+    def Configure(self, params):
+        self.chunk_size = int(params.get('chunk_size', 100000))
+        return super().Configure(params)
+
+    def Chunks(self):
+        '''
+        Generator of chunks, called by the toolbox on the producer
+        '''
+        logger.info("Stream from <{}>...".format(self.name))
+        for chunk in self.InternalChunks():
+            yield chunk
+        logger.info("Done streaming from <{}>".format(self.name))
+
+    def StartStream(self):
+        '''
+        Called by the toolbox before the first chunk
+        '''
+        logger.info("Start stream into <{}>".format(self.name))
+        if not self.InternalStartStream():
+            logger.error("Error while starting stream into <{}>".format(self.name))
+            return False
+        return True
+
+    def RunChunk(self, chunk):
+        '''
+        Called by the toolbox for each chunk; returns the chunk
+        to give to the connected processors (or None)
+        '''
+        return self.InternalRunChunk(chunk)
+
+    def StopStream(self):
+        '''
+        Called by the toolbox after the last chunk
+        '''
+        if not self.InternalStopStream():
+            logger.error("Error while stopping stream into <{}>".format(self.name))
+            return False
+        logger.info("Done with stream into <{}>".format(self.name))
+        return True
+
+    def InternalChunks(self):
+        '''
+        Need to be defined by the child class
+        '''
+        logger.error("Default InternalChunks method: need to implement your own")
+        raise
+
+    def InternalStartStream(self):
+        return True
+
+    def InternalRunChunk(self, chunk):
+        '''
+        Need to be defined by the child class
+        '''
+        logger.error("Default InternalRunChunk method: need to implement your own")
+        raise
+
+    def InternalStopStream(self):
+        return True
@@ -1,11 +1,21 @@
 '''
+The members of this package are imported on first access
 '''
 
 from __future__ import absolute_import
 
 from .BaseProcessor import BaseProcessor
-from . import diagnostics
-from . import IO
-from . import misc
-from . import plots
-from . import sampling
+from .StreamingProcessor import StreamingProcessor
+
+from morpho.utilities.lazy import make_lazy
+
+_lazy_members = {
+    "diagnostics": ".diagnostics",
+    "IO": ".IO",
+    "misc": ".misc",
+    "plots": ".plots",
+    "sampling": ".sampling",
+    "registry": ".registry"
+}
+
+make_lazy(__name__)
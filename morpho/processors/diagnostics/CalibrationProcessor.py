@@ -12,7 +12,7 @@ import numpy as np
 import math
 from os.path import exists
 
-from morpho.utilities import morphologging, reader
+from morpho.utilities import morphologging, reader, ensemble
 from morpho.processors import BaseProcessor
 from morpho.processors.IO import IOROOTProcessor
 logger = morphologging.getLogger(__name__)
@@ -26,7 +26,7 @@ class CalibrationProcessor(BaseProcessor):
     Performs a Bayesian sensitivity calibration for a continuous parameter - i.e., computes the coverage of a credible interval. Uses either an upper limit or upper and lower bounds on a posterior, depending on user input. Prints the coverage as well as (optionally) the median and mean credible windows.
     
     Required input:
-        files: List of strings naming ROOT files produced by an ensemble of morpho runs.
+        files: List of strings naming ROOT files produced by an ensemble of morpho runs, or path of the manifest written by the morpho ensemble mode.
         in_param_names: List of strings naming parameters of interest inputted to the generator.
         
     Optional input:
@@ -40,9 +40,18 @@ class CalibrationProcessor(BaseProcessor):
     Results:
         coverages: dictionary containing coverage of interval given by self.cred_interval, for each parameter in self.in_param_names
     '''
+    def InputFiles(self):
+        '''
+        Files read by the processor (their state is part of its cache key)
+        '''
+        return list(self.files)
+
     def InternalConfigure(self,params):
         #Required input
         self.files = reader.read_param(params,'files','required')
+        if isinstance(self.files, str):
+            logger.debug("Reading files from manifest {}".format(self.files))
+            self.files = ensemble.read_manifest(self.files)
         self.in_param_names = reader.read_param(params,'in_param_names','required')
         
         #Optional input
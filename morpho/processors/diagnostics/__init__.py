@@ -1,7 +1,14 @@
 '''
+The members of this package are imported on first access
 '''
 
 from __future__ import absolute_import
 
-from .CalibrationProcessor import CalibrationProcessor
-from .StanDiagnostics import StanDiagnostics
+from morpho.utilities.lazy import make_lazy
+
+_lazy_members = {
+    "CalibrationProcessor": ".CalibrationProcessor:CalibrationProcessor",
+    "StanDiagnostics": ".StanDiagnostics:StanDiagnostics"
+}
+
+make_lazy(__name__)
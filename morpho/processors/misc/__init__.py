@@ -1,7 +1,13 @@
 '''
+The members of this package are imported on first access
 '''
 
 from __future__ import absolute_import
 
-from .ProcessorAssistant import ProcessorAssistant
+from morpho.utilities.lazy import make_lazy
 
+_lazy_members = {
+    "ProcessorAssistant": ".ProcessorAssistant:ProcessorAssistant"
+}
+
+make_lazy(__name__)
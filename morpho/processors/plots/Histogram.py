@@ -7,7 +7,7 @@ Date: 06/26/18
 from __future__ import absolute_import
 
 from morpho.utilities import morphologging, reader
-from morpho.processors import BaseProcessor
+from morpho.processors import StreamingProcessor
 from .RootCanvas import RootCanvas
 from .RootHistogram import RootHistogram
 logger = morphologging.getLogger(__name__)
@@ -16,7 +16,7 @@ __all__ = []
 __all__.append(__name__)
 
 
-class Histogram(BaseProcessor):
+class Histogram(StreamingProcessor):
     '''
     Processor that generates a canvas and a histogram and saves it.
     TODO:
@@ -41,6 +41,10 @@ class Histogram(BaseProcessor):
 
     Results:
         None
+
+    Streaming:
+        As a consumer, fills the histogram(s) chunk by chunk; a range
+        should then be given (otherwise it is defined by the first chunk).
     '''
 
     def InternalConfigure(self, params):
@@ -70,10 +74,29 @@ class Histogram(BaseProcessor):
         return True
 
     def InternalRun(self):
+        self._Fill(self.data)
+        self._DrawAndSave()
+        return True
+
+    def InternalRunChunk(self, chunk):
+        self._Fill(chunk)
+        return None
+
+    def InternalStopStream(self):
+        self._DrawAndSave()
+        return True
+
+    def _Fill(self, data):
+        if self.multipleHistos:
+            for var, histo in zip(self.namedata, self.histos):
+                histo.Fill(reader.get_variable(data, var))
+        else:
+            self.histo.Fill(reader.get_variable(data, self.namedata))
+
+    def _DrawAndSave(self):
         self.rootcanvas.cd()
         if self.multipleHistos:
-            for i, (var, histo) in enumerate(zip(self.namedata, self.histos)):
-                histo.Fill(self.data.get(var))
+            for i, histo in enumerate(self.histos):
                 if i ==0:
                     histo.Draw("hist")
                     histo.SetLineColor(i, len(self.histos))
@@ -81,7 +104,5 @@ class Histogram(BaseProcessor):
                     histo.Draw("sameHist")
                     histo.SetLineColor(i, len(self.histos))
         else:
-            self.histo.Fill(self.data.get(self.namedata))
             self.histo.Draw("hist")
         self.rootcanvas.Save()
-        return True
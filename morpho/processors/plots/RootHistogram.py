@@ -4,6 +4,8 @@ Authors: M. Guigue
 Date: 06/26/18
 '''
 
+import numpy
+
 from morpho.utilities import morphologging, reader
 logger = morphologging.getLogger(__name__)
 
@@ -46,6 +48,9 @@ class RootHistogram(object):
         return self.histo.GetNbinsX()
 
     def Fill(self, input_data):
+        if isinstance(input_data, numpy.ndarray):
+            # (n, *shape) arrays: all the elements are used
+            input_data = input_data.ravel().tolist()
         if not isinstance(input_data, list):
             logger.error("Data given <{}> not a list".format(input_data))
             raise
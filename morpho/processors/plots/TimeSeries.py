@@ -75,13 +75,13 @@ class TimeSeries(BaseProcessor):
             pass
         # Histograms must still be in memory when the pdf is saved
         for iName, name in enumerate(self.namedata):
-            if len(self.data[name])==0:
+            subdata = reader.get_variable(self.data, str(name))
+            if len(subdata)==0:
                 logger.warning("No data for variable {}".format(name))
                 continue
             self.rootcanvas.cd(iName+1)
             listGraph.append(ROOT.TGraph())
             listGraphWarmup.append(ROOT.TGraph())
-            subdata = self.data[str(name)]
             is_sample = self.data["is_sample"]
             iWarmup = 0
             iSample = 0
@@ -1,13 +1,18 @@
 '''
+The members of this package are imported on first access
 '''
 
 from __future__ import absolute_import
 
-from .APosterioriDistribution import APosterioriDistribution
-from .Histo2dDivergence import Histo2dDivergence
-from .TimeSeries import TimeSeries
-from .Histogram import Histogram
+from morpho.utilities.lazy import make_lazy
 
-# Objects
-from .RootCanvas import RootCanvas
-from .RootHistogram import RootHistogram
+_lazy_members = {
+    "APosterioriDistribution": ".APosterioriDistribution:APosterioriDistribution",
+    "Histo2dDivergence": ".Histo2dDivergence:Histo2dDivergence",
+    "TimeSeries": ".TimeSeries:TimeSeries",
+    "Histogram": ".Histogram:Histogram",
+    "RootCanvas": ".RootCanvas:RootCanvas",
+    "RootHistogram": ".RootHistogram:RootHistogram"
+}
+
+make_lazy(__name__)
@@ -0,0 +1,102 @@
+'''
+Registry of the processors: maps processor type names to "module:class" paths
+Authors: agent
+Date: 10/18/26
+'''
+
+from __future__ import absolute_import
+
+import importlib
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+__all__ = []
+__all__.append(__name__)
+
+# Name of the entry points group used by other packages to register their processors:
+#   entry_points={"morpho.processors": ["MyProcessor = mypackage.mymodule:MyProcessor"]}
+entry_point_group = "morpho.processors"
+
+_processors = {
+    "CalibrationProcessor": "morpho.processors.diagnostics.CalibrationProcessor:CalibrationProcessor",
+    "StanDiagnostics": "morpho.processors.diagnostics.StanDiagnostics:StanDiagnostics",
+    "IOCVSProcessor": "morpho.processors.IO.IOCVSProcessor:IOCVSProcessor",
+    "IOJSONProcessor": "morpho.processors.IO.IOJSONProcessor:IOJSONProcessor",
+    "IOYAMLProcessor": "morpho.processors.IO.IOJSONProcessor:IOYAMLProcessor",
+    "IONPZProcessor": "morpho.processors.IO.IONPZProcessor:IONPZProcessor",
+    "IORProcessor": "morpho.processors.IO.IORProcessor:IORProcessor",
+    "IOROOTProcessor": "morpho.processors.IO.IOROOTProcessor:IOROOTProcessor",
+    "ProcessorAssistant": "morpho.processors.misc.ProcessorAssistant:ProcessorAssistant",
+    "APosterioriDistribution": "morpho.processors.plots.APosterioriDistribution:APosterioriDistribution",
+    "Histo2dDivergence": "morpho.processors.plots.Histo2dDivergence:Histo2dDivergence",
+    "TimeSeries": "morpho.processors.plots.TimeSeries:TimeSeries",
+    "Histogram": "morpho.processors.plots.Histogram:Histogram",
+    "GaussianSamplingProcessor": "morpho.processors.sampling.GaussianSamplingProcessor:GaussianSamplingProcessor",
+    "GaussianRooFitProcessor": "morpho.processors.sampling.GaussianRooFitProcessor:GaussianRooFitProcessor",
+    "PyStanSamplingProcessor": "morpho.processors.sampling.PyStanSamplingProcessor:PyStanSamplingProcessor",
+    "RooFitInterfaceProcessor": "morpho.processors.sampling.RooFitInterfaceProcessor:RooFitInterfaceProcessor",
+    "PyBindRooFitProcessor": "morpho.processors.sampling.PyBindRooFitProcessor:PyBindRooFitProcessor",
+    "LinearFitRooFitProcessor": "morpho.processors.sampling.LinearFitRooFitProcessor:LinearFitRooFitProcessor",
+    "PriorSamplingProcessor": "morpho.processors.sampling.PriorSamplingProcessor:PriorSamplingProcessor"
+}
+_entry_points_loaded = False
+
+
+def register(name, path):
+    '''
+    Register a processor type name and its "module:class" path
+    '''
+    if ":" not in path:
+        logger.error("Invalid processor path <{}>: should be module:class".format(path))
+        return False
+    if name in _processors and _processors[name] != path:
+        logger.warning("Processor <{}> ({}) replaced by {}".format(name, _processors[name], path))
+    _processors[name] = path
+    return True
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        import pkg_resources
+    except ImportError:
+        return
+    for entry_point in pkg_resources.iter_entry_points(entry_point_group):
+        logger.debug("Processor <{}> registered by {}".format(entry_point.name, entry_point.dist))
+        register(entry_point.name, "{}:{}".format(
+            entry_point.module_name, ".".join(entry_point.attrs)))
+
+
+def get_path(name):
+    '''
+    Returns the "module:class" path of a processor type name (or None)
+    '''
+    if name not in _processors:
+        _load_entry_points()
+    return _processors.get(name, None)
+
+
+def names():
+    '''
+    Returns the registered processor type names
+    '''
+    _load_entry_points()
+    return sorted(_processors.keys())
+
+
+def load(name):
+    '''
+    Import and return the processor class registered under name
+    '''
+    path = get_path(name)
+    if path is None:
+        raise ImportError("Unknown processor <{}>".format(name))
+    module_name, class_name = path.split(":")
+    an_object = importlib.import_module(module_name)
+    for attribute in class_name.split("."):
+        an_object = getattr(an_object, attribute)
+    return an_object
@@ -26,6 +26,7 @@ class PriorSamplingProcessor(BaseProcessor):
             'prior_dist' - str; name of prior distribution to sample from (e.g. 'gamma')
             'prior_params' - list of values parameterizing prior, following numpy conventions (e.g. [1, 2] for beta prior with k=1 and theta=2)
         fixed_inputs: (optional) dictionary containing any inputs to the next processor/data generator which will *not* be sampled from priors
+        seed: (optional) random seed of the sampling
 
     Results:
         sampled_inputs: dictionary containing values sampled from priors as designated in the priors dict, as well as the keys/values in the fixed_inputs dict
@@ -34,7 +35,8 @@ class PriorSamplingProcessor(BaseProcessor):
         self.priors = reader.read_param(params,'priors',{})
         self.fixed_inputs = reader.read_param(params,'fixed_inputs',{})
         self.verbose = reader.read_param(params,'verbose',True)
-        np.random.seed()
+        self.seed = reader.read_param(params,'seed',None)
+        np.random.seed(self.seed)
         return True
     
     def _sample_inputs(self):
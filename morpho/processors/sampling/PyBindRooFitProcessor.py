@@ -9,12 +9,12 @@ Date: 06/26/18
 
 import ROOT
 
+logger = morphologging.getLogger(__name__)
+
 value = ROOT.gSystem.Load("libRooFit")
 if value < 0:
-    print("Failed loading", value)
-    exit()
-
-logger = morphologging.getLogger(__name__)
+    logger.error("Failed loading libRooFit ({})".format(value))
+    raise ImportError("libRooFit")
 
 
 class PyFunctionObject(ROOT.Math.IMultiGenFunction):
@@ -69,6 +69,12 @@ class PyBindRooFitProcessor(RooFitInterfaceProcessor):
     Results:
         results: dictionary containing the result of the sampling of the parameters of interest
     '''
+    def InputFiles(self):
+        '''
+        Files read by the processor (their state is part of its cache key)
+        '''
+        return [self.module_name+'.py']
+
     def InternalConfigure(self, config_dict):
         super().InternalConfigure(config_dict)
         self.ranges = reader.read_param(config_dict, "paramRange", "required")
@@ -6,12 +6,18 @@ Date: 06/26/18
 
 from __future__ import absolute_import
 
+import atexit
+import json
+import logging
+import multiprocessing
 import os
 import random
 import re
+import threading
+from collections import OrderedDict
+from concurrent import futures
 from hashlib import md5
 from inspect import getargspec
-from datetime import datetime
 import numpy
 
 try:
@@ -19,15 +25,25 @@ try:
 except ImportError:
     pass
 
-from morpho.utilities import morphologging, reader, pystanLoader, stanConvergenceChecker
+from morpho.utilities import morphologging, reader, pystanLoader, stanConvergenceChecker, modelcache, adaptation, convergence, cpubudget, background
+from morpho.utilities.results import Results, post_warmup, concatenate_draws, stack
 from morpho.processors import BaseProcessor
-from morpho.processors.plots import Histo2dDivergence
 logger = morphologging.getLogger(__name__)
 logger_stan = morphologging.getLogger('pystan')
 
 __all__ = []
 __all__.append(__name__)
 
+# Compilations started in the background by Configure: cache key -> future
+_compilations = dict()
+_compile_executor = None
+_compile_lock = threading.RLock()
+# Processor running a batch: inherited (with its model) by the forked workers
+_batch_processor = None
+# Adaptive warmup iterations (the three Stan adaptation windows) of warm starts without
+# the inverse metric (pystan < 2.19 cannot set it): the metric is adapted again
+_UNIT_METRIC_WARMUP = 150
+
 
 class PyStanSamplingProcessor(BaseProcessor):
     '''
@@ -38,26 +54,73 @@ class PyStanSamplingProcessor(BaseProcessor):
         function_files_location: location of the Stan functions
         model_name: name of the cached model
         cache_dir: location of the cache folder (containing cached models)
+        cache_max_size: size (in MB) above which the least recently used models are removed from the cache (default=2000)
         input_data: dictionary containing model input data
+        method: sampling (NUTS, default), optimizing (MAP), laplace (MAP and Gaussian approximation
+            of the posterior in the unconstrained space, from the Hessian at the mode) or vb (ADVI)
+        approx_draws: number of draws of the laplace and vb methods (default=1000)
+        method_args: additional arguments of the pystan optimizing or vb method (e.g. {"iter": 20000})
         iter (required): total number of iterations (warmup and sampling)
         warmup: number of warmup iterations (default=iter/2)
         warmup_inc: include warmup part of the chains (default=True); if false (no warmup), no divergence plot is made
         chain: number of chains (default=1)
-        n_jobs: number of parallel cores running (default=1)
+        n_jobs: number of parallel cores running (default=-1: one per chain); the cores are taken from
+            the CPU budget of the process (morpho --cpus), waiting for them if they are used by other samplers
         interestParams: parameters to be saved in the results variable
+        array_params: vector/matrix parameters (list, or True for all the interestParams) saved as one
+            (n_draws, *shape) array under their name instead of one variable per element (default=False)
+        low_memory: only keep the interestParams in the pystan fit (given as pars), which is released
+            once the results are extracted (default=False); with save_adaptation or segment_draws,
+            all the parameters are kept (the last draws initialize the next chains)
+        thin: keep one draw in thin (default=1)
+        results_dtype: type of the floating-point arrays of the results (e.g. float32; default: float64)
         no_cache: don't create cache
         force_recreate: force the cache regeneration
+        background_compile: compile (or load) the model in a background process during Configure,
+            while the processors run before this one (default=False)
+        algorithm: sampling algorithm (NUTS by default); with Fixed_param (models generating data in the
+            generated quantities), there is no warmup and no diagnostics
+        n_datasets: with Fixed_param, number of independent datasets of iter draws generated in one call
+            (with iter=1, a dataset is one draw, e.g. of vectors of N values)
         init: initial values for the parameters
         control: PyStan sampling settings
+        save_adaptation: file where the step size, inverse metric and last draws of the chains are saved
+        load_adaptation: file (made with save_adaptation) used to initialize the chains and their adaptation;
+            with pystan < 2.19, only the step size and the initial values are reused (the inverse metric
+            cannot be set): the metric is adapted again, from a unit metric, during the warmup
+        adapted_warmup: number of warmup iterations when load_adaptation is used (default=0: no adaptation,
+            except with pystan < 2.19, where 0 means 150 adaptive iterations for the metric);
+            the number of iterations after the warmup is unchanged
+        datasets: list of datasets (dictionaries or files), or directory of R/JSON/YAML dumps, fitted
+            one after the other with the same model (batch mode); each dataset updates the data
+        batch_jobs: number of processes fitting the datasets (default: number of CPUs)
+        segment_draws: number of draws per chain of each segment (adaptive run length): the chains are
+            continued segment after segment until the targets are met for the interestParams (default=None: off);
+            with pystan < 2.19, each segment after the first starts with 150 adaptive warmup iterations
+            (the inverse metric cannot be passed), whose draws are dropped
+        target_rhat: largest rank-normalized split R-hat of the adaptive run length (default=1.01)
+        target_ess: smallest bulk and tail effective sample sizes of the adaptive run length (default=400)
+        max_draws: number of draws per chain after which the adaptive run length stops (default=10*segment_draws)
+        seed: random seed of the sampling (default: random)
         no_diagnostics: Prevent diagnostics plots from being generated (default=False)
         diagnostics_folder: Path to folder to store diagnostics (default=".")
+        background_diagnostics: write the diagnostics files and plots in a background process while
+            the next processors run (default=False); the toolbox waits for them at the end of the chain
 
     Input:
-        data: dictionary containing model input data
+        data: dictionary containing model input data (or list of datasets: batch mode)
 
     Results:
-        results: dictionary containing the result of the sampling of the parameters of interest
-        results_c: dictionary containing the result of the sampling of the parameters of interest (without the warmup chain)
+        results: Results (dictionary of numpy arrays) containing the result of the sampling of the
+            parameters of interest: the warmup draws of the chains, then the other draws of the chains;
+            in batch mode, the arrays (except the index columns) have an additional first axis (dataset);
+            with the optimizing method, a single draw (the mode)
+        results_c: results without the warmup part of the chains (shares the arrays of results)
+        diagnostics: convergence checks and their values (also saved in diagnostics.json);
+            in batch mode, the convergence checks of each dataset
+        convergence: with segment_draws, the R-hat and ESS of the interestParams after the last segment
+        generated_datasets: with n_datasets, list of the datasets (dictionaries of the interestParams),
+            which can be given to the data of a processor fitting them (batch mode)
     '''
     @property
     def data(self):
@@ -65,27 +128,26 @@ class PyStanSamplingProcessor(BaseProcessor):
 
     @property
     def results_c(self):
-        n_warmup = -1
-        for i_sample, value in self.results["is_sample"].items():
-            if value == 0:
-                n_warmup = i_sample
-
-        results_c = dict()
-        for a_key, a_value in self.results.items():
-            result_c.update({a_key: a_value[n_warmup+1:]})
-        return result_c
+        # Selected once for the current results (a slice of their arrays)
+        if self._results_c is None or self._results_c[0] is not self.results:
+            self._results_c = (self.results, post_warmup(self.results))
+        return self._results_c[1]
 
     @data.setter
     def data(self, input_dict):
         if isinstance(input_dict, dict):
             for a_key, a_value in input_dict.items():
                 reader.add_dict_param(self.data, a_key, a_value)
+        elif isinstance(input_dict, list):
+            # Several datasets: batch mode
+            self.datasets = input_dict
         else:
             logger.warning("Not a dict: {}".format(input_dict))
 
     def __init__(self, name):
         super().__init__(name)
         self._data = {}
+        self._results_c = None
 
     def gen_arg_dict(self):
         '''
@@ -134,9 +196,9 @@ class PyStanSamplingProcessor(BaseProcessor):
                 additional_dict.update({list_size_name: int(value.size)})
         self.data.update(additional_dict)
 
-    def _stan_cache(self):
+    def _read_model_code(self):
         '''
-        Create and cache stan model, or access previously cached model
+        Read the Stan model and include the function files
         '''
         theModel = open(self.model_code, 'r+').read()
         match = re.findall(
@@ -173,40 +235,98 @@ class PyStanSamplingProcessor(BaseProcessor):
                 logger.critical(
                     'A function <{}> to import is missing'.format(matches))
         logger.debug('Import function files: complete')
+        return theModel
+
+    def _function_files(self):
+        '''
+        Function files included by the Stan model
+        '''
+        if self.function_files_location is None:
+            return []
+        included = set(re.findall(r'\s*include\s*=\s*(?P<function_name>\w+)\s*;*', open(self.model_code, 'r').read()))
+        files = []
+        for filename in sorted(os.listdir(self.function_files_location)):
+            key, ext = os.path.splitext(filename)
+            if ext in [".functions", ".stan"] and key in included:
+                files.append(os.path.join(self.function_files_location, filename))
+        return files
 
+    def InputFiles(self):
+        '''
+        Files read by the processor (their state is part of its cache key):
+        the model, its function files, the adaptation and the dataset files
+        '''
+        files = [self.model_code]
+        if os.path.exists(self.model_code):
+            files.extend(self._function_files())
+        if self.load_adaptation is not None:
+            files.append(self.load_adaptation)
+        datasets = self.datasets
+        if isinstance(datasets, str) and os.path.isdir(datasets):
+            datasets = [os.path.join(datasets, filename) for filename in sorted(os.listdir(datasets))]
+        if isinstance(datasets, list):
+            files.extend(dataset for dataset in datasets if isinstance(dataset, str))
+        return files
+
+    def _cache_key(self, theModel):
         code_hash = md5(theModel.encode('ascii')).hexdigest()
         if self.model_name is None:
-            cache_fn = '{}/cached-model-{}.pkl'.format(
-                self.cache_dir, code_hash)
-        else:
-            cache_fn = '{}/cached-{}-{}.pkl'.format(
-                self.cache_dir, self.model_name, code_hash)
-        # Cache creation and saving?
-        if self.force_recreate:
-            logger.debug("Forced to recreate Stan cache!")
-            self._create_and_save_model(theModel, cache_fn)
-        else:
-            import pickle
+            return 'cached-model-{}'.format(code_hash)
+        return 'cached-{}-{}'.format(self.model_name, code_hash)
+
+    def _stan_cache(self):
+        '''
+        Create and cache stan model, or access previously cached model
+        '''
+        theModel = self._read_model_code()
+        if self.no_cache:
+            self.stanModel = pystan.StanModel(model_code=theModel)
+            return
+        cache_key = self._cache_key(theModel)
+        force = self.force_recreate
+        compilation = _compilations.pop(cache_key, None)
+        if compilation is not None:
+            logger.info("Waiting for the compilation of the model")
             try:
-                logger.debug("Trying to load cached StanModel")
-                self.stanModel = pickle.load(open(cache_fn, 'rb'))
-            except:
-                logger.debug("None exists -> creating Stan cache")
-                self._create_and_save_model(theModel, cache_fn)
-            else:
-                logger.debug("Using cached StanModel: {}".format(cache_fn))
-
-    def _create_and_save_model(self, theModel, cache_fn):
-        self.stanModel = pystan.StanModel(model_code=theModel)
-        if not self.no_cache:
-            cdir = os.path.dirname(cache_fn)
-            if not os.path.exists(cdir):
-                os.makedirs(cdir)
-                logger.info("Creating 'cache' folder: {}".format(cdir))
-            logger.debug("Saving Stan cache in {}".format(cache_fn))
-            import pickle
-            with open(cache_fn, 'wb') as f:
-                pickle.dump(self.stanModel, f)
+                compilation.result()
+                force = False
+            except Exception as err:
+                logger.error("Background compilation failed:\n{}".format(err))
+            with _compile_lock:
+                if len(_compilations) == 0:
+                    _shutdown_compilations()
+        if force:
+            logger.debug("Forced to recreate Stan cache!")
+        self.stanModel = _get_model(self.cache_dir, self.cache_max_size,
+                                    cache_key, theModel, force)
+        logger.debug("Using cached StanModel: {}".format(cache_key))
+
+    def _start_compilation(self):
+        '''
+        Compile (or load) the model into the cache in a background process
+        '''
+        global _compile_executor
+        theModel = self._read_model_code()
+        cache_key = self._cache_key(theModel)
+        with _compile_lock:
+            if cache_key in _compilations:
+                return
+            if _compile_executor is None:
+                # At most one compilation per core of the CPU budget
+                _compile_executor = futures.ProcessPoolExecutor(max_workers=cpubudget.get_budget().n_cpus)
+            logger.debug("Starting the compilation of {} in the background".format(cache_key))
+            _compilations[cache_key] = _compile_executor.submit(
+                _compile_model, self.cache_dir, self.cache_max_size, cache_key, theModel, self.force_recreate)
+
+    def Precompile(self):
+        '''
+        Compile the model into the cache (morpho --precompile)
+        '''
+        if self.no_cache:
+            logger.warning("<{}>: no_cache is set; model not compiled".format(self.name))
+            return True
+        self._stan_cache()
+        return True
 
     def _run_stan(self, *args, **kwargs):
         logger.info("Starting the sampling")
@@ -217,35 +337,260 @@ class PyStanSamplingProcessor(BaseProcessor):
             elif key == "data" or key == "init":
                 text = text + "{}\t[...]\n".format(key)
         logger.info(text)
-        # returns the arguments for sampling and the result of the sampling
-        return self.stanModel.sampling(**(kwargs))
+        # Cores (one per chain at most) taken from the CPU budget
+        n_jobs = kwargs.get("n_jobs", -1)
+        n_cpus = kwargs.get("chains", 1) if n_jobs < 0 else min(n_jobs, kwargs.get("chains", 1))
+        with cpubudget.get_budget().Acquire(n_cpus, self.name) as n_jobs:
+            kwargs["n_jobs"] = n_jobs
+            # returns the arguments for sampling and the result of the sampling
+            return self.stanModel.sampling(**(kwargs))
         # return self.stanModel.sampling(**(self.gen_arg_dict()))
 
-    def _store_diagnostics(self, stan_results):
+    def _load_adaptation(self):
+        '''
+        Start the chains from the last draws and the adaptation of a previous fit
+        '''
+        previous = adaptation.load(self.load_adaptation)
+        logger.info("Using the adaptation of {} chains from {}".format(len(previous["stepsize"]), self.load_adaptation))
+        n_samples = self.iter - self.warmup
+        self._apply_adaptation(previous, self.adapted_warmup)
+        self.iter = n_samples + self.warmup
+
+    def _apply_adaptation(self, previous, warmup):
+        '''
+        Start the chains from the last draws, step size and inverse metric of an adaptation
+        '''
+        n_previous = len(previous["stepsize"])
+        self.init = [previous["last_draws"][iChain % n_previous] for iChain in range(self.chains)]
+        control = dict(getattr(self, "control", None) or {})
+        control["stepsize"] = float(numpy.mean(previous["stepsize"]))
+        if _pystan_version() >= (2, 19):
+            control["inv_metric"] = {iChain: numpy.asarray(previous["inv_metric"][iChain % n_previous])
+                                     for iChain in range(self.chains)}
+        else:
+            if warmup == 0:
+                # The step size was tuned for the saved metric, not for the unit one
+                warmup = _UNIT_METRIC_WARMUP
+            logger.warning("<{}>: pystan {} cannot set the inverse metric: only the step size and the initial "
+                           "values of the adaptation are reused, and the metric is adapted again "
+                           "(from a unit metric) in {} warmup iterations".format(
+                               self.name, pystan.__version__, warmup))
+        self.warmup = warmup
+        if self.warmup == 0:
+            control["adapt_engaged"] = False
+        self.control = control
+
+    def _run_batch(self):
+        '''
+        Fit the datasets in a pool of forked processes sharing the loaded model
+        '''
+        global _batch_processor
+        datasets = self.datasets
+        if isinstance(datasets, str):
+            datasets = [os.path.join(datasets, filename) for filename in sorted(os.listdir(datasets))
+                        if filename.lower().endswith((".r", ".json", ".yaml", ".yml"))]
+        if len(datasets) == 0:
+            logger.error("No dataset to fit")
+            return False
+        if self.save_adaptation is not None:
+            logger.warning("save_adaptation is not used in batch mode")
+        self._base_data = dict(self.data)
+        # The seed of a dataset only depends on its index (not on the worker running it)
+        self._base_seed = self.seed
+        _batch_processor = self
+        try:
+            with cpubudget.get_budget().Acquire(self.batch_jobs, self.name) as n_workers:
+                logger.info("Fitting {} datasets on {} processes".format(len(datasets), n_workers))
+                # Each worker runs one fit at a time, on one core
+                with futures.ProcessPoolExecutor(max_workers=n_workers,
+                                                 mp_context=multiprocessing.get_context("fork"),
+                                                 initializer=cpubudget.init_worker,
+                                                 initargs=(1,)) as executor:
+                    batch = list(executor.map(_sample_dataset, range(len(datasets)), datasets))
+        finally:
+            _batch_processor = None
+        self.results = stack([results for results, _ in batch])
+        self.diagnostics = [diagnostics for _, diagnostics in batch]
+        if not self.no_diagnostics:
+            if not os.path.exists(self.diagnostics_folder):
+                os.makedirs(self.diagnostics_folder)
+            with open(os.path.join(self.diagnostics_folder, "batch_diagnostics.json"), 'w') as diagnostics_file:
+                json.dump(self.diagnostics, diagnostics_file, indent=4)
+            n_warnings = sum(1 for diagnostics in self.diagnostics if diagnostics["warning"])
+            if n_warnings > 0:
+                logger.warning("{} of {} fits have convergence warnings (see {})".format(
+                    n_warnings, len(datasets), self.diagnostics_folder))
+        return True
+
+    def _method_args(self):
+        '''
+        Arguments of the pystan optimizing and vb methods
+        '''
+        kwargs = {"data": self.data}
+        if self.seed is not None:
+            kwargs["seed"] = self.seed
+        init = self.init[0] if isinstance(self.init, list) and len(self.init) > 0 else self.init
+        if isinstance(init, dict) or init in ("random", "0", 0):
+            kwargs["init"] = init
+        kwargs.update(self.method_args)
+        return kwargs
+
+    def _run_optimizing(self):
+        '''
+        Mode of the posterior (MAP): results with a single draw
+        '''
+        optimum = self.stanModel.optimizing(as_vector=False, **self._method_args())
+        mode = {name: numpy.asarray(value)[numpy.newaxis, ...] for name, value in optimum["par"].items()}
+        self.results = pystanLoader.extract_data_from_draws(
+            self.__dict__, pystanLoader.flatten_values(mode), [optimum["value"]])
+        return True
+
+    def _run_laplace(self):
+        '''
+        Draws from a Gaussian approximation of the posterior in the unconstrained space,
+        centered on the mode, with the inverse of the Hessian at the mode as covariance
+        '''
+        kwargs = self._method_args()
+        mode = self.stanModel.optimizing(**kwargs)
+        # Fit object (one iteration, no sampling) giving the log density and its gradient
+        fit = self.stanModel.sampling(data=self.data, algorithm="Fixed_param", iter=1, chains=1,
+                                      n_jobs=1, init=[dict(mode)], seed=kwargs.get("seed", 1))
+        upar = numpy.asarray(fit.unconstrain_pars(dict(mode)), dtype=float)
+        hessian = _hessian(lambda u: numpy.asarray(fit.grad_log_prob(u, adjust_transform=False)), upar)
+        try:
+            cholesky = numpy.linalg.cholesky(numpy.linalg.inv(-hessian))
+        except numpy.linalg.LinAlgError:
+            logger.error("The Hessian at the mode is not negative definite")
+            return False
+        rng = numpy.random.RandomState(self.seed)
+        udraws = upar + rng.normal(size=(self.approx_draws, len(upar))).dot(cholesky.T)
+        draws = numpy.array([_constrain_pars(fit, udraw) for udraw in udraws])
+        lp_prob = [fit.log_prob(udraw, adjust_transform=False) for udraw in udraws]
+        flatnames = list(fit.flatnames)[:draws.shape[1]]
+        self.results = pystanLoader.extract_data_from_draws(
+            self.__dict__, {name: draws[:, i] for i, name in enumerate(flatnames)}, lp_prob)
+        return True
+
+    def _run_vb(self):
+        '''
+        Draws from the variational approximation of the posterior (ADVI)
+        '''
+        vb_results = self.stanModel.vb(output_samples=self.approx_draws, **self._method_args())
+        draws = dict()
+        lp_prob = None
+        for name, values in zip(vb_results["sampler_param_names"], vb_results["sampler_params"]):
+            if name == "log_p__":
+                lp_prob = values
+            elif not name.endswith("__"):
+                draws[pystanLoader.zero_based_name(name)] = numpy.asarray(values, dtype=float)
+        self.results = pystanLoader.extract_data_from_draws(self.__dict__, draws, lp_prob)
+        return True
+
+    def _run_adaptive(self):
+        '''
+        Sample in segments until the R-hat and ESS targets are met (or max_draws is reached):
+        each segment continues the chains of the previous one, without warmup
+        (with pystan < 2.19, after a short re-adaptation whose draws are dropped)
+        '''
+        self.iter = self.warmup + self.segment_draws
+        stan_results = self._run_stan(**(self.gen_arg_dict()))
+        segments = [pystanLoader.extract_data_from_outputdata(self.__dict__, stan_results)]
+        n_draws = self.segment_draws
+        while True:
+            results = concatenate_draws(segments)
+            self.convergence = convergence.summary(results, self.interestParams, self.chains)
+            # Constant variables (NaN R-hat and ESS) are ignored
+            worst_rhat = numpy.nanmax([summary["rhat"] for summary in self.convergence.values()] + [1.])
+            worst_ess = numpy.nanmin([min(summary["ess_bulk"], summary["ess_tail"])
+                                      for summary in self.convergence.values()] + [numpy.inf])
+            logger.info("{} draws per chain: R-hat = {:.4f}, ESS = {:.0f}".format(n_draws, worst_rhat, worst_ess))
+            if worst_rhat <= self.target_rhat and worst_ess >= self.target_ess:
+                logger.info("Convergence targets reached")
+                break
+            if n_draws >= self.max_draws:
+                logger.warning("Convergence targets not reached after {} draws per chain".format(n_draws))
+                break
+            self._apply_adaptation(adaptation.from_fit(stan_results, self.chains), 0)
+            self.iter = self.warmup + self.segment_draws
+            if self.seed is not None:
+                self.seed = self.seed + 1
+            stan_results = self._run_stan(**(self.gen_arg_dict()))
+            # Draws of the re-adaptation (pystan < 2.19) dropped: the chains continue the previous segment
+            segments.append(pystanLoader.extract_data_from_outputdata(self.__dict__, stan_results).post_warmup())
+            n_draws += self.segment_draws
+        if "energy__" in results:
+            # Energy differences across the segment boundaries
+            results["delta_energy__"] = pystanLoader.delta_energy(
+                results.draws("energy__"), results.n_warmup_rows // self.chains)
+        self.results = results
+        if not self.no_diagnostics:
+            if not os.path.exists(self.diagnostics_folder):
+                os.makedirs(self.diagnostics_folder)
+            with open(os.path.join(self.diagnostics_folder, "convergence.json"), 'w') as convergence_file:
+                json.dump(self.convergence, convergence_file, indent=4)
+        return stan_results
+
+    def _sample_dataset(self, i_dataset, dataset):
+        '''
+        Fit one dataset of a batch (in a worker)
+        '''
+        if isinstance(dataset, str):
+            dataset = _read_dataset(dataset)
+        self._data = dict(self._base_data)
+        self._data.update(dataset)
+        self._get_data_lists_size()
+        # The datasets (not the chains) are run in parallel
+        self.n_jobs = 1
+        kwargs = self.gen_arg_dict()
+        if self._base_seed is not None:
+            kwargs["seed"] = self._base_seed + i_dataset
+        stan_results = self._run_stan(**kwargs)
+        results = pystanLoader.extract_data_from_outputdata(self.__dict__, stan_results)
+        diagnostics = {"dataset": i_dataset}
+        if not self.no_diagnostics:
+            convergence_diagnostics = self._diagnose(stan_results)
+            diagnostics.update(convergence_diagnostics.checks())
+            diagnostics["warning"] = convergence_diagnostics.warning
+        return results, diagnostics
+
+    def _split_datasets(self):
+        '''
+        Split the generated draws into n_datasets datasets (views of the results);
+        with one draw per dataset, a dataset contains the values of this draw
+        '''
+        names = [key for key in self.results if key not in Results.index_columns and
+                 key not in pystanLoader.diagnosticVariableName + ["lp_prob", "delta_energy__"]]
+        size = self.dataset_size
+        logger.info("{} datasets of {} draws generated".format(self.n_datasets, size))
+        if size == 1:
+            return [{name: self.results[name][i] for name in names} for i in range(self.n_datasets)]
+        return [{name: self.results[name][i*size:(i+1)*size] for name in names}
+                for i in range(self.n_datasets)]
+
+    def _diagnose(self, stan_results):
+        # All the checks in one pass over the draws
+        max_depth = (getattr(self, "control", None) or {}).get("max_treedepth", 10)
+        return stanConvergenceChecker.diagnose(stan_results, max_depth)
+
+    def _store_diagnostics(self, convergence_diagnostics):
+        self.diagnostics = convergence_diagnostics.to_dict()
         # Print diagnostics
-        convergence_diagnostics = stanConvergenceChecker.check_all_diagnostics(
-            stan_results)
-        if convergence_diagnostics[0]:
-            logger.warn("\n"+convergence_diagnostics[1])
+        if convergence_diagnostics.warning:
+            logger.warn("\n"+convergence_diagnostics.text())
+            logger.debug("\n"+convergence_diagnostics.details())
         else:
-            logger.info("\n"+convergence_diagnostics[1])
-        if not os.path.exists(self.diagnostics_folder):
-            os.makedirs(self.diagnostics_folder)
-        f = open(self.diagnostics_folder+"/divergence_checks.txt", 'w')
-        f.write(convergence_diagnostics[1])
-        f.close()
-
-        # Plot 2D grid of divergence plots
-        divConfig = {"n_bins_x": 100,
-                     "n_bins_y": 100,
-                     "variables": self.interestParams + ["lp_prob"],
-                     "title": "divergence_2d_histo",
-                     "output_path": self.diagnostics_folder}
-        divProcessor = Histo2dDivergence("2dDivergence")
-        divProcessor.Configure(divConfig)
-        divProcessor.data = self.results
-        divProcessor.Run()
-        return
+            logger.info("\n"+convergence_diagnostics.text())
+
+    def _write_diagnostics(self, convergence_diagnostics, in_background=False):
+        variables = [name for name in self.interestParams
+                     if numpy.ndim(self.results.get(name, [])) <= 1] + ["lp_prob"]
+        args = (self.diagnostics_folder, convergence_diagnostics.text(), self.diagnostics,
+                self.results.columns(variables + ["divergent__"]), variables)
+        if in_background:
+            # Only the diagnostics and the plotted columns are sent to the background process
+            background.submit("{} diagnostics".format(self.name), _write_diagnostics, *args)
+        else:
+            _write_diagnostics(*args)
 
     def InternalConfigure(self, params):
         self.params = params
@@ -254,6 +599,7 @@ class PyStanSamplingProcessor(BaseProcessor):
             params, 'function_files_location', None)
         self.model_name = reader.read_param(params, 'model_name', "anon_model")
         self.cache_dir = reader.read_param(params, 'cache_dir', '.')
+        self.cache_max_size = reader.read_param(params, 'cache_max_size', 2000)
         self.data = reader.read_param(params, 'input_data', {})
         self.iter = reader.read_param(params, 'iter', 'required')
         self.warmup = int(reader.read_param(params, 'warmup', self.iter/2))
@@ -270,17 +616,67 @@ class PyStanSamplingProcessor(BaseProcessor):
         # number of jobs to run (-1: all, 1: good for debugging)
         self.n_jobs = int(reader.read_param(params, 'n_jobs', -1))
         self.interestParams = reader.read_param(params, 'interestParams', [])
+        self.array_params = reader.read_param(params, 'array_params', False)
+        self.low_memory = reader.read_param(params, 'low_memory', False)
+        self.thin = int(reader.read_param(params, 'thin', 1))
+        self.results_dtype = reader.read_param(params, 'results_dtype', None)
         self.no_cache = reader.read_param(params, 'no_cache', False)
         self.force_recreate = reader.read_param(
             params, 'force_recreate', False)
-        self.seed = random.seed(datetime.now())
-        # logger.debug("Autoseed activated")
+        self.background_compile = reader.read_param(
+            params, 'background_compile', False)
+        self.background_diagnostics = reader.read_param(
+            params, 'background_diagnostics', False)
+        self.seed = reader.read_param(params, 'seed', None)
+        if self.seed is None:
+            random.seed()
+            logger.debug("Autoseed activated")
+        else:
+            self.seed = int(self.seed)
         logger.debug("seed = {}".format(self.seed))
 
         # self.thin = reader.read_param(params, 'thin', 1)
         self.init_per_chain = reader.read_param(params, 'init', '')
 
         self.init = self._init_Stan_function()
+        self.save_adaptation = reader.read_param(params, 'save_adaptation', None)
+        self.load_adaptation = reader.read_param(params, 'load_adaptation', None)
+        self.adapted_warmup = int(reader.read_param(params, 'adapted_warmup', 0))
+        self.datasets = reader.read_param(params, 'datasets', None)
+        self.batch_jobs = int(reader.read_param(params, 'batch_jobs', os.cpu_count() or 1))
+        self.algorithm = reader.read_param(params, 'algorithm', None)
+        self.n_datasets = reader.read_param(params, 'n_datasets', None)
+        if self.algorithm == "Fixed_param":
+            # Generation: the draws are independent and there is nothing to adapt or diagnose
+            self.warmup = 0
+            self.no_diagnostics = True
+        if self.n_datasets is not None:
+            if self.algorithm != "Fixed_param":
+                logger.error("n_datasets requires the Fixed_param algorithm")
+                return False
+            self.n_datasets = int(self.n_datasets)
+            self.dataset_size = int(self.iter)
+            self.iter = -(-self.n_datasets * self.dataset_size // self.chains)
+        self.method = reader.read_param(params, 'method', "sampling")
+        if self.method not in ["sampling", "optimizing", "laplace", "vb"]:
+            logger.error("Unknown method: {}".format(self.method))
+            return False
+        self.approx_draws = int(reader.read_param(params, 'approx_draws', 1000))
+        self.method_args = reader.read_param(params, 'method_args', {})
+        self.segment_draws = reader.read_param(params, 'segment_draws', None)
+        if self.segment_draws is not None:
+            self.segment_draws = int(self.segment_draws)
+            self.target_rhat = float(reader.read_param(params, 'target_rhat', 1.01))
+            self.target_ess = float(reader.read_param(params, 'target_ess', 400))
+            self.max_draws = int(reader.read_param(params, 'max_draws', 10*self.segment_draws))
+        # Parameters kept by pystan (default: all)
+        self.pars = None
+        if self.low_memory:
+            if self.save_adaptation is not None or self.segment_draws is not None:
+                # The last draws initializing the next chains need all the parameters
+                logger.warning("low_memory with save_adaptation or segment_draws: all the parameters are kept")
+            else:
+                self.pars = list(OrderedDict.fromkeys(name.split('[')[0] for name in self.interestParams))
         if isinstance(reader.read_param(params, 'control', None), dict):
             self.control = reader.read_param(params, 'control', None)
         else:
@@ -288,19 +684,145 @@ class PyStanSamplingProcessor(BaseProcessor):
                 logger.debug("stan.run.control should be a dict: {}", str(
                     reader.read_param(yd, 'control', None)))
 
+        if self.background_compile and not self.no_cache:
+            self._start_compilation()
         return True
 
     def InternalRun(self):
         self._get_data_lists_size()
         self._stan_cache()
-        stan_results = self._run_stan(**(self.gen_arg_dict()))
-        logger.debug("Stan Results:\n"+str(stan_results))
-        # Put the data into a nice dictionary
-        self.results = pystanLoader.extract_data_from_outputdata(
-            self.__dict__, stan_results)
-        # Store convergence checks
-        if not self.no_diagnostics:
-            self._store_diagnostics(stan_results)
+        if self.method != "sampling":
+            logger.info("Running {}".format(self.method))
+            runners = {"optimizing": self._run_optimizing, "laplace": self._run_laplace, "vb": self._run_vb}
+            with cpubudget.get_budget().Acquire(1, self.name):
+                if not runners[self.method]():
+                    return False
+            logger.info("No diagnostics for the {} method".format(self.method))
+            return True
+        if self.load_adaptation is not None:
+            self._load_adaptation()
+        if self.datasets is not None:
+            return self._run_batch()
+        if self.segment_draws is not None:
+            stan_results = self._run_adaptive()
         else:
+            stan_results = self._run_stan(**(self.gen_arg_dict()))
+        if logger.isEnabledFor(logging.DEBUG):
+            # The summary of the fit is only computed when logged
+            logger.debug("Stan Results:\n"+str(stan_results))
+        if self.save_adaptation is not None:
+            adaptation.save(adaptation.from_fit(stan_results, self.chains), self.save_adaptation)
+        convergence_diagnostics = None
+        if not self.no_diagnostics:
+            # All the checks in one pass, before the results are extracted
+            convergence_diagnostics = self._diagnose(stan_results)
+        if self.segment_draws is None:
+            # Put the data into a nice dictionary
+            self.results = pystanLoader.extract_data_from_outputdata(
+                self.__dict__, stan_results)
+        # The fit (with all its draws) is not needed anymore
+        del stan_results
+        if self.n_datasets is not None:
+            self.generated_datasets = self._split_datasets()
+        if self.no_diagnostics:
             logger.info("No diagnostics plots produced")
+            return True
+        # Store convergence checks
+        self._store_diagnostics(convergence_diagnostics)
+        # With background_diagnostics, files and plots made in a background process
+        # (on a snapshot of the results) while the chain carries on
+        self._write_diagnostics(convergence_diagnostics, self.background_diagnostics)
         return True
+
+
+def _get_model(cache_dir, cache_max_size, cache_key, theModel, force=False):
+    '''
+    Returns the compiled model from the cache (compiled if needed)
+    '''
+    model_cache = modelcache.ModelCache(cache_dir, cache_max_size, {
+        "pystan": pystan.__version__,
+        "compiler": modelcache.compiler_version()
+    })
+    return model_cache.Get(cache_key, lambda: pystan.StanModel(model_code=theModel), force=force)
+
+
+def _write_diagnostics(diagnostics_folder, text, diagnostics, results, variables):
+    '''
+    Write the convergence checks and the 2D grid of divergence plots (possibly in a background process)
+    '''
+    if not os.path.exists(diagnostics_folder):
+        os.makedirs(diagnostics_folder)
+    with open(os.path.join(diagnostics_folder, "divergence_checks.txt"), 'w') as checks_file:
+        checks_file.write(text)
+    with open(os.path.join(diagnostics_folder, "diagnostics.json"), 'w') as diagnostics_file:
+        json.dump(diagnostics, diagnostics_file, indent=4)
+
+    # Plot 2D grid of divergence plots
+    divConfig = {"n_bins_x": 100,
+                 "n_bins_y": 100,
+                 "variables": variables,
+                 "title": "divergence_2d_histo",
+                 "output_path": diagnostics_folder}
+    from morpho.processors.plots import Histo2dDivergence
+    divProcessor = Histo2dDivergence("2dDivergence")
+    divProcessor.Configure(divConfig)
+    divProcessor.data = results
+    divProcessor.Run()
+
+
+def _compile_model(cache_dir, cache_max_size, cache_key, theModel, force=False):
+    # Run in a background process: the model is only sent back through the cache
+    _get_model(cache_dir, cache_max_size, cache_key, theModel, force)
+    return True
+
+
+@atexit.register
+def _shutdown_compilations():
+    '''
+    Stop the processes compiling the models in the background (once all the compilations are done)
+    '''
+    global _compile_executor
+    with _compile_lock:
+        if _compile_executor is not None:
+            _compile_executor.shutdown()
+            _compile_executor = None
+
+
+def _pystan_version():
+    return tuple(int(number) for number in pystan.__version__.split(".")[:2])
+
+
+def _hessian(grad, x, step=1e-5):
+    # Central differences of the gradient
+    hessian = numpy.empty((len(x), len(x)))
+    for i in range(len(x)):
+        delta = numpy.zeros(len(x))
+        delta[i] = step * max(1., abs(x[i]))
+        hessian[:, i] = (grad(x + delta) - grad(x - delta)) / (2 * delta[i])
+    return (hessian + hessian.T) / 2
+
+
+def _constrain_pars(fit, upar):
+    # Parameters (and, with pystan >= 2.19, transformed parameters and generated quantities)
+    if _pystan_version() >= (2, 19):
+        values = fit.constrain_pars(upar, include_tparams=True, include_gqs=True)
+    else:
+        values = fit.constrain_pars(upar)
+    if isinstance(values, dict):
+        values = list(values.values())
+    # Elements of the arrays in column-major order (as the flatnames)
+    return numpy.concatenate([numpy.ravel(value, order='F') for value in values])
+
+
+def _sample_dataset(i_dataset, dataset):
+    return _batch_processor._sample_dataset(i_dataset, dataset)
+
+
+def _read_dataset(path):
+    if path.lower().endswith(".r"):
+        return pystan.misc.read_rdump(path)
+    with open(path, 'r') as dataset_file:
+        if path.endswith(".json"):
+            return json.load(dataset_file)
+        import yaml
+        return yaml.safe_load(dataset_file)
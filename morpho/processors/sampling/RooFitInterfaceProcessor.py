@@ -11,7 +11,8 @@ except ImportError:
 
 import random
 
-from morpho.utilities import morphologging, reader
+from morpho.utilities import morphologging, reader, cpubudget
+from morpho.utilities.results import Results
 from morpho.processors import BaseProcessor
 logger = morphologging.getLogger(__name__)
 
@@ -33,7 +34,7 @@ class RooFitInterfaceProcessor(BaseProcessor):
         iter (required): total number of iterations (warmup and sampling)
         warmup: number of warmup iterations (default=iter/2)
         chain: number of chains (default=1)
-        n_jobs: number of parallel cores running (default=1)
+        n_jobs: number of parallel cores running (default=1), taken from the CPU budget of the process
         binned: should do binned analysis (default=false)
         options: other options
 
@@ -132,7 +133,10 @@ class RooFitInterfaceProcessor(BaseProcessor):
         if self.mode == "generate":
             return self._Generator()
         elif self.mode == 'lsampling':
-            return self._LikelihoodSampling()
+            # Cores taken from the CPU budget of the process
+            with cpubudget.get_budget().Acquire(self.numCPU, self.name) as n_cpus:
+                self.numCPU = n_cpus
+                return self._LikelihoodSampling()
         elif self.mode == 'fit':
             return self._Fit()
         else:
@@ -213,6 +217,7 @@ class RooFitInterfaceProcessor(BaseProcessor):
                 self.data[item].append(
                     data.get(i).getRealValue(item))
         self.data.update({"is_sample": [1]*(self.iter)})
+        self.data = Results(self.data, n_chains=1)
 
         return True
 
@@ -289,5 +294,6 @@ class RooFitInterfaceProcessor(BaseProcessor):
                         chainData.get(i).getRealValue(item))
         self.results.update(
             {"is_sample": [0]*self.warmup + [1]*(int(chainData.numEntries())-self.warmup)})
+        self.results = Results(self.results, n_chains=1)
 
         return True
@@ -1,13 +1,19 @@
 '''
+The members of this package are imported on first access
 '''
 
 from __future__ import absolute_import
 
-from .GaussianSamplingProcessor import GaussianSamplingProcessor
-from .GaussianRooFitProcessor import GaussianRooFitProcessor
+from morpho.utilities.lazy import make_lazy
 
-from .PyStanSamplingProcessor import PyStanSamplingProcessor
-from .RooFitInterfaceProcessor import RooFitInterfaceProcessor
-from .PyBindRooFitProcessor import PyBindRooFitProcessor
-from .LinearFitRooFitProcessor import LinearFitRooFitProcessor
-from .PriorSamplingProcessor import PriorSamplingProcessor
+_lazy_members = {
+    "GaussianSamplingProcessor": ".GaussianSamplingProcessor:GaussianSamplingProcessor",
+    "GaussianRooFitProcessor": ".GaussianRooFitProcessor:GaussianRooFitProcessor",
+    "PyStanSamplingProcessor": ".PyStanSamplingProcessor:PyStanSamplingProcessor",
+    "RooFitInterfaceProcessor": ".RooFitInterfaceProcessor:RooFitInterfaceProcessor",
+    "PyBindRooFitProcessor": ".PyBindRooFitProcessor:PyBindRooFitProcessor",
+    "LinearFitRooFitProcessor": ".LinearFitRooFitProcessor:LinearFitRooFitProcessor",
+    "PriorSamplingProcessor": ".PriorSamplingProcessor:PriorSamplingProcessor"
+}
+
+make_lazy(__name__)
@@ -0,0 +1,82 @@
+'''
+Adaptation (step size, inverse metric) and last draws of Stan fits,
+used to warm start other fits of the same model
+Authors: agent
+Date: 10/18/26
+'''
+
+import json
+import os
+
+import numpy
+
+from morpho.utilities import morphologging, pystanLoader
+logger = morphologging.getLogger(__name__)
+
+
+def from_fit(fit, n_chains):
+    '''
+    Returns the step size, inverse metric and last draw (dictionary parameter -> value)
+    of each chain of a PyStan fit
+    '''
+    adaptation = {"stepsize": [], "inv_metric": [], "last_draws": []}
+    samples = fit.extract(permuted=False, inc_warmup=True)
+    for iChain in range(n_chains):
+        stepsize, inv_metric = _chain_adaptation(fit, iChain)
+        adaptation["stepsize"].append(stepsize)
+        adaptation["inv_metric"].append(inv_metric)
+        adaptation["last_draws"].append(_last_draw(fit, samples[-1, iChain, :]))
+    return adaptation
+
+
+def _chain_adaptation(fit, iChain):
+    if hasattr(fit, "get_stepsize") and hasattr(fit, "get_inv_metric"):
+        # pystan >= 2.19
+        return float(fit.get_stepsize()[iChain]), numpy.asarray(fit.get_inv_metric()[iChain]).tolist()
+    # Otherwise parsed from the adaptation info:
+    #   # Step size = 0.8
+    #   # Diagonal elements of inverse mass matrix:
+    #   # 1.1, 0.9
+    stepsize = None
+    rows = []
+    in_metric = False
+    for line in fit.get_adaptation_info()[iChain].splitlines():
+        line = line.lstrip("# ").strip()
+        if line.startswith("Step size"):
+            stepsize = float(line.split("=")[1])
+        elif "inverse mass matrix" in line:
+            in_metric = True
+        elif in_metric and line:
+            rows.append([float(value) for value in line.split(",")])
+    inv_metric = rows[0] if len(rows) == 1 else rows
+    return stepsize, inv_metric
+
+
+def _last_draw(fit, draw):
+    # Values of the parameters (the elements of the arrays are in column-major order)
+    values = dict()
+    offset = 0
+    _, model_pars, par_dims = pystanLoader.output_names(fit)
+    for name, dims in zip(model_pars, par_dims):
+        size = int(numpy.prod(dims))
+        if len(dims) == 0:
+            values[name] = float(draw[offset])
+        else:
+            values[name] = draw[offset:offset+size].reshape(dims, order='F').tolist()
+        offset += size
+    return values
+
+
+def save(adaptation, path):
+    rdir = os.path.dirname(path)
+    if rdir != '' and not os.path.exists(rdir):
+        os.makedirs(rdir)
+        logger.debug("Creating folder: {}".format(rdir))
+    with open(path, 'w') as adaptation_file:
+        json.dump(adaptation, adaptation_file, indent=4)
+    logger.info("Adaptation saved in {}".format(path))
+
+
+def load(path):
+    with open(path, 'r') as adaptation_file:
+        return json.load(adaptation_file)
@@ -0,0 +1,144 @@
+'''
+Background tasks (e.g. diagnostics) run in processes started by a fork server
+Authors: agent
+Date: 10/18/26
+'''
+
+import multiprocessing
+import os
+import pickle
+import threading
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+_tasks = None
+_tasks_lock = threading.Lock()
+
+
+class BackgroundTasks:
+    '''
+    Runs functions in processes started by a fork server: the function and its
+    arguments are sent (pickled) when the task is submitted, so that the task works
+    on a snapshot of them while the process carries on.
+    The fork server is a separate single-threaded process: the tasks can be submitted
+    from any thread (e.g. of the thread executor of the toolbox) without copying
+    locks held by the other threads, as a plain fork could.
+    At most max_workers tasks run at the same time: submitting another one waits
+    for the oldest running task to finish.
+    Without fork server (e.g. on Windows), or if the function or its arguments
+    cannot be pickled, the tasks are run when submitted.
+
+    Parameters:
+        max_workers: number of tasks running at the same time (default=1)
+    '''
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max(int(max_workers), 1)
+        self._running = []
+        self._failed = []
+        self._lock = threading.Lock()
+        self._context = get_context()
+        self.pid = os.getpid()
+
+    def Submit(self, name, function, *args):
+        '''
+        Run function(*args) in the background
+        '''
+        if self._context is None:
+            function(*args)
+            return
+        with self._lock:
+            self._Collect()
+            while len(self._running) >= self.max_workers:
+                logger.debug("Waiting for <{}> to finish".format(self._running[0].name))
+                self._Join(self._running.pop(0))
+            process = self._context.Process(target=function, args=args, name=name)
+            # Modules imported once by the fork server (when it starts) instead of by each task
+            self._context.set_forkserver_preload(["__main__", __name__, getattr(function, "__module__", __name__)])
+            try:
+                process.start()
+            except (pickle.PicklingError, AttributeError, TypeError) as err:
+                logger.warning("<{}> cannot be sent to a background process: runs in the foreground\n{}".format(
+                    name, err))
+                process = None
+            if process is not None:
+                self._running.append(process)
+                logger.debug("<{}> started in the background (pid {})".format(name, process.pid))
+                return
+        function(*args)
+
+    def Wait(self):
+        '''
+        Wait for all the tasks; returns False if one of them failed since the last call
+        '''
+        with self._lock:
+            while len(self._running) > 0:
+                self._Join(self._running.pop(0))
+            failed, self._failed = self._failed, []
+        for name in failed:
+            logger.error("<{}> failed".format(name))
+        return len(failed) == 0
+
+    @property
+    def n_running(self):
+        with self._lock:
+            self._Collect()
+            return len(self._running)
+
+    def _Collect(self):
+        # Forget the tasks already done
+        for process in [process for process in self._running if not process.is_alive()]:
+            self._running.remove(process)
+            self._Join(process)
+
+    def _Join(self, process):
+        process.join()
+        if process.exitcode != 0:
+            self._failed.append(process.name)
+        else:
+            logger.debug("<{}> done".format(process.name))
+
+
+def get_context():
+    '''
+    Multiprocessing context of the background tasks (None: the tasks are run when submitted)
+    '''
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return None
+
+
+def get_tasks():
+    '''
+    Background tasks of the process
+    '''
+    global _tasks
+    with _tasks_lock:
+        if _tasks is None:
+            _tasks = BackgroundTasks()
+        elif _tasks.pid != os.getpid():
+            # Forked worker (e.g. of the process executor): the tasks of the parent are not its own
+            _tasks = BackgroundTasks(_tasks.max_workers)
+        return _tasks
+
+
+def set_max_workers(max_workers):
+    '''
+    Number of background tasks running at the same time
+    '''
+    get_tasks().max_workers = max(int(max_workers), 1)
+
+
+def submit(name, function, *args):
+    get_tasks().Submit(name, function, *args)
+
+
+def wait():
+    '''
+    Wait for the background tasks; returns False if one of them failed
+    '''
+    tasks = get_tasks()
+    if tasks.n_running > 0:
+        logger.info("Waiting for {} background tasks".format(tasks.n_running))
+    return tasks.Wait()
@@ -0,0 +1,161 @@
+'''
+Content-addressed cache of processors outputs
+Authors: agent
+Date: 10/18/26
+'''
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+
+from morpho.utilities import morphologging, modelcache
+logger = morphologging.getLogger(__name__)
+
+
+def hash_object(an_object):
+    '''
+    Returns the sha256 hash of an object serialized by pickle
+    '''
+    return hashlib.sha256(pickle.dumps(an_object, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def hash_key(*items):
+    '''
+    Returns the sha256 hash of json-like items (configuration dictionaries, names...)
+    '''
+    text = json.dumps(items, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def file_state(path):
+    '''
+    Returns the path, size and modification time of a file (None if it does not exist)
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [path, None, None]
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+class ResultCache:
+    '''
+    Stores the outputs of processors on disk, indexed by a key computed
+    from the processor configuration, class, version and inputs.
+    The least recently used entries are removed once the total size of the
+    cache exceeds max_size (in MB).
+    Several processes (e.g. ensemble copies, morpho serve workers) can share
+    the same cache: the index is locked and read again for each change.
+    '''
+
+    index_name = "index.json"
+
+    def __init__(self, directory, max_size=1000):
+        self.directory = directory
+        self.max_size = int(float(max_size) * 1024 * 1024)
+        self._lock = threading.Lock()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+            logger.info("Creating cache folder: {}".format(self.directory))
+
+    @contextmanager
+    def _Index(self):
+        '''
+        Locks (in the process and across processes), reads and (once done) writes the index
+        '''
+        index_fn = os.path.join(self.directory, self.index_name)
+        with self._lock, modelcache.file_lock(index_fn + ".lock"):
+            self._index = self._ReadIndex()
+            yield self._index
+            self._WriteIndex()
+
+    def _ReadIndex(self):
+        index_fn = os.path.join(self.directory, self.index_name)
+        if os.path.exists(index_fn):
+            try:
+                with open(index_fn, 'r') as index_file:
+                    return json.load(index_file)
+            except Exception as err:
+                logger.warning("Cache index {} unreadable; starting from an empty cache:\n{}".format(
+                    index_fn, err))
+        return dict()
+
+    def _WriteIndex(self):
+        # Written in a temporary file and renamed: the index is never read half-written
+        index_fn = os.path.join(self.directory, self.index_name)
+        tmp_fn = "{}.{}.tmp".format(index_fn, os.getpid())
+        with open(tmp_fn, 'w') as index_file:
+            json.dump(self._index, index_file, indent=4)
+        os.replace(tmp_fn, index_fn)
+
+    def _EntryFilename(self, key):
+        return os.path.join(self.directory, "{}.pkl".format(key))
+
+    def Load(self, key):
+        '''
+        Returns the outputs and their hashes stored under key, or None
+        '''
+        with self._Index() as index:
+            if key not in index:
+                return None
+            try:
+                with open(self._EntryFilename(key), 'rb') as entry_file:
+                    blobs = pickle.load(entry_file)
+                outputs = {var_name: pickle.loads(blob) for var_name, blob in blobs.items()}
+            except Exception as err:
+                logger.warning("Cannot read cache entry {}:\n{}".format(key, err))
+                self._Remove(key)
+                return None
+            index[key]["last_used"] = time.time()
+            return outputs, index[key]["hashes"]
+
+    def Store(self, key, proc_name, outputs):
+        '''
+        Stores the outputs (dictionary variable -> value) under key
+        and returns the hashes of the outputs
+        '''
+        blobs = dict()
+        hashes = dict()
+        for var_name, value in outputs.items():
+            blobs[var_name] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            hashes[var_name] = hashlib.sha256(blobs[var_name]).hexdigest()
+        tmp_fn = "{}.{}.tmp".format(self._EntryFilename(key), os.getpid())
+        with open(tmp_fn, 'wb') as entry_file:
+            pickle.dump(blobs, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._Index() as index:
+            os.replace(tmp_fn, self._EntryFilename(key))
+            index[key] = {
+                "processor": proc_name,
+                "size": os.path.getsize(self._EntryFilename(key)),
+                "last_used": time.time(),
+                "hashes": hashes
+            }
+            self._Evict()
+        return hashes
+
+    def Invalidate(self, proc_name):
+        '''
+        Removes all the entries produced by a processor
+        '''
+        with self._Index() as index:
+            for key in [key for key, entry in index.items() if entry["processor"] == proc_name]:
+                self._Remove(key)
+
+    def _Remove(self, key):
+        logger.debug("Removing cache entry {} ({})".format(
+            key, self._index[key]["processor"]))
+        if os.path.exists(self._EntryFilename(key)):
+            os.remove(self._EntryFilename(key))
+        del self._index[key]
+
+    def _Evict(self):
+        total_size = sum(entry["size"] for entry in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k]["last_used"]):
+            if total_size <= self.max_size:
+                break
+            total_size -= self._index[key]["size"]
+            self._Remove(key)
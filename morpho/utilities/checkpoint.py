@@ -0,0 +1,134 @@
+'''
+Checkpoints of processors outputs, used to resume a processors chain
+Authors: agent
+Date: 10/18/26
+'''
+
+import json
+import os
+import pickle
+
+import numpy
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+def save_outputs(filename, outputs):
+    '''
+    Save the outputs of a processor (dictionary variable -> value) into a npz file.
+    Dictionaries are stored column by column as numpy arrays; values which cannot be
+    converted into a numerical or string array are pickled.
+    '''
+    arrays = dict()
+    meta = dict()
+    for i_var, (var_name, value) in enumerate(outputs.items()):
+        if isinstance(value, dict):
+            columns = dict()
+            for i_col, (col_name, column) in enumerate(value.items()):
+                array_name = "v{}_c{}".format(i_var, i_col)
+                columns[col_name] = [array_name, _store_array(arrays, array_name, column)]
+            meta[var_name] = {"kind": "dict", "columns": columns}
+        else:
+            array_name = "v{}".format(i_var)
+            meta[var_name] = {"kind": "value", "array": [
+                array_name, _store_array(arrays, array_name, value)]}
+    arrays["__meta__"] = numpy.array(json.dumps(meta))
+    with open(filename, 'wb') as npz_file:
+        numpy.savez(npz_file, **arrays)
+
+
+def load_outputs(filename):
+    '''
+    Load the outputs saved by save_outputs
+    '''
+    outputs = dict()
+    with numpy.load(filename, allow_pickle=False) as npz_file:
+        meta = json.loads(str(npz_file["__meta__"]))
+        for var_name, var_meta in meta.items():
+            if var_meta["kind"] == "dict":
+                outputs[var_name] = dict()
+                for col_name, (array_name, kind) in var_meta["columns"].items():
+                    outputs[var_name][col_name] = _load_array(npz_file, array_name, kind)
+            else:
+                array_name, kind = var_meta["array"]
+                outputs[var_name] = _load_array(npz_file, array_name, kind)
+    return outputs
+
+
+def _store_array(arrays, array_name, value):
+    if isinstance(value, numpy.ndarray) and value.dtype != object:
+        arrays[array_name] = value
+        return "array"
+    if isinstance(value, (list, tuple, int, float, bool, str)):
+        try:
+            array = numpy.asarray(value)
+        except ValueError:
+            array = None
+        if array is not None and array.dtype != object:
+            arrays[array_name] = array
+            return "list" if isinstance(value, (list, tuple)) else "scalar"
+    arrays[array_name] = numpy.frombuffer(
+        pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), dtype=numpy.uint8)
+    return "pickle"
+
+
+def _load_array(npz_file, array_name, kind):
+    array = npz_file[array_name]
+    if kind == "list" or kind == "scalar":
+        return array.tolist()
+    if kind == "pickle":
+        return pickle.loads(array.tobytes())
+    return array
+
+
+class Checkpoint:
+    '''
+    Keeps track of the processors which completed and of their connected outputs
+    in a checkpoint directory.
+    '''
+
+    index_name = "checkpoint.json"
+
+    def __init__(self, directory, resume=False):
+        self.directory = directory
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+            logger.info("Creating checkpoint folder: {}".format(self.directory))
+        self._index = dict()
+        index_fn = os.path.join(self.directory, self.index_name)
+        if resume and os.path.exists(index_fn):
+            with open(index_fn, 'r') as index_file:
+                self._index = json.load(index_file)
+            logger.info("Resuming from checkpoint {} (completed: {})".format(
+                self.directory, list(self._index.keys())))
+        elif resume:
+            logger.warning("No checkpoint in {}: starting from scratch".format(self.directory))
+        self._WriteIndex()
+
+    def _WriteIndex(self):
+        index_fn = os.path.join(self.directory, self.index_name)
+        with open(index_fn + ".tmp", 'w') as index_file:
+            json.dump(self._index, index_file, indent=4)
+        os.replace(index_fn + ".tmp", index_fn)
+
+    def _Filename(self, proc_name):
+        return os.path.join(self.directory, "{}.npz".format(proc_name))
+
+    def IsComplete(self, proc_name, config_key):
+        '''
+        Checks if a processor with this configuration has completed
+        '''
+        return proc_name in self._index and self._index[proc_name] == config_key
+
+    def Save(self, proc_name, config_key, outputs):
+        '''
+        Save the outputs of a completed processor
+        '''
+        save_outputs(self._Filename(proc_name), outputs)
+        self._index[proc_name] = config_key
+        self._WriteIndex()
+        logger.debug("Checkpoint of <{}> saved".format(proc_name))
+
+    def Load(self, proc_name):
+        return load_outputs(self._Filename(proc_name))
@@ -0,0 +1,142 @@
+'''
+Convergence diagnostics of MCMC chains: rank-normalized split R-hat, bulk and tail ESS
+(Vehtari, Gelman, Simpson, Carpenter, Buerkner, 2021)
+Authors: agent
+Date: 10/18/26
+'''
+
+from statistics import NormalDist
+
+import numpy
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+_inv_cdf = numpy.frompyfunc(NormalDist().inv_cdf, 1, 1)
+
+
+def rhat(draws):
+    '''
+    Rank-normalized split R-hat of draws (array of shape (chains, draws))
+    '''
+    split = _split_chains(draws)
+    folded = numpy.abs(split - numpy.median(split))
+    return max(_rhat(_rank_normalize(split)), _rhat(_rank_normalize(folded)))
+
+
+def ess_bulk(draws):
+    '''
+    Bulk effective sample size of draws (array of shape (chains, draws))
+    '''
+    return _ess(_rank_normalize(_split_chains(draws)))
+
+
+def ess_tail(draws):
+    '''
+    Tail effective sample size (minimum of the ESS of the 5% and 95% quantiles)
+    of draws (array of shape (chains, draws))
+    '''
+    split = _split_chains(draws)
+    q05, q95 = numpy.quantile(split, [0.05, 0.95])
+    return min(_ess((split <= q05).astype(float)), _ess((split >= q95).astype(float)))
+
+
+def split_rhat(draws):
+    '''
+    Split R-hat (without rank normalization) of draws of shape (chains, draws, ...):
+    one value per variable of the trailing axes
+    '''
+    return _rhat(_split_chains(draws))
+
+
+def split_ess(draws):
+    '''
+    Effective sample size (split chains, without rank normalization) of draws of
+    shape (chains, draws, ...): one value per variable of the trailing axes
+    '''
+    return _ess(_split_chains(draws))
+
+
+def summary(results, names, n_chains):
+    '''
+    R-hat, bulk and tail ESS of the variables of results (after the warmup)
+    whose name is in names (or starts with name[)
+    '''
+    samples = results.post_warmup()
+    summaries = dict()
+    for key, value in samples.items():
+        if not any(key == name or key.startswith(name + "[") for name in names):
+            continue
+        value = numpy.asarray(value, dtype=float)
+        draws = value.reshape((n_chains, -1) + value.shape[1:])
+        # Array variables: each element
+        elements = draws.reshape(n_chains, draws.shape[1], -1)
+        for i_element in range(elements.shape[2]):
+            element_name = key if elements.shape[2] == 1 else "{}[{}]".format(key, i_element)
+            summaries[element_name] = {
+                "rhat": float(rhat(elements[:, :, i_element])),
+                "ess_bulk": float(ess_bulk(elements[:, :, i_element])),
+                "ess_tail": float(ess_tail(elements[:, :, i_element]))
+            }
+    return summaries
+
+
+def _split_chains(draws):
+    draws = numpy.asarray(draws, dtype=float)
+    half = draws.shape[1] // 2
+    return numpy.concatenate([draws[:, :half], draws[:, draws.shape[1]-half:]], axis=0)
+
+
+def _rank_normalize(draws):
+    flat = draws.reshape(-1)
+    order = numpy.argsort(flat, kind="mergesort")
+    ranks = numpy.empty(len(flat))
+    ranks[order] = numpy.arange(1, len(flat) + 1)
+    # Average rank of the ties
+    values, inverse = numpy.unique(flat, return_inverse=True)
+    if len(values) < len(flat):
+        ranks = (numpy.bincount(inverse, weights=ranks) / numpy.bincount(inverse))[inverse]
+    quantiles = (ranks - 3./8) / (len(flat) + 1./4)
+    return _inv_cdf(quantiles).astype(float).reshape(draws.shape)
+
+
+def _rhat(draws):
+    # draws: (chains, draws, ...)
+    n_draws = draws.shape[1]
+    within = numpy.mean(numpy.var(draws, axis=1, ddof=1), axis=0)
+    between = n_draws * numpy.var(numpy.mean(draws, axis=1), axis=0, ddof=1)
+    var_hat = (n_draws - 1.) / n_draws * within + between / n_draws
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where(within > 0, numpy.sqrt(var_hat / within), numpy.nan)
+
+
+def _autocovariance(draws):
+    # Autocovariance of each chain (FFT along the draws)
+    n_draws = draws.shape[1]
+    centered = draws - numpy.mean(draws, axis=1, keepdims=True)
+    n_fft = 2 ** int(numpy.ceil(numpy.log2(2 * n_draws)))
+    spectrum = numpy.fft.rfft(centered, n=n_fft, axis=1)
+    acov = numpy.fft.irfft(spectrum * numpy.conjugate(spectrum), n=n_fft, axis=1)
+    return acov[:, :n_draws] / n_draws
+
+
+def _ess(draws):
+    # draws: (chains, draws, ...)
+    n_chains, n_draws = draws.shape[:2]
+    if n_draws < 4:
+        return numpy.full(draws.shape[2:], numpy.nan)
+    acov = _autocovariance(draws)
+    within = numpy.mean(acov[:, 0] * n_draws / (n_draws - 1.), axis=0)
+    var_hat = (n_draws - 1.) / n_draws * within
+    if n_chains > 1:
+        var_hat = var_hat + numpy.var(numpy.mean(draws, axis=1), axis=0, ddof=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rho = 1. - (within - numpy.mean(acov, axis=0)) / var_hat
+    rho[0] = 1.
+    # Geyer's initial positive and monotone sequence
+    pairs = rho[:-1:2] + rho[1::2]
+    positive = numpy.cumprod(pairs > 0, axis=0).astype(bool)
+    pairs = numpy.minimum.accumulate(pairs, axis=0)
+    tau = -1. + 2. * numpy.sum(numpy.where(positive, pairs, 0.), axis=0)
+    tau = numpy.maximum(tau, 1. / numpy.log10(n_chains * n_draws))
+    return numpy.where(within > 0, n_chains * n_draws / tau, numpy.nan)
@@ -0,0 +1,179 @@
+'''
+CPU budget shared by the samplers of a process
+Authors: agent
+Date: 10/18/26
+'''
+
+import collections
+import contextlib
+import os
+import threading
+
+try:
+    import threadpoolctl
+except ImportError:
+    pass
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+# Budget of the worker processes (set by their parent)
+cpus_variable = "MORPHO_CPUS"
+blas_variables = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+class CPUBudget:
+    '''
+    Number of cores that the samplers of the process can use at the same time.
+    A sampler asks for a number of cores (e.g. its chains) and gets at most the
+    whole budget; it waits until enough cores are free (first come, first served).
+
+    Parameters:
+        n_cpus: number of cores
+    '''
+
+    def __init__(self, n_cpus):
+        self.n_cpus = max(int(n_cpus), 1)
+        self._used = 0
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+
+    @property
+    def used(self):
+        return self._used
+
+    @contextlib.contextmanager
+    def Acquire(self, n_cpus, name=None):
+        '''
+        Context in which n_cpus cores (at most the budget) are reserved;
+        returns the number of cores given
+        '''
+        n_cpus = min(max(int(n_cpus), 1), self.n_cpus)
+        ticket = object()
+        with self._condition:
+            self._queue.append(ticket)
+            if self._queue[0] is not ticket or self._used + n_cpus > self.n_cpus:
+                logger.info("<{}> waiting for {} of {} cores ({} used)".format(
+                    name, n_cpus, self.n_cpus, self._used))
+            while self._queue[0] is not ticket or self._used + n_cpus > self.n_cpus:
+                self._condition.wait()
+            self._queue.popleft()
+            self._used += n_cpus
+            self._condition.notify_all()
+        logger.debug("<{}> using {} of {} cores".format(name, n_cpus, self.n_cpus))
+        try:
+            yield n_cpus
+        finally:
+            with self._condition:
+                self._used -= n_cpus
+                self._condition.notify_all()
+
+
+def get_budget():
+    '''
+    Budget of the process (created with the available cores the first time)
+    '''
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = CPUBudget(available_cpus())
+            _limit_blas_threads(_budget.n_cpus)
+        return _budget
+
+
+def set_cpus(n_cpus):
+    '''
+    Set the number of cores of the process budget (e.g. --cpus)
+    '''
+    global _budget
+    with _budget_lock:
+        _budget = CPUBudget(n_cpus)
+        _limit_blas_threads(_budget.n_cpus)
+    logger.debug("CPU budget: {} cores".format(_budget.n_cpus))
+
+
+def share(n_workers):
+    '''
+    Cores of each of n_workers worker processes sharing the budget
+    '''
+    return max(get_budget().n_cpus // max(int(n_workers), 1), 1)
+
+
+def init_worker(n_cpus):
+    '''
+    Initializer of the worker processes: budget of the worker
+    '''
+    os.environ[cpus_variable] = str(n_cpus)
+    for name in blas_variables:
+        os.environ[name] = str(n_cpus)
+    set_cpus(n_cpus)
+
+
+def available_cpus():
+    '''
+    Number of cores the process can use: MORPHO_CPUS if set, otherwise the
+    smallest of the CPU affinity, the cgroup CPU quota and OMP_NUM_THREADS
+    '''
+    n_cpus = _int_variable(cpus_variable)
+    if n_cpus is not None:
+        return max(n_cpus, 1)
+    limits = [os.cpu_count() or 1]
+    if hasattr(os, "sched_getaffinity"):
+        limits.append(len(os.sched_getaffinity(0)))
+    quota = cgroup_quota()
+    if quota is not None:
+        limits.append(quota)
+    omp_threads = _int_variable("OMP_NUM_THREADS")
+    if omp_threads is not None:
+        limits.append(omp_threads)
+    return max(min(limits), 1)
+
+
+def cgroup_quota(root="/sys/fs/cgroup"):
+    '''
+    CPU quota (rounded up to a number of cores) of the cgroup, or None
+    '''
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    values = _read_values(os.path.join(root, "cpu.max"))
+    if values is None:
+        # cgroup v1
+        quota = _read_values(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+        period = _read_values(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+        if quota is None or period is None:
+            return None
+        values = quota + period
+    if len(values) < 2 or values[0] in ["max", "-1"]:
+        return None
+    try:
+        return max(-(-int(values[0]) // int(values[1])), 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _read_values(path):
+    try:
+        with open(path, 'r') as a_file:
+            return a_file.read().split()
+    except OSError:
+        return None
+
+
+def _int_variable(name):
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _limit_blas_threads(n_cpus):
+    # Child processes (e.g. the chains) read the variables at start;
+    # the libraries already loaded are limited with threadpoolctl (if installed)
+    for name in blas_variables:
+        os.environ.setdefault(name, str(n_cpus))
+    try:
+        threadpoolctl.threadpool_limits(n_cpus)
+    except NameError:
+        pass
@@ -0,0 +1,153 @@
+'''
+Ensemble class: run many independent copies of a processors chain
+Authors: agent
+Date: 10/18/26
+'''
+
+import copy
+import json
+import os
+from argparse import Namespace
+from concurrent import futures
+
+from morpho.utilities import morphologging, toolbox, cpubudget
+logger = morphologging.getLogger(__name__)
+
+
+class Ensemble:
+    '''
+    Runs N independent copies of the processors chain defined in a configuration file
+    on a pool of K processes.
+    Each copy gets a distinct deterministic seed (seed+i) and its own output paths:
+    the output files, the checkpoint directory (<checkpoint>/copy_i) and the run
+    report (<report>_i.json) of the copies never overlap.
+    The result cache is shared between the copies.
+    The produced files are listed in a manifest which can be given to
+    CalibrationProcessor (files: <manifest>).
+    The cores of the CPU budget (--cpus) are shared between the K processes.
+
+    The ensemble is configured in the processors-toolbox section:
+        ensemble:
+            seed: base seed, overwritten by the --seed CLI option (default=0)
+            seed_parameters: parameters set to the seed of the copy (e.g. "generator.seed")
+            output_parameters (required): file parameters made unique for each copy (e.g. "writer.filename")
+            manifest: path of the manifest (default="ensemble_manifest.json")
+    '''
+
+    def __init__(self, args):
+        self.config_dict = toolbox.ToolBox(args).config_dict
+        # CLI options given to the copies (e.g. the cache options); the --param
+        # overrides are already in the configuration and would undo the seeds of the copies;
+        # the checkpoint and report paths are already in the configuration too and are
+        # made unique for each copy in _MakeCopyConfig
+        self.args = Namespace(**vars(args))
+        self.args.param = False
+        self.args.checkpoint = None
+        self.args.report = None
+        ensemble_dict = self.config_dict["processors-toolbox"].get("ensemble", dict())
+        self.n_copies = int(args.ensemble)
+        self.n_jobs = max(int(args.jobs), 1)
+        if args.seed is not None:
+            self.seed = int(args.seed)
+        else:
+            self.seed = int(ensemble_dict.get("seed", 0))
+        self.seed_parameters = ensemble_dict.get("seed_parameters", [])
+        self.output_parameters = ensemble_dict.get("output_parameters", [])
+        self.manifest = ensemble_dict.get("manifest", "ensemble_manifest.json")
+
+    def _MakeCopyConfig(self, index):
+        '''
+        Returns the configuration dictionary of the copy <index>
+        '''
+        config_dict = copy.deepcopy(self.config_dict)
+        toolbox_dict = config_dict["processors-toolbox"]
+        toolbox_dict.pop("ensemble", None)
+        if toolbox_dict.get("checkpoint", None):
+            toolbox_dict["checkpoint"] = os.path.join(toolbox_dict["checkpoint"], "copy_{}".format(index))
+        if toolbox_dict.get("report", None):
+            root, ext = os.path.splitext(toolbox_dict["report"])
+            toolbox_dict["report"] = "{}_{}{}".format(root, index, ext)
+        files = []
+        for xpath in self.seed_parameters:
+            _set_param(config_dict, xpath, self.seed + index)
+        for xpath in self.output_parameters:
+            root, ext = os.path.splitext(str(_get_param(config_dict, xpath)))
+            filename = "{}_{}{}".format(root, index, ext)
+            _set_param(config_dict, xpath, filename)
+            files.append(filename)
+        return config_dict, files
+
+    def Run(self):
+        if len(self.output_parameters) == 0:
+            logger.error("No ensemble.output_parameters given: the copies would overwrite each other's outputs")
+            return False
+        if len(self.seed_parameters) == 0:
+            logger.warning("No ensemble.seed_parameters given: all the copies use the same seeds")
+        n_cpus = cpubudget.share(self.n_jobs)
+        logger.info("Running an ensemble of {} copies on {} processes ({} cores each)".format(
+            self.n_copies, self.n_jobs, n_cpus))
+        succeeded = dict()
+        failed = []
+        with futures.ProcessPoolExecutor(max_workers=self.n_jobs, initializer=cpubudget.init_worker,
+                                         initargs=(n_cpus,)) as executor:
+            running = dict()
+            for index in range(self.n_copies):
+                config_dict, files = self._MakeCopyConfig(index)
+                running[executor.submit(_RunCopy, config_dict, index, self.args)] = (index, files)
+            for future in futures.as_completed(running):
+                index, files = running[future]
+                try:
+                    success = future.result()
+                except Exception as err:
+                    logger.error("Copy {} failed:\n{}".format(index, err))
+                    success = False
+                if success:
+                    succeeded[index] = files
+                else:
+                    failed.append(self.seed + index)
+        manifest = {"files": [], "seeds": [], "failed": sorted(failed)}
+        for index in sorted(succeeded):
+            manifest["files"].extend(succeeded[index])
+            manifest["seeds"].append(self.seed + index)
+
+        mdir = os.path.dirname(self.manifest)
+        if mdir != '' and not os.path.exists(mdir):
+            os.makedirs(mdir)
+            logger.debug("Creating folder: {}".format(mdir))
+        with open(self.manifest, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+        logger.info("Manifest saved in {}".format(self.manifest))
+        if len(manifest["failed"]) > 0:
+            logger.warning("{} copies failed (seeds: {})".format(
+                len(manifest["failed"]), manifest["failed"]))
+            return False
+        return True
+
+
+def _get_param(the_dict, xpath):
+    for path in xpath.split('.'):
+        the_dict = the_dict[path]
+    return the_dict
+
+
+def _set_param(the_dict, xpath, value):
+    path = xpath.split('.')
+    for key in path[:-1]:
+        the_dict = the_dict.setdefault(key, dict())
+    the_dict[path[-1]] = value
+
+
+def _RunCopy(config_dict, index, args):
+    '''
+    Run one copy of the chain in a worker process
+    '''
+    logger.info("Running copy {}".format(index))
+    return toolbox.ToolBox(args, config_dict).Run()
+
+
+def read_manifest(filename):
+    '''
+    Returns the list of files of an ensemble manifest
+    '''
+    with open(filename, 'r') as manifest_file:
+        return json.load(manifest_file)["files"]
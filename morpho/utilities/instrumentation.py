@@ -0,0 +1,110 @@
+'''
+Measurement of the time and memory used by the processors
+Authors: agent
+Date: 10/18/26
+'''
+
+import resource
+import threading
+import time
+import tracemalloc
+
+from morpho.utilities import morphologging, memory
+logger = morphologging.getLogger(__name__)
+
+# Users of the allocation tracing (tracemalloc is global to the process)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+
+def start_tracing():
+    '''
+    Start tracing the allocations (tracemalloc), if not done yet: the tracing is
+    stopped once each call has been matched by a call to stop_tracing
+    '''
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_users += 1
+
+
+def stop_tracing():
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class Measurement:
+    '''
+    Context manager measuring the wall time, the CPU time (of the calling thread and
+    of the child processes terminated meanwhile, e.g. the pystan chains),
+    the increase of the peak RSS of the process and, if requested,
+    the top allocations (tracemalloc) of a block of code.
+    The results are stored in the dictionary given.
+    With several threads, the CPU time of the children and the allocations
+    of the blocks measured at the same time are mixed.
+    '''
+
+    def __init__(self, results, trace_allocations=False, n_top=10):
+        self.results = results
+        self.trace_allocations = trace_allocations
+        self.n_top = n_top
+
+    def __enter__(self):
+        if self.trace_allocations:
+            start_tracing()
+            self._snapshot = tracemalloc.take_snapshot()
+        self._peak_rss = memory.peak_rss()
+        self._cpu = time.thread_time() + _children_cpu()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.results["wall"] = time.perf_counter() - self._wall
+        self.results["cpu"] = time.thread_time() + _children_cpu() - self._cpu
+        self.results["peak_rss_delta"] = memory.peak_rss() - self._peak_rss
+        if self.trace_allocations:
+            try:
+                stats = tracemalloc.take_snapshot().compare_to(self._snapshot, 'lineno')
+                self.results["top_allocations"] = [
+                    {"location": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                    for stat in stats[:self.n_top]]
+            finally:
+                stop_tracing()
+        return False
+
+
+def format_table(stats):
+    '''
+    Returns a compact table of the statistics (processor -> {"configure", "run"})
+    '''
+    lines = ["{:<24} {:>10} {:>10} {:>10} {:>12}".format(
+        "processor", "config(s)", "wall(s)", "cpu(s)", "peak RSS +")]
+    for proc_name, proc_stats in stats.items():
+        configure = proc_stats.get("configure", dict())
+        run = proc_stats.get("run", dict())
+        if proc_stats.get("restored", False):
+            run_columns = ["restored", "", ""]
+        else:
+            run_columns = [_format_time(run.get("wall")), _format_time(run.get("cpu")),
+                           memory.format_size(run.get("peak_rss_delta"))]
+        lines.append("{:<24} {:>10} {:>10} {:>10} {:>12}".format(
+            proc_name[:24], _format_time(configure.get("wall")), *run_columns))
+    return "\n".join(lines)
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _format_time(value):
+    if value is None:
+        return "n/a"
+    return "{:.3f}".format(value)
@@ -0,0 +1,48 @@
+'''
+Packages whose members are imported on first access
+Authors: agent
+Date: 10/18/26
+'''
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    '''
+    Module type of a package whose members are only imported when accessed.
+    The package defines _lazy_members, a dictionary mapping a member name to
+    a relative path: ".submodule" for a subpackage or ".submodule:attribute"
+    for an attribute of a submodule (e.g. a processor class).
+    When a submodule named after a class is imported, the import system
+    sets it as attribute of the package: this is ignored so that the
+    class (and not the submodule) is returned.
+    '''
+
+    def __getattr__(self, name):
+        members = self.__dict__.get("_lazy_members", dict())
+        if name not in members:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+        module_name, _, attribute = members[name].partition(":")
+        value = importlib.import_module(module_name, self.__name__)
+        if attribute:
+            value = getattr(value, attribute)
+        types.ModuleType.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        members = self.__dict__.get("_lazy_members", dict())
+        if name in members and ":" in members[name] and isinstance(value, types.ModuleType):
+            return
+        types.ModuleType.__setattr__(self, name, value)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self.__dict__.get("_lazy_members", dict())))
+
+
+def make_lazy(module_name):
+    '''
+    Turn a package (already in sys.modules) into a LazyModule
+    '''
+    sys.modules[module_name].__class__ = LazyModule
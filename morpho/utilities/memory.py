@@ -0,0 +1,49 @@
+'''
+Memory usage of the current process
+Authors: agent
+Date: 10/18/26
+'''
+
+import os
+import resource
+import sys
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+def peak_rss(children=False):
+    '''
+    Returns the peak resident set size (in bytes) of the current process
+    (or the largest one of its terminated children)
+    '''
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return maxrss
+    return maxrss * 1024
+
+
+def current_rss():
+    '''
+    Returns the current resident set size (in bytes) of the process,
+    or None if it cannot be determined (no /proc filesystem)
+    '''
+    try:
+        with open("/proc/self/statm", 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_size(size):
+    '''
+    Returns a human readable size (size in bytes)
+    '''
+    if size is None:
+        return "n/a"
+    for unit in ["B", "kB", "MB"]:
+        if abs(size) < 1024.:
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024.
+    return "{:.1f} GB".format(size)
@@ -0,0 +1,215 @@
+'''
+Cache of compiled (Stan) models shared by several processes
+Authors: agent
+Date: 10/18/26
+'''
+
+import fcntl
+import json
+import os
+import pickle
+import platform
+import shlex
+import subprocess
+import sysconfig
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+# Models already loaded by this process: file -> (modification time, model);
+# long-lived processes (morpho serve) do not unpickle the same model again.
+# Only the max_loaded_models most recently used models are kept.
+max_loaded_models = 8
+_loaded_models = OrderedDict()
+_loaded_models_lock = threading.Lock()
+
+
+# Version given by "$CXX --version" (run once per process for each compiler)
+_compiler_versions = dict()
+_compiler_versions_lock = threading.Lock()
+
+
+def compiler_version():
+    '''
+    Returns a description of the C++ compiler used to build the models,
+    including its version (an upgraded compiler does not change $CXX)
+    '''
+    compiler = os.environ.get("CXX", sysconfig.get_config_var("CXX")) or "c++"
+    with _compiler_versions_lock:
+        if compiler not in _compiler_versions:
+            try:
+                output = subprocess.run(shlex.split(compiler) + ["--version"],
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        universal_newlines=True, timeout=30).stdout
+                # First line: name and version (then the copyright notice)
+                _compiler_versions[compiler] = (output.strip().splitlines() or [""])[0]
+            except (OSError, ValueError, subprocess.SubprocessError) as err:
+                logger.warning("Cannot get the version of the compiler {}:\n{}".format(compiler, err))
+                _compiler_versions[compiler] = ""
+        version = _compiler_versions[compiler]
+    return "{} ({}): {}".format(compiler, platform.python_compiler(), version)
+
+
+@contextmanager
+def file_lock(path, exclusive=True, blocking=True):
+    '''
+    Cross-process lock on a file; yields False if a non-blocking lock could not be acquired
+    '''
+    with open(path, 'a') as lock_file:
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ModelCache:
+    '''
+    Stores pickled compiled models in a directory, with an index of the entries
+    (size, creation and last use times, versions of the tools used to build them).
+    - Entries built with other versions (e.g. of pystan or of the compiler) are rebuilt.
+    - Once the total size exceeds max_size (in MB), the least recently used models are removed.
+    - A model is only built by one process: the others wait and load it.
+    '''
+
+    index_name = "stan_models.json"
+
+    def __init__(self, directory, max_size=None, versions=None):
+        self.directory = directory
+        self.max_size = None if max_size is None else int(float(max_size) * 1024 * 1024)
+        self.versions = versions or dict()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+            logger.info("Creating 'cache' folder: {}".format(self.directory))
+
+    def _Path(self, key):
+        return os.path.join(self.directory, "{}.pkl".format(key))
+
+    def _LockPath(self, key):
+        return os.path.join(self.directory, ".{}.lock".format(key))
+
+    @contextmanager
+    def _Index(self):
+        '''
+        Locks, reads and (once done) writes the index
+        '''
+        index_fn = os.path.join(self.directory, self.index_name)
+        with file_lock(index_fn + ".lock"):
+            index = dict()
+            if os.path.exists(index_fn):
+                try:
+                    with open(index_fn, 'r') as index_file:
+                        index = json.load(index_file)
+                except Exception as err:
+                    logger.warning("Model cache index {} unreadable; starting from an empty index:\n{}".format(
+                        index_fn, err))
+            yield index
+            with open(index_fn + ".tmp", 'w') as index_file:
+                json.dump(index, index_file, indent=4)
+            os.replace(index_fn + ".tmp", index_fn)
+
+    def Get(self, key, build, force=False):
+        '''
+        Returns the model stored under key; if there is none (or force is True),
+        the model is built using build() and stored.
+        '''
+        if not force:
+            with file_lock(self._LockPath(key), exclusive=False):
+                model = self._Load(key)
+            if model is not None:
+                return model
+        with file_lock(self._LockPath(key)):
+            if not force:
+                # Another process may have built the model in the meantime
+                model = self._Load(key)
+                if model is not None:
+                    return model
+            logger.info("Building model {}".format(key))
+            model = build()
+            self._Store(key, model)
+        return model
+
+    def _Load(self, key):
+        path = self._Path(key)
+        with self._Index() as index:
+            if key not in index or not os.path.exists(path):
+                logger.debug("No model {} in cache".format(key))
+                return None
+            for tool, version in self.versions.items():
+                if index[key].get(tool) != version:
+                    logger.info("Model {} built with {} {} (now {}): rebuilding".format(
+                        key, tool, index[key].get(tool), version))
+                    return None
+            index[key]["last_used"] = time.time()
+        return _load_model(path)
+
+    def _Store(self, key, model):
+        path = self._Path(key)
+        with open("{}.{}.tmp".format(path, os.getpid()), 'wb') as model_file:
+            pickle.dump(model, model_file)
+        os.replace("{}.{}.tmp".format(path, os.getpid()), path)
+        logger.debug("Model {} saved in {}".format(key, path))
+        with self._Index() as index:
+            index[key] = {
+                "file": os.path.basename(path),
+                "size": os.path.getsize(path),
+                "created": time.time(),
+                "last_used": time.time()
+            }
+            index[key].update(self.versions)
+            self._Evict(index, key)
+
+    def _Evict(self, index, key_to_keep):
+        '''
+        Removes the least recently used models (not being used by another process)
+        until the total size is below max_size
+        '''
+        if self.max_size is None:
+            return
+        total_size = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_used"]):
+            if total_size <= self.max_size:
+                break
+            if key == key_to_keep:
+                continue
+            with file_lock(self._LockPath(key), blocking=False) as locked:
+                if not locked:
+                    continue
+                logger.info("Removing model {} from cache".format(key))
+                if os.path.exists(self._Path(key)):
+                    os.remove(self._Path(key))
+                total_size -= index[key]["size"]
+                del index[key]
+
+
+def _load_model(path):
+    '''
+    Returns the model pickled in path, reusing the model already loaded
+    if the file did not change since
+    '''
+    mtime = os.path.getmtime(path)
+    with _loaded_models_lock:
+        if path in _loaded_models and _loaded_models[path][0] == mtime:
+            _loaded_models.move_to_end(path)
+            return _loaded_models[path][1]
+    logger.debug("Loading model {}".format(path))
+    with open(path, 'rb') as model_file:
+        model = pickle.load(model_file)
+    with _loaded_models_lock:
+        # Replaces the older version of the file, if any
+        _loaded_models[path] = (mtime, model)
+        _loaded_models.move_to_end(path)
+        while len(_loaded_models) > max_loaded_models:
+            _loaded_models.popitem(last=False)
+    return model
@@ -29,15 +29,56 @@ def parse_args(req_config_file=True):
     #                metavar='<job_id>',
     #                help='Job id number or string for batching',
     #                required=False)
-    # p.add_argument('-s','--seed',
-    #                metavar='<seed>',
-    #                help='Add random seed number to file',
-    #                required=False)
     # p.add_argument('-nas','--noautoseed',
     #                action='store_false',
     #                default=True,
     #                help='Generate the seed based on the current time in ms',
     #                required=False)
+    p.add_argument('--ensemble',
+                   metavar='<N>',
+                   type=int,
+                   default=0,
+                   help='Run N independent copies of the processors chain (ensemble mode)')
+    p.add_argument('-j', '--jobs',
+                   metavar='<K>',
+                   type=int,
+                   default=1,
+                   help='Number of processes used to run the copies of an ensemble or to compile the models (--precompile) (Default: 1)')
+    p.add_argument('-s', '--seed',
+                   metavar='<seed>',
+                   type=int,
+                   default=None,
+                   help='Base random seed of the ensemble: copy i uses seed+i')
+    p.add_argument('--no-cache',
+                   action='store_true',
+                   default=False,
+                   help='Do not use the result cache (processors-toolbox.cache)')
+    p.add_argument('--invalidate',
+                   metavar='<processor>',
+                   action='append',
+                   default=[],
+                   help='Remove the cached results of a processor (can be used several times)')
+    p.add_argument('--checkpoint',
+                   metavar='<directory>',
+                   default=None,
+                   help='Save the outputs of each processor in a checkpoint directory')
+    p.add_argument('--resume',
+                   action='store_true',
+                   default=False,
+                   help='Resume the chain from the first processor which did not complete')
+    p.add_argument('--report',
+                   metavar='<file>',
+                   default=None,
+                   help='Write a JSON report of the time and memory used by the processors')
+    p.add_argument('--cpus',
+                   metavar='<N>',
+                   type=int,
+                   default=None,
+                   help='Number of cores shared by the samplers (Default: cgroup quota, CPU affinity or OMP_NUM_THREADS)')
+    p.add_argument('--precompile',
+                   action='store_true',
+                   default=False,
+                   help='Compile the models of the processors (e.g. Stan models) into their cache and exit')
     p.add_argument('param', nargs='*',
                    default=False,
                    help='Manualy change of a parameter and its value')
@@ -4,7 +4,8 @@ Authors: J. Johnston, M. Guigue, T. Weiss
 Date: 06/26/18
 '''
 
-from morpho.utilities import morphologging, stanConvergenceChecker
+from morpho.utilities import morphologging, reader, stanConvergenceChecker
+from morpho.utilities.results import post_warmup
 logger = morphologging.getLogger(__name__)
 
 try:
@@ -187,7 +188,7 @@ def _fill_hist_grid(input_dict, name_grid,
     '''
     rows, cols = len(name_grid), len(name_grid[0])
     hist_grid = [[None]*cols for i in range(rows)]
-    warmup = input_dict["is_sample"].count(0)
+    samples = post_warmup(input_dict)
     # tree = myfile.Get(input_tree)
     # n = tree.GetEntries()
     # n = len(input_dict[list(input_dict.keys())[0]])
@@ -200,8 +201,8 @@ def _fill_hist_grid(input_dict, name_grid,
                 # tree.GetEntry(i)
                 # list_dataY.append(getattr(tree, names[0]))
                 # list_dataX.append(getattr(tree, names[1]))
-                list_dataY = input_dict[names[0]][warmup:]
-                list_dataX = input_dict[names[1]][warmup:]
+                list_dataY = reader.get_variable(samples, names[0])
+                list_dataX = reader.get_variable(samples, names[1])
                 histo = _get2Dhisto(list_dataX, list_dataY, [nbins_x, nbins_y],
                                     [0, 0], '{}_{}'.format(names[0], names[1]))
                 histo.SetTitle("")
@@ -213,7 +214,7 @@ def _fill_hist_grid(input_dict, name_grid,
                 # for i in range(0,n):
                 # tree.GetEntry(i)
                 # list_data.append(getattr(tree, names[0]))
-                list_data = input_dict[names[0]][warmup:]
+                list_data = reader.get_variable(samples, names[0])
                 x_range = _autoRangeList(list_data)
                 histo = ROOT.TH1F("%s_%i_%i" % (names[0], r, c), names[0],
                                   nbins_x, x_range[0], x_range[1])
@@ -237,12 +238,12 @@ def _fill_hist_grid_divergence(input_dict, name_grid,
     '''
     rows, cols = len(name_grid), len(name_grid[0])
     hist_grid = [[None]*cols for i in range(rows)]
-    warmup = input_dict["is_sample"].count(0)
+    samples = post_warmup(input_dict)
     for r, row in enumerate(name_grid):
         for c, names in enumerate(row):
             if (names is not None and len(names) == 2):
-                list_dataY = input_dict[names[0]][warmup:]
-                list_dataX = input_dict[names[1]][warmup:]
+                list_dataY = reader.get_variable(samples, names[0])
+                list_dataX = reader.get_variable(samples, names[1])
                 y_div0, y_div1 = stanConvergenceChecker.partition_div(input_dict, names[0])
                 x_div0, x_div1 = stanConvergenceChecker.partition_div(input_dict, names[1])
                 if(len(x_div0)>0):
@@ -264,7 +265,7 @@ def _fill_hist_grid_divergence(input_dict, name_grid,
                 hist_grid[r][c] = (histo_div0, histo_div1)
             elif (names is not None and len(names) == 1):
                 list_data = []
-                list_data = input_dict[names[0]][warmup:]
+                list_data = reader.get_variable(samples, names[0])
                 x_range = _autoRangeList(list_data)
                 histo = ROOT.TH1F("%s_%i_%i" % (names[0], r, c), names[0],
                                   nbins_x, x_range[0], x_range[1])
@@ -4,59 +4,174 @@ Authors: M. Guigue
 Date: 06/26/18
 '''
 
+import itertools
+import re
+from collections import OrderedDict
+
+import numpy
+
 from morpho.utilities import morphologging
+from morpho.utilities.results import Results, flatten_draws
 logger = morphologging.getLogger(__name__)
 
+diagnosticVariableName = ['accept_stat__', 'stepsize__',
+                          'n_leapfrog__', 'treedepth__', 'divergent__', 'energy__']
+
 
 def extract_data_from_outputdata(conf, theOutput):
-    # Extract the data into a dictionary
+    '''
+    Extract the samples of the parameters of interest, the sampler diagnostics,
+    lp_prob, delta_energy__ and is_sample into a Results (numpy arrays: the warmup
+    draws of the chains, then the draws after the warmup of the chains)
+    '''
     logger.debug("Extracting samples from pyStan output")
     theOutputDiagnostics = theOutput.get_sampler_params(inc_warmup=conf['inc_warmup'])
-    diagnosticVariableName = ['accept_stat__', 'stepsize__',
-                              'n_leapfrog__', 'treedepth__', 'divergent__', 'energy__']
+    # Array of shape (draws, chains, flatnames + lp__)
     theOutputData = theOutput.extract(permuted=False, inc_warmup=conf['inc_warmup'])
+    nEventsPerChain = theOutputData.shape[0]
+    nChains = conf['chains']
+    nWarmup = 0
+    if conf['inc_warmup']:
+        # Number of warmup draws kept (one in thin)
+        thin = conf.get('thin', 1)
+        nWarmup = min((conf['warmup'] + thin - 1) // thin, nEventsPerChain)
 
     logger.debug("Transformation into a dict")
-    nEventsPerChain = len(theOutputData)
-    # get the variables in the Stan4Model
-    flatnames = theOutput.flatnames
-    # add the diagnostic variable names
-    flatnames.extend(diagnosticVariableName)
-    # make list of desired variables
-    desired_var = []
-    for a_name in flatnames:
+    flatnames, model_pars, par_dims = output_names(theOutput)
+    theOutputDataDict = {}
+    # Array parameters: one (n_draws, *shape) array instead of one entry per element
+    array_params = conf.get('array_params', False)
+    if array_params is True:
+        array_params = conf['interestParams']
+    array_columns = set()
+    if array_params:
+        offset = 0
+        for name, dims in zip(model_pars, par_dims):
+            size = int(numpy.prod(dims))
+            if name in array_params and len(dims) > 0:
+                theOutputDataDict[str(name)] = _concatenate_chains_array(
+                    theOutputData[:, :nChains, offset:offset+size], dims, nWarmup)
+                array_columns.update(range(offset, offset+size))
+            offset += size
+    for iKey, key in enumerate(flatnames):
+        if iKey in array_columns:
+            continue
         for a_key in conf['interestParams']:
             # this means the desired var is a list
-            if a_name.startswith(a_key+'[') or a_name == a_key:
-                desired_var.append(a_name)
-
-    # Clustering the data together
-    theOutputDataDict = {}
-    for key in desired_var:
-        theOutputDataDict.update({str(key): []})
+            if key.startswith(a_key+'[') or key == a_key:
+                theOutputDataDict[str(key)] = _concatenate_chains(theOutputData[:, :nChains, iKey], nWarmup)
+                break
     for key in diagnosticVariableName:
-        theOutputDataDict.update({str(key): []})
-    theOutputDataDict.update({"lp_prob": []})
-    theOutputDataDict.update({"delta_energy__": []})
-    theOutputDataDict.update({"is_sample": []})
-
-    for iChain in range(0, conf['chains']):
-        for iEvents in range(0, nEventsPerChain):
-            for iKey, key in enumerate(flatnames):
-                if key in diagnosticVariableName:
-                    theOutputDataDict[str(key)].append(
-                        theOutputDiagnostics[iChain][key][iEvents])
-                else:
-                    if key in desired_var:
-                        theOutputDataDict[str(key)].append(
-                            theOutputData[iEvents][iChain][iKey])
-            if iEvents is not 0:
-                theOutputDataDict["delta_energy__"].append(
-                    theOutputDiagnostics[iChain]['energy__'][iEvents]-theOutputDiagnostics[iChain]['energy__'][iEvents-1])
-            else:
-                theOutputDataDict["delta_energy__"].append(0)
-            theOutputDataDict["lp_prob"].append(
-                theOutputData[iEvents][iChain][len(theOutput.flatnames)])
-            theOutputDataDict["is_sample"].append(
-                0 if iEvents < conf['warmup'] else 1)
-    return theOutputDataDict
+        # The Fixed_param sampler has no NUTS diagnostics
+        if key in theOutputDiagnostics[0]:
+            theOutputDataDict[key] = flatten_draws(numpy.stack(
+                [numpy.asarray(theOutputDiagnostics[iChain][key]) for iChain in range(nChains)]), nWarmup)
+    theOutputDataDict["lp_prob"] = _concatenate_chains(theOutputData[:, :nChains, len(flatnames)], nWarmup)
+    if "energy__" in theOutputDataDict:
+        energy = numpy.stack([numpy.asarray(theOutputDiagnostics[iChain]["energy__"]) for iChain in range(nChains)])
+        theOutputDataDict["delta_energy__"] = delta_energy(energy, nWarmup)
+    is_sample = numpy.ones((nChains, nEventsPerChain), dtype=int)
+    is_sample[:, :nWarmup] = 0
+    theOutputDataDict["is_sample"] = flatten_draws(is_sample, nWarmup)
+    dtype = conf.get('results_dtype', None)
+    if dtype is not None:
+        for key, value in theOutputDataDict.items():
+            if value.dtype.kind == 'f':
+                theOutputDataDict[key] = value.astype(dtype, copy=False)
+    return Results(theOutputDataDict, n_chains=nChains)
+
+
+def output_names(theOutput):
+    '''
+    Flat names, parameters and dimensions of the extracted columns of a fit:
+    only the parameters kept when pystan was given pars
+    '''
+    sim = getattr(theOutput, "sim", None)
+    if isinstance(sim, dict) and "fnames_oi" in sim:
+        flatnames = [name for name in sim["fnames_oi"] if name != "lp__"]
+        pars = [(name, dims) for name, dims in zip(sim["pars_oi"], sim["dims_oi"]) if name != "lp__"]
+        return flatnames, [name for name, _ in pars], [list(dims) for _, dims in pars]
+    return list(theOutput.flatnames), list(theOutput.model_pars), list(theOutput.par_dims)
+
+
+def delta_energy(energy, n_warmup=0):
+    '''
+    Column delta_energy__ (difference of energy with the previous draw of the chain)
+    from the energy of shape (chains, draws)
+    '''
+    delta = numpy.zeros_like(energy)
+    delta[:, 1:] = numpy.diff(energy, axis=1)
+    return flatten_draws(delta, n_warmup)
+
+
+def _concatenate_chains(draws, n_warmup=0):
+    # (draws, chains) -> warmup draws of the first chain, of the second..., then the other draws
+    return flatten_draws(draws.T, n_warmup)
+
+
+def _concatenate_chains_array(draws, dims, n_warmup=0):
+    # (draws, chains, elements in column-major order) -> (draws x chains, *dims)
+    draws = draws.reshape(draws.shape[:2] + tuple(reversed(dims)))
+    draws = draws.transpose([1, 0] + list(range(len(dims) + 1, 1, -1)))
+    return flatten_draws(draws, n_warmup)
+
+
+def extract_data_from_draws(conf, draws, lp_prob=None):
+    '''
+    Results (a single chain, no warmup) of the draws of an approximate method:
+    draws is a dictionary flat name (e.g. "b[0,1]") -> values of the draws
+    '''
+    array_params = conf.get('array_params', False)
+    if array_params is True:
+        array_params = conf['interestParams']
+    theOutputDataDict = OrderedDict()
+    array_elements = dict()
+    for key, values in draws.items():
+        if not any(key.startswith(a_key+'[') or key == a_key for a_key in conf['interestParams']):
+            continue
+        name, _, index = key.partition('[')
+        if index and array_params and name in array_params:
+            # Array parameter: its elements are gathered below
+            theOutputDataDict.setdefault(name, None)
+            array_elements.setdefault(name, []).append(
+                (tuple(int(i) for i in index.rstrip(']').split(',')), values))
+        else:
+            theOutputDataDict[str(key)] = numpy.asarray(values, dtype=float)
+    n_draws = len(next(iter(draws.values()))) if len(draws) > 0 else 0
+    for name, elements in array_elements.items():
+        dims = tuple(max(index[i] for index, _ in elements) + 1 for i in range(len(elements[0][0])))
+        array = numpy.empty((n_draws,) + dims)
+        for index, values in elements:
+            array[(slice(None),) + index] = values
+        theOutputDataDict[name] = array
+    theOutputDataDict["lp_prob"] = numpy.zeros(n_draws) if lp_prob is None else numpy.asarray(lp_prob, dtype=float)
+    theOutputDataDict["is_sample"] = numpy.ones(n_draws, dtype=int)
+    return Results(theOutputDataDict, n_chains=1)
+
+
+def flatten_values(values):
+    '''
+    Flat names (elements of the arrays in column-major order, as the flatnames of a fit)
+    of a dictionary parameter -> values of shape (n_draws, *dims)
+    '''
+    flat = OrderedDict()
+    for name, value in values.items():
+        value = numpy.asarray(value, dtype=float)
+        dims = value.shape[1:]
+        if len(dims) == 0:
+            flat[name] = value
+            continue
+        for index in itertools.product(*[range(dim) for dim in reversed(dims)]):
+            index = tuple(reversed(index))
+            flat["{}[{}]".format(name, ",".join(str(i) for i in index))] = value[(slice(None),) + index]
+    return flat
+
+
+def zero_based_name(name):
+    '''
+    Flat name of a Stan output name (1-based indices, "b.1.2" or "b[1,2]"), e.g. "b[0,1]"
+    '''
+    parts = re.split(r'[\.\[\],]+', name.strip(']'))
+    if len(parts) == 1:
+        return name
+    return "{}[{}]".format(parts[0], ",".join(str(int(i) - 1) for i in parts[1:]))
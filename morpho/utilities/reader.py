@@ -4,6 +4,8 @@ Authors: J. Johnston, M. Guigue, T. Weiss
 Date: 06/26/18
 '''
 
+import numpy
+
 from morpho.utilities import morphologging
 logger = morphologging.getLogger(__name__)
 
@@ -25,6 +27,20 @@ def read_param(yaml_data, node, default):
     return data
 
 
+def get_variable(data, name):
+    '''
+    Returns data[name]; if there is no such variable, an element "x[i]" (or "x[i,j]")
+    of an array variable x of shape (n, *shape) is returned as the array x[:, i, j].
+    '''
+    if name in data:
+        return data[name]
+    base, _, indices = name.partition("[")
+    if indices.endswith("]") and base in data:
+        index = tuple(int(i) for i in indices[:-1].replace("][", ",").split(","))
+        return numpy.asarray(data[base])[(slice(None),) + index]
+    raise KeyError(name)
+
+
 def add_dict_param(dictionary, key, value):
     '''
     This method checks if a key already exists in a dictionary,
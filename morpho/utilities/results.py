@@ -0,0 +1,209 @@
+'''
+Results class: columns of draws (numpy arrays) with their chain and draw indices
+Authors: agent
+Date: 10/18/26
+'''
+
+import numpy
+
+from morpho.utilities import morphologging
+logger = morphologging.getLogger(__name__)
+
+
+class Results(dict):
+    '''
+    Dictionary of columns (numpy arrays with one row per draw) with the "chain" and
+    "draw" index columns, so that it can be used wherever a dictionary of lists is expected.
+    The rows are stored chain-major in two blocks: the warmup draws of all the chains
+    (chains x warmup draws), then the draws after the warmup of all the chains (chains x draws).
+    The selections (post_warmup(), warmup(), columns(names)) are thus slices of the arrays
+    (no copy) whatever the number of chains; chain(i) is a slice if there is no warmup.
+    draws(key) gives a column with the shape (chains, draws, ...).
+    In batch mode (see stack), the columns other than the index columns have an
+    additional first axis (dataset).
+
+    Parameters:
+        columns: dictionary of columns
+        n_chains: number of chains (the "chain" and "draw" columns are added)
+        batch: the columns other than the index columns have a first axis (dataset)
+    '''
+
+    index_columns = ["chain", "draw", "is_sample"]
+
+    def __init__(self, columns=None, n_chains=None, batch=False):
+        super().__init__()
+        self.batch = batch
+        if columns is not None:
+            for key, value in columns.items():
+                self[key] = numpy.asarray(value) if isinstance(value, (list, tuple)) else value
+        if n_chains is not None and "chain" not in self:
+            n_warmup = self.n_warmup_rows // n_chains
+            n_draws = (self.n_rows - self.n_warmup_rows) // n_chains
+            self["chain"] = numpy.concatenate([numpy.repeat(numpy.arange(n_chains), n_warmup),
+                                               numpy.repeat(numpy.arange(n_chains), n_draws)])
+            self["draw"] = numpy.concatenate([numpy.tile(numpy.arange(n_warmup), n_chains),
+                                              numpy.tile(n_warmup + numpy.arange(n_draws), n_chains)])
+
+    @property
+    def n_rows(self):
+        for key in self.index_columns:
+            if key in self:
+                return len(self[key])
+        for value in self.values():
+            if numpy.ndim(value) > int(self.batch):
+                return numpy.shape(value)[int(self.batch)]
+        return 0
+
+    @property
+    def n_chains(self):
+        if "chain" not in self:
+            return 1
+        return len(numpy.unique(self["chain"]))
+
+    @property
+    def n_warmup_rows(self):
+        '''
+        Number of warmup draws (of all the chains)
+        '''
+        if "is_sample" not in self:
+            return 0
+        return int(numpy.count_nonzero(numpy.asarray(self["is_sample"]) == 0))
+
+    def chain(self, i_chain):
+        '''
+        Draws of a chain
+        '''
+        if "chain" not in self:
+            return self._Select(slice(None))
+        return self._Select(_rows(numpy.asarray(self["chain"]) == i_chain))
+
+    def post_warmup(self):
+        '''
+        Draws after the warmup (is_sample == 1) of all the chains
+        '''
+        return self._Select(self._Block(True))
+
+    def warmup(self):
+        '''
+        Warmup draws (is_sample == 0) of all the chains
+        '''
+        return self._Select(self._Block(False))
+
+    def columns(self, names):
+        '''
+        Projection on the columns given (and the index columns)
+        '''
+        return self.with_columns({key: value for key, value in self.items()
+                                  if key in names or key in self.index_columns})
+
+    def draws(self, key):
+        '''
+        Column key with the shape (chains, draws, ...) (after the dataset axis in batch mode):
+        a view if the Results only contains warmup draws or draws after the warmup
+        (e.g. post_warmup()), a copy otherwise
+        '''
+        value = numpy.asarray(self[key])
+        axis = 1 if self._IsBatched(key, value) else 0
+        n_chains = self.n_chains
+        blocks = [block.reshape(block.shape[:axis] + (n_chains, -1) + block.shape[axis+1:])
+                  for block in numpy.split(value, [self.n_warmup_rows], axis=axis)
+                  if block.shape[axis] > 0]
+        if len(blocks) == 0:
+            return value
+        if len(blocks) == 1:
+            return blocks[0]
+        return numpy.concatenate(blocks, axis=axis+1)
+
+    def with_columns(self, columns):
+        '''
+        Results with the layout of this one (batch mode) and the columns given
+        '''
+        return Results(columns, batch=self.batch)
+
+    def _Block(self, sample):
+        n_warmup = self.n_warmup_rows
+        if "is_sample" in self:
+            is_sample = numpy.asarray(self["is_sample"])
+            if numpy.any(is_sample[:n_warmup]):
+                # Rows not stored in blocks (e.g. a dictionary of lists): selected one by one
+                return _rows((is_sample != 0) == sample)
+        return slice(n_warmup, None) if sample else slice(0, n_warmup)
+
+    def _IsBatched(self, key, value):
+        return self.batch and key not in self.index_columns and numpy.ndim(value) > 1
+
+    def _Select(self, rows):
+        n_rows = self.n_rows
+        selected = dict()
+        for key, value in self.items():
+            if self._IsBatched(key, value) and numpy.shape(value)[1] == n_rows:
+                selected[key] = numpy.asarray(value)[:, rows]
+            elif numpy.ndim(value) > 0 and len(value) == n_rows:
+                selected[key] = numpy.asarray(value)[rows]
+            else:
+                selected[key] = value
+        return self.with_columns(selected)
+
+
+def _rows(mask):
+    # Slice (view) if the selected rows are contiguous, indices (copy) otherwise
+    indices = numpy.flatnonzero(mask)
+    if len(indices) == 0:
+        return slice(0, 0)
+    if indices[-1] - indices[0] + 1 == len(indices):
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
+
+
+def flatten_draws(draws, n_warmup=0):
+    '''
+    Column of a Results from an array of shape (chains, draws, ...)
+    whose n_warmup first draws of each chain are warmup draws
+    '''
+    draws = numpy.asarray(draws)
+    return numpy.concatenate([draws[:, :n_warmup].reshape((-1,) + draws.shape[2:]),
+                              draws[:, n_warmup:].reshape((-1,) + draws.shape[2:])])
+
+
+def concatenate_draws(results_list):
+    '''
+    Joins the Results of successive runs of the same chains:
+    the draws of each chain are put one after the other
+    '''
+    n_chains = results_list[0].n_chains
+    blocks = [[results.warmup() for results in results_list],
+              [results.post_warmup() for results in results_list]]
+    joined = dict()
+    for key in results_list[0]:
+        if key in ("chain", "draw"):
+            continue
+        parts = []
+        for block in blocks:
+            per_chain = [part.draws(key) for part in block if part.n_rows > 0]
+            if len(per_chain) > 0:
+                parts.append(flatten_draws(numpy.concatenate(per_chain, axis=1)))
+        joined[key] = numpy.concatenate(parts)
+    return Results(joined, n_chains=n_chains)
+
+
+def stack(results_list):
+    '''
+    Results of a batch of fits with the same configuration: the index columns
+    of the first fit, the other columns stacked along a first axis (dataset)
+    '''
+    columns = dict()
+    for key, value in results_list[0].items():
+        if key in Results.index_columns:
+            columns[key] = value
+        else:
+            columns[key] = numpy.stack([results[key] for results in results_list])
+    return Results(columns, batch=True)
+
+
+def post_warmup(data):
+    '''
+    Draws after the warmup of a Results or of a dictionary of lists with an is_sample column
+    '''
+    if not isinstance(data, Results):
+        data = Results(data)
+    return data.post_warmup()
@@ -0,0 +1,426 @@
+'''
+Server class: long-lived process running processors chains for clients
+Authors: agent
+Date: 10/18/26
+'''
+
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from argparse import ArgumentParser, Namespace
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+
+from morpho.utilities import morphologging, cpubudget
+logger = morphologging.getLogger(__name__)
+
+default_socket = "morpho.sock"
+
+
+class Server:
+    '''
+    Keeps a pool of worker processes where the processors (and ROOT, pystan...)
+    are already imported and the compiled Stan models stay loaded between jobs.
+    Jobs are received on a Unix socket (see submit) and/or from a spool directory:
+    the configuration files copied into the spool directory are run, then moved
+    into spool/done or spool/failed with a .result.json file.
+    If a worker process dies (e.g. crash of a compiled model, out of memory), the
+    jobs it was running fail and the pool of workers is started again.
+
+    Parameters:
+        socket_path: path of the Unix socket (None: no socket)
+        spool: path of the spool directory (None: no spool)
+        n_workers: number of worker processes (default=1)
+        preload: processors or modules imported before starting the workers
+            (default: all the registered processors)
+        poll: period (in s) of the spool directory polling (default=1)
+    '''
+
+    def __init__(self, socket_path=None, spool=None, n_workers=1, preload=None, poll=1.):
+        self.socket_path = socket_path
+        self.spool = spool
+        self.n_workers = max(int(n_workers), 1)
+        self.preload = preload
+        self.poll = float(poll)
+        self._job_counter = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._executor = None
+        self._socket_server = None
+
+    def Start(self):
+        '''
+        Import the processors and start the worker processes
+        '''
+        _Preload(self.preload)
+        self._StartWorkers()
+        if self.spool is not None:
+            for subdir in ["", "running", "done", "failed"]:
+                path = os.path.join(self.spool, subdir)
+                if not os.path.exists(path):
+                    os.makedirs(path)
+                    logger.debug("Creating folder: {}".format(path))
+        if self.socket_path is not None:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self._socket_server = _SocketServer(self.socket_path, _RequestHandler)
+            self._socket_server.morpho_server = self
+            threading.Thread(target=self._socket_server.serve_forever, daemon=True).start()
+            logger.info("Listening on {}".format(self.socket_path))
+
+    def Serve(self):
+        '''
+        Start and run until Stop is called (or Ctrl-C, SIGTERM)
+        '''
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self._stop.set())
+        self.Start()
+        try:
+            while not self._stop.is_set():
+                if self.spool is not None:
+                    self._PollSpool()
+                self._stop.wait(self.poll)
+        except KeyboardInterrupt:
+            logger.info("Interrupted")
+        finally:
+            self.Stop()
+        return True
+
+    def Stop(self):
+        self._stop.set()
+        if self._socket_server is not None:
+            self._socket_server.shutdown()
+            self._socket_server.server_close()
+            self._socket_server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        logger.info("Server stopped")
+
+    def Submit(self, request):
+        '''
+        Submit a job request ({"config", "cwd", "options"}) to the workers;
+        returns a future of the job result
+        '''
+        with self._lock:
+            self._job_counter += 1
+            job_id = self._job_counter
+            executor = self._executor
+        logger.info("Job {} submitted".format(job_id))
+        try:
+            future = executor.submit(_RunJob, job_id, request)
+        except BrokenProcessPool:
+            # A worker died since the last job finished
+            executor = self._RestartWorkers(executor)
+            future = executor.submit(_RunJob, job_id, request)
+        future.job_id = job_id
+        future.add_done_callback(lambda a_future: self._CheckWorkers(a_future, executor))
+        return future
+
+    def _StartWorkers(self):
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = None
+        executor = futures.ProcessPoolExecutor(max_workers=self.n_workers,
+                                               mp_context=context,
+                                               initializer=_InitWorker,
+                                               initargs=(self.preload, cpubudget.share(self.n_workers)))
+        # Start all the workers now rather than at the first job
+        for a_future in [executor.submit(time.sleep, 0.1) for _ in range(self.n_workers)]:
+            a_future.result()
+        logger.info("{} workers ready".format(self.n_workers))
+        self._executor = executor
+        return executor
+
+    def _RestartWorkers(self, broken_executor):
+        '''
+        Replace a broken pool of workers (once, whatever the number of jobs which failed)
+        '''
+        with self._lock:
+            if self._executor is not broken_executor or self._stop.is_set():
+                return self._executor
+            logger.warning("A worker process died: starting the workers again")
+            broken_executor.shutdown(wait=False)
+            return self._StartWorkers()
+
+    def _CheckWorkers(self, future, executor):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            logger.error("Job {} failed: its worker process died".format(future.job_id))
+            self._RestartWorkers(executor)
+
+    def _PollSpool(self):
+        for filename in sorted(os.listdir(self.spool)):
+            path = os.path.join(self.spool, filename)
+            if not os.path.isfile(path) or not filename.endswith((".json", ".yaml")):
+                continue
+            running_path = os.path.join(self.spool, "running", filename)
+            os.replace(path, running_path)
+            try:
+                request = _ReadSpoolFile(running_path)
+            except Exception as err:
+                logger.error("Cannot read {}:\n{}".format(running_path, err))
+                self._DoneSpool(running_path, {"success": False, "error": str(err)})
+                continue
+            future = self.Submit(request)
+            future.add_done_callback(
+                lambda a_future, a_path=running_path: self._DoneSpool(a_path, _JobResult(a_future)))
+
+    def _DoneSpool(self, running_path, result):
+        folder = "done" if result["success"] else "failed"
+        filename = os.path.basename(running_path)
+        done_path = os.path.join(self.spool, folder, filename)
+        shutil.move(running_path, done_path)
+        with open(os.path.splitext(done_path)[0] + ".result.json", 'w') as result_file:
+            json.dump(result, result_file, indent=4)
+
+
+class _SocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Reads one job request (json line) and answers with the job result (json line)
+    '''
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            result = _JobResult(self.server.morpho_server.Submit(request))
+        except Exception as err:
+            result = {"success": False, "error": str(err)}
+        self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+
+
+def _JobResult(future):
+    try:
+        return future.result()
+    except Exception as err:
+        return {"job": getattr(future, "job_id", None), "success": False, "error": str(err)}
+
+
+def _InitWorker(preload=None, n_cpus=None):
+    '''
+    Workers ignore Ctrl-C: the server stops them once the running jobs are done.
+    Each worker gets its share (n_cpus) of the CPU budget of the server.
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if n_cpus is not None:
+        cpubudget.init_worker(n_cpus)
+    _Preload(preload)
+
+
+def _Preload(preload=None):
+    '''
+    Import the processors (all the registered ones by default) and modules
+    '''
+    from morpho.processors import registry
+    if preload is None:
+        preload = registry.names()
+    for name in preload:
+        try:
+            if registry.get_path(name) is not None:
+                registry.load(name)
+            else:
+                importlib.import_module(name)
+            logger.debug("<{}> loaded".format(name))
+        except BaseException as err:
+            logger.debug("Cannot load <{}>: {}".format(name, err))
+
+
+def _ReadSpoolFile(path):
+    if path.endswith(".yaml"):
+        import yaml
+        with open(path, 'r') as spool_file:
+            content = yaml.safe_load(spool_file)
+    else:
+        with open(path, 'r') as spool_file:
+            content = json.load(spool_file)
+    if "processors-toolbox" in content:
+        # A plain configuration file: relative paths are relative to the server directory
+        return {"config": content, "cwd": os.getcwd(), "options": dict()}
+    return content
+
+
+def _RunJob(job_id, request):
+    '''
+    Run a processors chain in a worker process
+    '''
+    from morpho.utilities import toolbox
+    start = time.time()
+    os.chdir(request.get("cwd", os.getcwd()))
+    options = dict(request.get("options", dict()))
+    options["param"] = False
+    try:
+        success = toolbox.ToolBox(Namespace(**options), request["config"]).Run()
+        error = None
+    except Exception as err:
+        logger.error("Job {} failed:\n{}".format(job_id, traceback.format_exc()))
+        success = False
+        error = str(err)
+    duration = time.time() - start
+    logger.info("Job {} done in {:.3f} s (success: {})".format(job_id, duration, success))
+    return {"job": job_id, "success": bool(success), "duration": duration, "error": error}
+
+
+def make_request(args):
+    '''
+    Job request built from the arguments of morpho submit
+    '''
+    from morpho.utilities import toolbox
+    config_dict = toolbox.ToolBox(args).config_dict
+    return {
+        "config": config_dict,
+        "cwd": os.getcwd(),
+        "options": {
+            "no_cache": args.no_cache,
+            "invalidate": args.invalidate,
+            "resume": args.resume
+        }
+    }
+
+
+def submit(request, socket_path=default_socket):
+    '''
+    Send a job request to a server and wait for its result
+    '''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with client.makefile('rb') as answer:
+            return json.loads(answer.readline().decode("utf-8"))
+    finally:
+        client.close()
+
+
+def spool(request, spool_dir):
+    '''
+    Put a job request in a spool directory; returns its path
+    '''
+    filename = "job-{}-{}.json".format(int(time.time()*1e6), os.getpid())
+    path = os.path.join(spool_dir, filename)
+    # Written under another name so that the server never reads an incomplete file
+    with open(path + ".tmp", 'w') as spool_file:
+        json.dump(request, spool_file)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def parse_args(argv):
+    '''
+    Parse the arguments of morpho serve and morpho submit
+    '''
+    p = ArgumentParser(prog="morpho", description='''
+        Run processors chains in a long-lived server.
+    ''')
+    commands = p.add_subparsers(dest="command")
+    serve = commands.add_parser("serve", help="Start a server")
+    serve.add_argument('--socket',
+                       metavar='<path>',
+                       default=None,
+                       help='Unix socket listened to (Default: {} if no spool is given)'.format(default_socket))
+    serve.add_argument('--spool',
+                       metavar='<directory>',
+                       default=None,
+                       help='Spool directory where configuration files are dropped')
+    serve.add_argument('-j', '--jobs',
+                       metavar='<K>',
+                       type=int,
+                       default=1,
+                       help='Number of worker processes (Default: 1)')
+    serve.add_argument('--cpus',
+                       metavar='<N>',
+                       type=int,
+                       default=None,
+                       help='Number of cores shared by the workers (Default: cgroup quota, CPU affinity or OMP_NUM_THREADS)')
+    serve.add_argument('--preload',
+                       metavar='<name>',
+                       nargs='*',
+                       default=None,
+                       help='Processors or modules to import in advance (Default: all processors)')
+    submit_p = commands.add_parser("submit", help="Submit a configuration file to a server")
+    submit_p.add_argument('-c', '--config',
+                          metavar='<configuration file>',
+                          required=True,
+                          help='Full path to the configuration file used by morpho')
+    submit_p.add_argument('--socket',
+                          metavar='<path>',
+                          default=default_socket,
+                          help='Unix socket of the server (Default: {})'.format(default_socket))
+    submit_p.add_argument('--spool',
+                          metavar='<directory>',
+                          default=None,
+                          help='Put the job in a spool directory instead (do not wait)')
+    submit_p.add_argument('--no-cache',
+                          action='store_true',
+                          default=False,
+                          help='Do not use the result cache (processors-toolbox.cache)')
+    submit_p.add_argument('--invalidate',
+                          metavar='<processor>',
+                          action='append',
+                          default=[],
+                          help='Remove the cached results of a processor')
+    submit_p.add_argument('--checkpoint',
+                          metavar='<directory>',
+                          default=None,
+                          help='Save the outputs of each processor in a checkpoint directory')
+    submit_p.add_argument('--resume',
+                          action='store_true',
+                          default=False,
+                          help='Resume the chain from the first processor which did not complete')
+    submit_p.add_argument('--report',
+                          metavar='<file>',
+                          default=None,
+                          help='Write a JSON report of the time and memory used by the processors')
+    submit_p.add_argument('param', nargs='*',
+                          default=False,
+                          help='Manualy change of a parameter and its value')
+    for a_parser in [serve, submit_p]:
+        a_parser.add_argument('-v', '--verbosity',
+                              action='count',
+                              help="Increase logger verbosity (Default: 2 -> WARNING )")
+        a_parser.add_argument('-e', '--stderr-verbosity',
+                              action='count',
+                              help="Increase desired level of messages redirected to stderr (Default: 2 -> WARNING )")
+    return p.parse_args(argv)
+
+
+def main(argv):
+    '''
+    Entry point of morpho serve and morpho submit; returns the exit code
+    '''
+    args = parse_args(argv)
+    morphologging.getLogger('morpho',
+                            level=args.verbosity,
+                            stderr_lb=args.stderr_verbosity,
+                            propagate=False)
+    if args.command == "serve":
+        if args.cpus:
+            cpubudget.set_cpus(args.cpus)
+        socket_path = args.socket
+        if socket_path is None and args.spool is None:
+            socket_path = default_socket
+        server = Server(socket_path, args.spool, args.jobs, args.preload)
+        return 0 if server.Serve() else 1
+    request = make_request(args)
+    if args.spool is not None:
+        logger.info("Job spooled: {}".format(spool(request, args.spool)))
+        return 0
+    result = submit(request, args.socket)
+    if not result["success"]:
+        logger.error("Job failed: {}".format(result.get("error")))
+        return 1
+    logger.info("Job {} done in {:.3f} s".format(result["job"], result["duration"]))
+    return 0
@@ -0,0 +1,98 @@
+'''
+Transport of numpy arrays between processes using shared memory blocks
+Authors: agent
+Date: 10/18/26
+'''
+
+from multiprocessing import shared_memory
+
+import numpy
+
+from morpho.utilities import morphologging
+from morpho.utilities.results import Results
+logger = morphologging.getLogger(__name__)
+
+
+class SharedArray:
+    '''
+    Handle on a numpy array stored in a shared memory block.
+    Only the handle is pickled when sent to another process.
+    '''
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+
+    def Attach(self):
+        '''
+        Returns a read-only view of the array (no copy)
+        '''
+        shm = shared_memory.SharedMemory(name=self.name)
+        array = _SharedView(self.shape, dtype=numpy.dtype(self.dtype), buffer=shm.buf)
+        array._shm = shm
+        array.flags.writeable = False
+        return array
+
+
+class _SharedView(numpy.ndarray):
+    '''
+    Array in a shared memory block: the block stays mapped in the process
+    as long as the array or one of its views exists
+    '''
+
+    def __array_finalize__(self, obj):
+        self._shm = getattr(obj, "_shm", None)
+
+    def __reduce__(self):
+        # Pickled (e.g. cached) as a plain array
+        return numpy.array(self).__reduce__()
+
+
+def export_arrays(value, blocks):
+    '''
+    Copy the numpy arrays contained in value (array or dictionary of arrays)
+    into shared memory blocks and returns value where the arrays are replaced
+    by their SharedArray handles.
+    The names of the created blocks are appended to blocks.
+    '''
+    if isinstance(value, numpy.ndarray) and value.dtype != object and value.nbytes > 0:
+        shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        array = numpy.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf)
+        array[...] = value
+        del array
+        shm.close()
+        blocks.append(shm.name)
+        return SharedArray(shm.name, value.shape, value.dtype.str)
+    if isinstance(value, Results):
+        return value.with_columns({key: export_arrays(item, blocks) for key, item in value.items()})
+    if isinstance(value, dict):
+        return {key: export_arrays(item, blocks) for key, item in value.items()}
+    return value
+
+
+def attach_arrays(value):
+    '''
+    Replace the SharedArray handles contained in value by read-only views
+    '''
+    if isinstance(value, SharedArray):
+        return value.Attach()
+    if isinstance(value, Results):
+        return value.with_columns({key: attach_arrays(item) for key, item in value.items()})
+    if isinstance(value, dict):
+        return {key: attach_arrays(item) for key, item in value.items()}
+    return value
+
+
+def free_blocks(blocks):
+    '''
+    Free shared memory blocks: existing views remain valid until they are deleted
+    '''
+    for name in blocks:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+        logger.debug("Shared memory block {} freed".format(name))
@@ -10,6 +10,7 @@ These tests are motivated here:
 http://mc-stan.org/users/documentation/case-studies/pystan_workflow.html
 
 Functions:
+  - diagnose: Compute all the MCMC diagnostics of a fit in one pass
   - check_div: Check how many transitions ended with a divergence
   - check_treedepth: Check how many transitions failed due to tree depth
   - check_energy: Check energy Bayesian fraction of missing information
@@ -25,6 +26,170 @@ try:
 except ImportError:
     pass
 
+from morpho.utilities import reader, convergence, pystanLoader
+from morpho.utilities.results import post_warmup
+
+
+class Diagnostics:
+    '''
+    MCMC diagnostics of a fit (computed by diagnose)
+
+    Attributes:
+        names: names of the variables (flat names and lp__)
+        n_eff: effective sample size of each variable
+        rhat: split R-hat of each variable
+        n_iter: number of draws after the warmup (all the chains)
+        n_divergent: number of transitions ending with a divergence
+        n_max_treedepth: number of transitions saturating the tree depth
+        max_depth: maximum tree depth
+        ebfmi: E-BFMI of each chain
+    '''
+
+    def __init__(self, names, n_eff, rhat, n_iter, n_divergent, n_max_treedepth, max_depth, ebfmi):
+        self.names = list(names)
+        self.n_eff = numpy.asarray(n_eff, dtype=float)
+        self.rhat = numpy.asarray(rhat, dtype=float)
+        self.n_iter = n_iter
+        self.n_divergent = n_divergent
+        self.n_max_treedepth = n_max_treedepth
+        self.max_depth = max_depth
+        self.ebfmi = numpy.asarray(ebfmi, dtype=float)
+
+    @property
+    def low_n_eff(self):
+        '''Variables with n_eff / iter below 0.001'''
+        with numpy.errstate(invalid='ignore'):
+            ratios = self.n_eff / self.n_iter
+        return [(name, ratio) for name, ratio in zip(self.names, ratios) if ratio < 0.001]
+
+    @property
+    def high_rhat(self):
+        '''Variables with Rhat above 1.1 (or not finite)'''
+        return [(name, rhat) for name, rhat in zip(self.names, self.rhat)
+                if not numpy.isfinite(rhat) or rhat > 1.1]
+
+    @property
+    def low_ebfmi(self):
+        '''Chains with E-BFMI below 0.2'''
+        return [(i_chain, ebfmi) for i_chain, ebfmi in enumerate(self.ebfmi) if ebfmi < 0.2]
+
+    def check_div(self):
+        n, N = self.n_divergent, self.n_iter
+        text = '{} of {} iterations ended with a divergence ({}%).'.format(n, N, 100 * n / N)
+        if n > 0:
+            return (True, text + ' Try running with larger adapt_delta to remove the divergences.')
+        return (False, text)
+
+    def check_treedepth(self):
+        n, N = self.n_max_treedepth, self.n_iter
+        text = ('{} of {} iterations saturated the maximum tree depth of {}.'
+                + ' ({}%)').format(n, N, self.max_depth, 100 * n / N)
+        if n > 0:
+            return (True, text + ' Run again with max_depth set to a larger value to avoid saturation.')
+        return (False, text)
+
+    def check_energy(self):
+        if len(self.low_ebfmi) > 0:
+            return (True, 'E-BFMI below 0.2 indicates you may need to reparameterize your model.')
+        return (False, 'E-BFMI indicated no pathological behavior.')
+
+    def check_n_eff(self):
+        if len(self.low_n_eff) > 0:
+            return (True, '  n_eff / iter below 0.001 indicates that the effective sample size has likely been overestimated.')
+        return (False, 'n_eff / iter looks reasonable for all parameters.')
+
+    def check_rhat(self):
+        if len(self.high_rhat) > 0:
+            return (True, 'Rhat above 1.1 indicates that the chains very likely have not mixed.')
+        return (False, 'Rhat looks reasonable for all parameters.')
+
+    def checks(self):
+        '''
+        Whether each check indicates a possible issue
+        '''
+        return {"n_eff": self.check_n_eff()[0],
+                "rhat": self.check_rhat()[0],
+                "divergence": self.check_div()[0],
+                "treedepth": self.check_treedepth()[0],
+                "energy": self.check_energy()[0]}
+
+    @property
+    def warning(self):
+        return any(self.checks().values())
+
+    def text(self):
+        '''
+        Results of the checks (n_eff, Rhat, divergence, tree depth, energy), one per line
+        '''
+        return '\n'.join(check()[1] for check in [self.check_n_eff, self.check_rhat, self.check_div,
+                                                  self.check_treedepth, self.check_energy])
+
+    def details(self):
+        '''
+        Variables and chains failing the checks, one per line
+        '''
+        lines = ['n_eff / iter for parameter {} is {}!'.format(name, ratio) for name, ratio in self.low_n_eff]
+        lines += ['Rhat for parameter {} is {}!'.format(name, rhat) for name, rhat in self.high_rhat]
+        lines += ['Chain {}: E-BFMI = {}'.format(i_chain, ebfmi) for i_chain, ebfmi in self.low_ebfmi]
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        '''
+        Diagnostics as a dictionary (e.g. to be saved in json)
+        '''
+        diagnostics = self.checks()
+        diagnostics["warning"] = self.warning
+        diagnostics["n_iter"] = self.n_iter
+        diagnostics["n_divergent"] = self.n_divergent
+        diagnostics["n_max_treedepth"] = self.n_max_treedepth
+        diagnostics["max_depth"] = self.max_depth
+        diagnostics["ebfmi"] = [_float(ebfmi) for ebfmi in self.ebfmi]
+        diagnostics["n_eff_values"] = {name: _float(n_eff) for name, n_eff in zip(self.names, self.n_eff)}
+        diagnostics["rhat_values"] = {name: _float(rhat) for name, rhat in zip(self.names, self.rhat)}
+        return diagnostics
+
+    def __str__(self):
+        return self.text()
+
+
+def diagnose(fit, max_depth=10):
+    '''Computes all the MCMC diagnostics of a fit in one pass
+
+    The draws and the sampler parameters are extracted once (numpy arrays)
+    and the effective sample size and split Rhat of all the variables are
+    computed together.
+
+    Args:
+        fit: stanfit object containing sampler output
+        max_depth: Maximum depth used to check tree depth
+
+    Returns:
+        Diagnostics
+    '''
+    sampler_params = fit.get_sampler_params(inc_warmup=False)
+    # (draws, chains, flatnames + lp__) -> (chains, draws, flatnames + lp__)
+    draws = numpy.swapaxes(numpy.asarray(fit.extract(permuted=False, inc_warmup=False), dtype=float), 0, 1)
+    flatnames, _, _ = pystanLoader.output_names(fit)
+
+    def sampler_param(key):
+        # (chains, draws)
+        return numpy.array([numpy.asarray(params.get(key, []), dtype=float) for params in sampler_params])
+
+    energy = sampler_param('energy__')
+    ebfmi = []
+    if energy.size > 0:
+        numer = numpy.sum(numpy.diff(energy, axis=1) ** 2, axis=1) / energy.shape[1]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ebfmi = numer / numpy.var(energy, axis=1)
+    return Diagnostics(names=flatnames + ['lp__'],
+                       n_eff=convergence.split_ess(draws),
+                       rhat=convergence.split_rhat(draws),
+                       n_iter=draws.shape[0] * draws.shape[1],
+                       n_divergent=int(numpy.sum(sampler_param('divergent__'))),
+                       n_max_treedepth=int(numpy.sum(sampler_param('treedepth__') == max_depth)),
+                       max_depth=max_depth,
+                       ebfmi=ebfmi)
+
 
 def check_div(fit):
     '''Check how many transitions ended with a divergence
@@ -37,16 +202,7 @@ def check_div(fit):
         divergent, and string stating the number of transitions
         that ended with a divergence
     '''
-    sampler_params = fit.get_sampler_params(inc_warmup=False)
-    divergent = [x for y in sampler_params for x in y['divergent__']]
-    n = sum(divergent)
-    N = len(divergent)
-    if n > 0:
-        return((True, '{} of {} iterations ended with a divergence ({}%).'.format(n, N,
-                                                                                  100 * n / N)+' Try running with larger adapt_delta to remove the divergences.'))
-    else:
-        return((False, '{} of {} iterations ended with a divergence ({}%).'.format(n, N,
-                                                                                   100 * n / N)))
+    return diagnose(fit).check_div()
 
 
 def check_treedepth(fit, max_depth=10):
@@ -64,16 +220,7 @@ def check_treedepth(fit, max_depth=10):
         passed the given max dpeth, and string stating the number
         of transitions that passed the given max_depth.
     '''
-    sampler_params = fit.get_sampler_params(inc_warmup=False)
-    depths = [x for y in sampler_params for x in y['treedepth__']]
-    n = sum(1 for x in depths if x == max_depth)
-    N = len(depths)
-    if n > 0:
-        return((True, ('{} of {} iterations saturated the maximum tree depth of {}.'
-                       + ' ({}%)').format(n, N, max_depth, 100 * n / N)+' Run again with max_depth set to a larger value to avoid saturation.'))
-    else:
-        return((False, ('{} of {} iterations saturated the maximum tree depth of {}.'
-                        + ' ({}%)').format(n, N, max_depth, 100 * n / N)))
+    return diagnose(fit, max_depth).check_treedepth()
 
 
 def check_energy(fit):
@@ -87,20 +234,7 @@ def check_energy(fit):
        and string warning that the model may need to be reparametrized if
        E-BFMI is less than 0.2
     '''
-    sampler_params = fit.get_sampler_params(inc_warmup=False)
-    no_warning = True
-    for chain_num, s in enumerate(sampler_params):
-        energies = s['energy__']
-        numer = sum((energies[i] - energies[i - 1]) **
-                    2 for i in range(1, len(energies))) / len(energies)
-        denom = numpy.var(energies)
-        if numer / denom < 0.2:
-            print('Chain {}: E-BFMI = {}'.format(chain_num, numer / denom))
-            no_warning = False
-    if no_warning:
-        return((False, 'E-BFMI indicated no pathological behavior.'))
-    else:
-        return((True, 'E-BFMI below 0.2 indicates you may need to reparameterize your model.'))
+    return diagnose(fit).check_energy()
 
 
 def check_n_eff(fit):
@@ -113,22 +247,7 @@ def check_n_eff(fit):
         (bool, str): Boolean and string stating whether the
         effective sample size indicates an issue
     '''
-    fit_summary = fit.summary(probs=[0.5])
-    n_effs = [x[4] for x in fit_summary['summary']]
-    names = fit_summary['summary_rownames']
-    n_iter = len(fit.extract()['lp__'])
-
-    no_warning = True
-    for n_eff, name in zip(n_effs, names):
-        ratio = n_eff / n_iter
-        if (ratio < 0.001):
-            print('n_eff / iter for parameter {} is {}!'.format(name, ratio))
-            print('E-BFMI below 0.2 indicates you may need to reparameterize your model.')
-            no_warning = False
-    if no_warning:
-        return((False, 'n_eff / iter looks reasonable for all parameters.'))
-    else:
-        return((True, '  n_eff / iter below 0.001 indicates that the effective sample size has likely been overestimated.'))
+    return diagnose(fit).check_n_eff()
 
 
 def check_rhat(fit):
@@ -141,29 +260,15 @@ def check_rhat(fit):
         (bool, str): Boolean and string stating whether
         the Rhat values indicate an error
     '''
-    from math import isnan
-    from math import isinf
+    return diagnose(fit).check_rhat()
 
-    fit_summary = fit.summary(probs=[0.5])
-    rhats = [x[5] for x in fit_summary['summary']]
-    names = fit_summary['summary_rownames']
 
-    no_warning = True
-    for rhat, name in zip(rhats, names):
-        if (rhat > 1.1 or isnan(rhat) or isinf(rhat)):
-            print('Rhat for parameter {} is {}!'.format(name, rhat))
-            no_warning = False
-    if no_warning:
-        return((False, 'Rhat looks reasonable for all parameters.'))
-    else:
-        return((True, 'Rhat above 1.1 indicates that the chains very likely have not mixed.'))
-
-
-def check_all_diagnostics(fit):
+def check_all_diagnostics(fit, max_depth=10):
     '''Checks all MCMC diagnostics
 
     Args:
         fit: stanfit object containing sampler output
+        max_depth: Maximum depth used to check tree depth
 
     Returns:
         (bool, list of str): Boolean specifying whether any checks indicate
@@ -171,16 +276,13 @@ def check_all_diagnostics(fit):
         checks for divergence, treee depth, energy Bayesian fraction
         of missing energy, effective sample size, and Rhat
     '''
-    n_eff_warn, n_eff_str = check_n_eff(fit)
-    rhat_warn, rhat_str = check_rhat(fit)
-    div_warn, div_str = check_div(fit)
-    treedepth_warn, treedepth_str = check_treedepth(fit)
-    energy_warn, energy_str = check_energy(fit)
-    warn = n_eff_warn or rhat_warn or div_warn or \
-        treedepth_warn or energy_warn
-    check_str = n_eff_str + '\n' + rhat_str + '\n' + div_str + \
-        '\n' + treedepth_str + '\n' + energy_str
-    return((warn, check_str))
+    diagnostics = diagnose(fit, max_depth)
+    return((diagnostics.warning, diagnostics.text()))
+
+
+def _float(value):
+    # json has no nan or inf
+    return float(value) if numpy.isfinite(value) else None
 
 
 def partition_div(fit_results, parameter_name):
@@ -196,9 +298,9 @@ def partition_div(fit_results, parameter_name):
         transitions, the second contains all divergent transitions.
         Warmup iterations are excluded from the returned arrays
     '''
-    warmup = fit_results["is_sample"].count(0)
-    div = numpy.array(fit_results['divergent__'][warmup:]).astype('int')
-    data = numpy.array(fit_results[parameter_name][warmup:])
+    samples = post_warmup(fit_results)
+    div = numpy.array(samples['divergent__']).astype('int')
+    data = numpy.array(reader.get_variable(samples, parameter_name))
     nondiv_params = data[div == 0]
     div_params = data[div == 1]
     return nondiv_params, div_params
@@ -7,8 +7,10 @@ Date: 06/26/18
 '''
 import os
 import importlib
+import time
+from concurrent import futures
 
-from morpho.utilities import morphologging, parser
+from morpho.utilities import morphologging, parser, cache, checkpoint, sharedmemory, memory, instrumentation, cpubudget, background
 logger = morphologging.getLogger(__name__)
 
 
@@ -19,11 +21,32 @@ class ToolBox:
     configure them and how to connect them.
     '''
 
-    def __init__(self, args):
-        self._ReadConfigFile(args.config)
+    def __init__(self, args, config_dict=None):
+        if config_dict is None:
+            self._ReadConfigFile(args.config)
+        else:
+            self.config_dict = config_dict
         self._UpdateConfigFromCLI(args)
         self._processors_dict = dict()
         self._chain_processors = []
+        self._dependencies = dict()
+        self._timing = dict()
+        self._cache = None
+        self._cache_keys = dict()
+        self._output_hashes = dict()
+        self._restored = set()
+        self._checkpoint = None
+        self._resumed = set()
+        self._executor_type = None
+        self._pending_inputs = dict()
+        self._transport_outputs = dict()
+        self._shared_blocks = dict()
+        self._stream_upstreams = dict()
+        self._pipelines = dict()
+        self._streamed = set()
+        self._live_outputs = dict()
+        self._rss = dict()
+        self._stats = dict()
 
     def _ReadConfigFile(self, filename):
         if os.path.exists(filename):
@@ -50,19 +73,34 @@ class ToolBox:
         if "param" in args and args.param:
             self.config_dict = parser.update_from_arguments(
                 self.config_dict, args.param)
+        self._no_cache = getattr(args, "no_cache", False)
+        self._invalidate = getattr(args, "invalidate", None) or []
+        if getattr(args, "checkpoint", None):
+            self.config_dict['processors-toolbox']['checkpoint'] = args.checkpoint
+        self._resume = getattr(args, "resume", False)
+        if getattr(args, "report", None):
+            self.config_dict['processors-toolbox']['report'] = args.report
 
-    def _CreateAndConfigureProcessors(self):
+    def _CreateAndConfigureProcessors(self, overrides=None):
+        '''
+        Create the processors and configure them; overrides (dictionary) replaces
+        parameters of the configuration of every processor
+        '''
         for a_dict in self.config_dict["processors-toolbox"]["processors"]:
             if not self._CreateOneProcessor(a_dict["name"], a_dict["type"]):
                 logger.error(
                     "Could not create processor <{}>; exiting".format(a_dict["name"]))
                 return False
+        trace_allocations = self.config_dict["processors-toolbox"].get("trace_allocations", False)
         for _, processor in self._processors_dict.items():
             procName = processor["object"].name
             if procName in self.config_dict.keys():
                 config_dict = self.config_dict[procName]
             else:
                 config_dict = dict()
+            if overrides:
+                config_dict = dict(config_dict, **overrides)
+            processor["object"].trace_allocations = trace_allocations
             try:
                 processor["object"].Configure(config_dict)
             except Exception as err:
@@ -72,23 +110,30 @@ class ToolBox:
         return True
 
     def _CreateOneProcessor(self, procName, procClass):
-        # Parsing procClass
+        # Parsing procClass: "module:class" or a name of the processors registry
+        # (morpho processors and processors registered via entry points)
         if ":" in procClass:
             (module_name, processor_name) = procClass.split(":")
+            try:
+                module = importlib.import_module(module_name)
+            except:
+                logger.error("Cannot import module {}".format(module_name))
+                return False
         else:
             module_name = "morpho"
             processor_name = procClass
-        # importing module (morpho is default)
-        try:
-            module = importlib.import_module(module_name)
-        except:
-            logger.error("Cannot import module {}".format(module_name))
-            return False
+            module = None
 
         try:
+            if module is None:
+                from morpho.processors import registry
+                proc_class = registry.load(processor_name)
+                module_name = registry.get_path(processor_name).split(":")[0]
+            else:
+                proc_class = getattr(module, processor_name)
             self._processors_dict.update({procName:
                                           {
-                                              "object": getattr(module, processor_name)(procName),
+                                              "object": proc_class(procName),
                                               "variableToGive": [],  # -> variable to give after execution
                                               # -> which processor need to give its output to this processor
                                               "procToBeConnectedTo": [],
@@ -99,9 +144,9 @@ class ToolBox:
             logger.info("Processor <{}> ({}:{}) created".format(
                 procName, module_name, processor_name))
             return True
-        except:
-            logger.error("Cannot import {} from {}".format(
-                processor_name, "morpho"))
+        except Exception as err:
+            logger.error("Cannot import {} from {}:\n{}".format(
+                processor_name, module_name, err))
             return False
 
     def _ConnectProcessors(self, nameProc):
@@ -111,9 +156,18 @@ class ToolBox:
             proc_name_to_update = self._processors_dict[nameProc]['procToBeConnectedTo'][i]
             var_to_give = self._processors_dict[nameProc]['variableToGive'][i]
             var_to_be_connected_to = self._processors_dict[nameProc]['varToBeConnectedTo'][i]
-            proc_object_to_update = self._processors_dict[proc_name_to_update]['object']
             logger.debug("Connection {}:{} -> {}:{}".format(nameProc, var_to_give, proc_name_to_update, var_to_be_connected_to))
 
+            if self._executor_type == 'process':
+                # The inputs are given to the processor in the worker process
+                if var_to_give in self._transport_outputs.get(nameProc, dict()):
+                    val = self._transport_outputs[nameProc][var_to_give]
+                else:
+                    val = getattr(proc_object, var_to_give)
+                self._pending_inputs.setdefault(proc_name_to_update, []).append(
+                    (var_to_be_connected_to, val))
+                continue
+            proc_object_to_update = self._processors_dict[proc_name_to_update]['object']
             try:
                 val = getattr(proc_object, var_to_give)
                 setattr(proc_object_to_update, var_to_be_connected_to, val)
@@ -126,33 +180,115 @@ class ToolBox:
     def _DefineChain(self):
         '''
         Defines the connections between the processors and place the processors into a ordered list.
+        A connection without variable (e.g. "writer" -> "reader") only defines an ordering between
+        two processors (no data is passed).
+        A connection with stream: True passes the data chunk by chunk (see StreamingProcessor).
+        The dependency graph (processor -> upstream processors) is built from these connections.
         '''
         for a_connection in self.config_dict['processors-toolbox']['connections']:
             if a_connection['slot'].split(":")[0] not in self._processors_dict.keys():
                 logger.error("Processor <{}> not defined but used as signal emitter".format(
                     a_connection['slot'].split(":")[0]))
+                return False
             if a_connection['signal'].split(":")[0] not in self._processors_dict.keys():
                 logger.error("Processor <{}> not defined but used as connection".format(
                     a_connection['signal'].split(":")[0]))
+                return False
             proc_name = a_connection['signal'].split(":")[0]
             new_proc_name = a_connection['slot'].split(":")[0]
-            self._processors_dict[proc_name]["variableToGive"].append(
-                a_connection['signal'].split(":")[1])
-            self._processors_dict[proc_name]["procToBeConnectedTo"].append(
-                a_connection['slot'].split(":")[0])
+            if a_connection.get('stream', False):
+                logger.debug("Stream {} -> {}".format(proc_name, new_proc_name))
+                self._stream_upstreams.setdefault(new_proc_name, []).append(proc_name)
+            elif ":" in a_connection['signal'] and ":" in a_connection['slot']:
+                self._processors_dict[proc_name]["variableToGive"].append(
+                    a_connection['signal'].split(":")[1])
+                self._processors_dict[proc_name]["procToBeConnectedTo"].append(
+                    new_proc_name)
+                self._processors_dict[proc_name]["varToBeConnectedTo"].append(
+                    a_connection['slot'].split(":")[1])
+            else:
+                logger.debug("Ordering {} -> {}".format(proc_name, new_proc_name))
             if proc_name not in self._chain_processors:
                 self._chain_processors.append(proc_name)
             if new_proc_name not in self._chain_processors:
                 self._chain_processors.append(new_proc_name)
-            self._processors_dict[proc_name]["varToBeConnectedTo"].append(
-                a_connection['slot'].split(":")[1])
+            self._dependencies.setdefault(new_proc_name, set()).add(proc_name)
         for a_processor in self._processors_dict.keys():
             if a_processor not in self._chain_processors:
                 self._chain_processors.append(a_processor)
+            self._dependencies.setdefault(a_processor, set())
+        if not self._DefineStreams():
+            return False
+        self._chain_processors = self._sortProcessors()
+        if self._chain_processors is None:
+            logger.error("Connections between processors contain a cycle")
+            return False
+        for source, members in self._pipelines.items():
+            self._pipelines[source] = [
+                a_processor for a_processor in self._chain_processors if a_processor in members]
+        for a_processor, proc_dict in self._processors_dict.items():
+            for var_to_give, proc_name in zip(proc_dict['variableToGive'], proc_dict['procToBeConnectedTo']):
+                self._live_outputs.setdefault((a_processor, var_to_give), set()).add(proc_name)
         logger.debug("Sequence of processors: {}".format(
             self._sequenceProcessors()))
         return True
 
+    def _DefineStreams(self):
+        '''
+        Groups the processors connected by streaming connections into pipelines
+        driven by their producer (source). The source waits for all the processors
+        the pipeline members depend on.
+        '''
+        from morpho.processors.StreamingProcessor import StreamingProcessor
+        for consumer, upstreams in self._stream_upstreams.items():
+            for a_processor in [consumer] + upstreams:
+                if not isinstance(self._processors_dict[a_processor]['object'], StreamingProcessor):
+                    logger.error("Processor <{}> is not a StreamingProcessor: cannot be streamed".format(
+                        a_processor))
+                    return False
+        producers = set()
+        for upstreams in self._stream_upstreams.values():
+            producers.update(upstreams)
+        for source in [p for p in self._chain_processors if p in producers and p not in self._stream_upstreams]:
+            members = set([source])
+            new_members = [source]
+            while new_members:
+                a_processor = new_members.pop()
+                for consumer, upstreams in self._stream_upstreams.items():
+                    if a_processor in upstreams and consumer not in members:
+                        members.add(consumer)
+                        new_members.append(consumer)
+            if not members.isdisjoint(self._streamed):
+                logger.error("Processors {} are fed by several streams".format(
+                    sorted(members & self._streamed)))
+                return False
+            self._streamed.update(members - set([source]))
+            self._pipelines[source] = members
+            for a_processor in members:
+                self._dependencies[source].update(self._dependencies[a_processor] - members)
+        if not set(self._stream_upstreams).issubset(self._streamed):
+            logger.error("Streaming connections contain a cycle")
+            return False
+        return True
+
+    def _sortProcessors(self):
+        '''
+        Topological sort of the processors; the order in which processors
+        appear in the connections is kept whenever possible.
+        Returns None if the graph contains a cycle.
+        '''
+        sorted_processors = []
+        remaining = list(self._chain_processors)
+        while remaining:
+            for a_processor in remaining:
+                if self._dependencies[a_processor].issubset(sorted_processors):
+                    sorted_processors.append(a_processor)
+                    remaining.remove(a_processor)
+                    break
+            else:
+                return None
+        return sorted_processors
+
     def _sequenceProcessors(self):
         seqWithArrows = self._chain_processors[0]
         for item in self._chain_processors[1:]:
@@ -161,25 +297,528 @@ class ToolBox:
 
     def _RunChain(self):
         '''
-        Execute the chain of processors
+        Execute the chain of processors.
+        If processors-toolbox.max_workers is larger than 1, processors whose
+        inputs are ready are run at the same time on a thread (default) or
+        process pool (processors-toolbox.executor).
         '''
-        for a_processor in self._chain_processors:
+        toolbox_dict = self.config_dict['processors-toolbox']
+        max_workers = int(toolbox_dict.get('max_workers', 1))
+        executor_type = toolbox_dict.get('executor', 'thread')
+        if max_workers > 1:
+            self._executor_type = executor_type
             try:
-                if not self._processors_dict[a_processor]['object'].Run():
-                    logger.error("Result <{}> incorrect".format(a_processor))
+                if not self._RunGraph(max_workers, executor_type):
                     return False
-            except Exception as err:
-                logger.error(
-                    "Error while running <{}>:\n{}".format(a_processor, err))
-                raise err
-            self._ConnectProcessors(a_processor)
-            if self._processors_dict[a_processor]['object'].delete:
-                self._processors_dict[a_processor]['deleted'] = True
-                logger.info("Deleting <{}>".format(a_processor))
-                del self._processors_dict[a_processor]['object']
+            finally:
+                for blocks, _ in self._shared_blocks.values():
+                    sharedmemory.free_blocks(blocks)
+                self._shared_blocks = dict()
+        else:
+            for a_processor in self._chain_processors:
+                if a_processor in self._streamed:
+                    continue
+                self._rss[a_processor] = (memory.current_rss(), None)
+                if a_processor in self._pipelines:
+                    if not self._RunStream(a_processor) or not self._FinalizeStream(a_processor):
+                        return False
+                    self._StopMemory(a_processor)
+                    continue
+                if self._Restore(a_processor):
+                    if not self._FinalizeProcessor(a_processor):
+                        return False
+                    self._StopMemory(a_processor)
+                    continue
+                start = time.time()
+                try:
+                    if not self._processors_dict[a_processor]['object'].Run():
+                        logger.error("Result <{}> incorrect".format(a_processor))
+                        return False
+                except Exception as err:
+                    logger.error(
+                        "Error while running <{}>:\n{}".format(a_processor, err))
+                    raise err
+                self._timing[a_processor] = (start, time.time())
+                if not self._FinalizeProcessor(a_processor):
+                    return False
+                self._StopMemory(a_processor)
+        path, duration = self._CriticalPath()
+        logger.info("Critical path: {} ({:.3f} s)".format(
+            " -> ".join(path), duration))
+        self._LogMemory()
+        return True
+
+    def _RunGraph(self, max_workers, executor_type):
+        '''
+        Execute the processors as soon as all their upstream processors are done.
+        '''
+        if executor_type == 'process':
+            Executor = futures.ProcessPoolExecutor
+        elif executor_type == 'thread':
+            Executor = futures.ThreadPoolExecutor
+        else:
+            logger.error("Unknown executor <{}>; choose between 'thread' and 'process'".format(
+                executor_type))
+            return False
+        if executor_type == 'process' and len(self._pipelines) > 0:
+            logger.error("Streaming connections cannot be used with the process executor")
+            return False
+        logger.info("Running processors on {} {} workers".format(
+            max_workers, executor_type))
+        shared_memory = self.config_dict['processors-toolbox'].get(
+            'shared_memory', True)
+        done = set()
+        running = dict()
+        if executor_type == 'process':
+            # Each worker process gets its share of the CPU budget. The workers are started
+            # by the fork server of the background tasks: they do not inherit the threads
+            # and the fork server of this process (their own background tasks need their own)
+            executor_args = {"initializer": cpubudget.init_worker,
+                             "initargs": (cpubudget.share(max_workers),),
+                             "mp_context": background.get_context()}
+        else:
+            # The threads share the CPU budget of the process
+            executor_args = dict()
+        with Executor(max_workers=max_workers, **executor_args) as executor:
+            while len(done) < len(self._chain_processors):
+                for a_processor in self._chain_processors:
+                    if a_processor in done or a_processor in running.values():
+                        continue
+                    if a_processor in self._streamed:
+                        continue
+                    if not self._dependencies[a_processor].issubset(done):
+                        continue
+                    self._rss[a_processor] = (memory.current_rss(), None)
+                    if a_processor in self._pipelines:
+                        logger.debug("Submitting stream from <{}>".format(a_processor))
+                        running[executor.submit(self._RunStream, a_processor)] = a_processor
+                        continue
+                    if self._Restore(a_processor):
+                        if not self._FinalizeProcessor(a_processor):
+                            for a_future in running:
+                                a_future.cancel()
+                            return False
+                        self._StopMemory(a_processor)
+                        done.add(a_processor)
+                        continue
+                    logger.debug("Submitting <{}>".format(a_processor))
+                    proc_object = self._processors_dict[a_processor]['object']
+                    if executor_type == 'process':
+                        future = executor.submit(
+                            _RunInWorker, proc_object,
+                            self._pending_inputs.pop(a_processor, []),
+                            self._processors_dict[a_processor]['variableToGive'],
+                            shared_memory)
+                    else:
+                        future = executor.submit(proc_object.Run)
+                    running[future] = a_processor
+                    self._timing[a_processor] = (time.time(), None)
+                finished, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED)
+                for future in finished:
+                    a_processor = running.pop(future)
+                    if a_processor not in self._pipelines:
+                        self._timing[a_processor] = (
+                            self._timing[a_processor][0], time.time())
+                    try:
+                        result = future.result()
+                    except Exception as err:
+                        logger.error(
+                            "Error while running <{}>:\n{}".format(a_processor, err))
+                        for a_future in running:
+                            a_future.cancel()
+                        raise err
+                    if executor_type == 'process':
+                        result, outputs, blocks, stats = result
+                        self._processors_dict[a_processor]['object'].stats = stats
+                        self._ReceiveOutputs(a_processor, outputs, blocks)
+                    if not result:
+                        logger.error("Result <{}> incorrect".format(a_processor))
+                        for a_future in running:
+                            a_future.cancel()
+                        return False
+                    if a_processor in self._pipelines:
+                        if not self._FinalizeStream(a_processor):
+                            return False
+                        self._StopMemory(a_processor)
+                        done.update(self._pipelines[a_processor])
+                        continue
+                    if not self._FinalizeProcessor(a_processor):
+                        return False
+                    self._StopMemory(a_processor)
+                    done.add(a_processor)
+        return True
+
+    def _RunStream(self, source):
+        '''
+        Pass the chunks yielded by source through the processors of its pipeline:
+        each consumer receives the chunks of its streaming upstream processors
+        (merged if several) and the chunk it returns is given to its own consumers.
+        '''
+        pipeline = self._pipelines[source]
+        start = time.time()
+        for a_processor in pipeline[1:]:
+            if not self._processors_dict[a_processor]['object'].StartStream():
+                return False
+        n_chunks = 0
+        source_object = self._processors_dict[source]['object']
+        source_object.stats["run"] = dict()
+        with instrumentation.Measurement(source_object.stats["run"], source_object.trace_allocations):
+            for chunk in source_object.Chunks():
+                chunks = {source: chunk}
+                for a_processor in pipeline[1:]:
+                    inputs = [chunks[upstream] for upstream in self._stream_upstreams[a_processor]
+                              if chunks.get(upstream) is not None]
+                    if len(inputs) == 0:
+                        continue
+                    merged = dict()
+                    for an_input in inputs:
+                        merged.update(an_input)
+                    chunks[a_processor] = self._processors_dict[a_processor]['object'].RunChunk(merged)
+                n_chunks += 1
+        for a_processor in pipeline[1:]:
+            if not self._processors_dict[a_processor]['object'].StopStream():
+                return False
+        end = time.time()
+        logger.info("{} chunks streamed from <{}>".format(n_chunks, source))
+        self._timing[source] = (start, end)
+        for a_processor in pipeline[1:]:
+            self._timing[a_processor] = (end, end)
+        return True
+
+    def _FinalizeStream(self, source):
+        '''
+        Finalize all the processors of a pipeline after streaming
+        '''
+        for a_processor in self._pipelines[source]:
+            if self._cache is not None:
+                self._cache_keys[a_processor] = self._CacheKey(a_processor)
+            if not self._FinalizeProcessor(a_processor):
+                return False
+        return True
+
+    def _FinalizeProcessor(self, a_processor):
+        '''
+        Give the outputs of a processor to the connected processors
+        and delete it if requested.
+        '''
+        self._StoreInCache(a_processor)
+        self._SaveCheckpoint(a_processor)
+        if not self._ConnectProcessors(a_processor):
+            return False
+        self._CollectStats(a_processor)
+        if self._processors_dict[a_processor]['object'].delete:
+            self._processors_dict[a_processor]['deleted'] = True
+            logger.info("Deleting <{}>".format(a_processor))
+            del self._processors_dict[a_processor]['object']
+        self._ReleaseSharedInputs(a_processor)
+        self._ReleaseVariables(a_processor)
+        return True
+
+    def _ReleaseVariables(self, a_processor):
+        '''
+        Drop the references to the connected variables which are not used anymore:
+        the inputs of a_processor and the outputs whose last consumer is a_processor.
+        Enabled with processors-toolbox.release_memory: True.
+        '''
+        if not self.config_dict['processors-toolbox'].get('release_memory', False):
+            return
+        if not self._processors_dict[a_processor]['deleted']:
+            proc_object = self._processors_dict[a_processor]['object']
+            for upstream in self._dependencies[a_processor]:
+                for var_to_give, proc_name, var_to_be_connected_to in zip(self._processors_dict[upstream]['variableToGive'],
+                                                                           self._processors_dict[upstream]['procToBeConnectedTo'],
+                                                                           self._processors_dict[upstream]['varToBeConnectedTo']):
+                    if proc_name == a_processor and var_to_be_connected_to not in self._processors_dict[a_processor]['variableToGive']:
+                        _drop_attribute(proc_object, var_to_be_connected_to)
+        for (producer, var_name), consumers in list(self._live_outputs.items()):
+            if a_processor not in consumers:
+                continue
+            consumers.discard(a_processor)
+            if len(consumers) > 0:
+                continue
+            del self._live_outputs[(producer, var_name)]
+            if not self._processors_dict[producer]['deleted']:
+                logger.debug("Releasing {}:{}".format(producer, var_name))
+                _drop_attribute(self._processors_dict[producer]['object'], var_name)
+
+    def _CollectStats(self, a_processor):
+        proc_object = self._processors_dict[a_processor]['object']
+        self._stats[a_processor] = dict(getattr(proc_object, 'stats', dict()))
+        if a_processor in self._restored or a_processor in self._resumed:
+            self._stats[a_processor]["restored"] = True
+            self._stats[a_processor].pop("run", None)
+
+    def _Report(self, success):
+        '''
+        Print a table of the time and memory used by the processors and
+        write the run report (processors-toolbox.report or --report)
+        '''
+        stats = dict()
+        for a_processor in self._chain_processors:
+            if a_processor in self._stats:
+                stats[a_processor] = self._stats[a_processor]
+            elif not self._processors_dict[a_processor]['deleted']:
+                stats[a_processor] = getattr(self._processors_dict[a_processor]['object'], 'stats', dict())
+        if len(stats) == 0:
+            return
+        logger.info("Processors statistics:\n{}".format(instrumentation.format_table(stats)))
+        report_fn = self.config_dict['processors-toolbox'].get('report', None)
+        if report_fn is None:
+            return
+        import json
+        path, duration = self._CriticalPath()
+        report = {
+            "success": success,
+            "processors": stats,
+            "critical_path": path,
+            "critical_path_duration": duration,
+            "peak_rss": memory.peak_rss()
+        }
+        rdir = os.path.dirname(report_fn)
+        if rdir != '' and not os.path.exists(rdir):
+            os.makedirs(rdir)
+            logger.debug("Creating folder: {}".format(rdir))
+        with open(report_fn, 'w') as report_file:
+            json.dump(report, report_file, indent=4)
+        logger.info("Run report saved in {}".format(report_fn))
+
+    def _ReceiveOutputs(self, a_processor, outputs, blocks):
+        '''
+        Set the outputs sent back by a worker process; the numpy arrays
+        in shared memory are kept until all the connected processors have run.
+        '''
+        proc_object = self._processors_dict[a_processor]['object']
+        for var_name, value in outputs.items():
+            setattr(proc_object, var_name, sharedmemory.attach_arrays(value))
+        self._transport_outputs[a_processor] = outputs
+        if len(blocks) > 0:
+            consumers = set(self._processors_dict[a_processor]['procToBeConnectedTo'])
+            self._shared_blocks[a_processor] = (blocks, consumers)
+
+    def _ReleaseSharedInputs(self, a_processor):
+        '''
+        Free the shared memory blocks whose last consumer is a_processor
+        '''
+        for upstream in self._dependencies[a_processor]:
+            if upstream not in self._shared_blocks:
+                continue
+            blocks, consumers = self._shared_blocks[upstream]
+            consumers.discard(a_processor)
+            if len(consumers) == 0:
+                logger.debug("Freeing shared outputs of <{}>".format(upstream))
+                sharedmemory.free_blocks(blocks)
+                del self._shared_blocks[upstream]
+                del self._transport_outputs[upstream]
+
+    def _SetUpCache(self):
+        '''
+        Creates the result cache if requested in processors-toolbox.cache
+        (and not disabled via the CLI).
+        '''
+        cache_dict = self.config_dict['processors-toolbox'].get('cache', False)
+        if not cache_dict or self._no_cache:
+            logger.debug("No result cache")
+            return
+        if not isinstance(cache_dict, dict):
+            cache_dict = dict()
+        self._cache = cache.ResultCache(cache_dict.get('directory', '.morpho_cache'),
+                                        cache_dict.get('max_size', 1000))
+        for a_processor in self._invalidate:
+            logger.info("Invalidating cache entries of <{}>".format(a_processor))
+            self._cache.Invalidate(a_processor)
+
+    def _CacheKey(self, a_processor):
+        '''
+        Key of the outputs of a processor: hash of its configuration, class and
+        version, of the size and modification time of the files it reads
+        (InputFiles method, e.g. IO readers), of the hashes of its connected
+        inputs and of the keys of the processors it has to wait for.
+        '''
+        from morpho import __version__
+        proc_object = self._processors_dict[a_processor]['object']
+        proc_class = type(proc_object)
+        inputs = []
+        for upstream in sorted(self._dependencies[a_processor]):
+            upstream_dict = self._processors_dict[upstream]
+            for var_to_give, proc_name, var_to_be_connected_to in zip(upstream_dict['variableToGive'],
+                                                                       upstream_dict['procToBeConnectedTo'],
+                                                                       upstream_dict['varToBeConnectedTo']):
+                if proc_name == a_processor:
+                    inputs.append([var_to_be_connected_to,
+                                   self._output_hashes[upstream][var_to_give]])
+            inputs.append([upstream, self._cache_keys[upstream]])
+        files = []
+        if hasattr(proc_object, "InputFiles"):
+            files = [cache.file_state(path) for path in proc_object.InputFiles()]
+        return cache.hash_key(self.config_dict.get(a_processor, dict()),
+                              "{}.{}".format(proc_class.__module__, proc_class.__name__),
+                              getattr(proc_class, "version", None),
+                              __version__,
+                              files,
+                              sorted(inputs))
+
+    def _IsCacheable(self, a_processor):
+        '''
+        Only processors connected to other processors have their outputs cached
+        (unless cache: False is set in their configuration).
+        '''
+        return len(self._processors_dict[a_processor]['variableToGive']) > 0 and \
+            self.config_dict.get(a_processor, dict()).get('cache', True)
+
+    def _SetUpCheckpoint(self):
+        '''
+        Creates the checkpoint directory if requested in processors-toolbox.checkpoint
+        (or via the CLI).
+        '''
+        directory = self.config_dict['processors-toolbox'].get('checkpoint', None)
+        if directory is None:
+            if self._resume:
+                logger.warning("No checkpoint directory given: cannot resume")
+            return
+        self._checkpoint = checkpoint.Checkpoint(directory, self._resume)
+
+    def _Restore(self, a_processor):
+        '''
+        Restore the outputs of a processor from the checkpoint or the cache;
+        returns False if the processor needs to be run.
+        '''
+        if self._cache is not None:
+            self._cache_keys[a_processor] = self._CacheKey(a_processor)
+        if self._RestoreFromCheckpoint(a_processor):
+            return True
+        return self._RestoreFromCache(a_processor)
+
+    def _RestoreFromCheckpoint(self, a_processor):
+        '''
+        A processor is not run again if it completed with the same configuration
+        and all its upstream processors were restored from the checkpoint.
+        '''
+        if self._checkpoint is None:
+            return False
+        if not self._dependencies[a_processor].issubset(self._resumed):
+            return False
+        if not self._checkpoint.IsComplete(a_processor, self._ConfigKey(a_processor)):
+            return False
+        outputs = self._checkpoint.Load(a_processor)
+        proc_object = self._processors_dict[a_processor]['object']
+        for var_name, value in outputs.items():
+            setattr(proc_object, var_name, value)
+        self._resumed.add(a_processor)
+        logger.info("Outputs of <{}> restored from checkpoint".format(a_processor))
         return True
 
+    def _ConfigKey(self, a_processor):
+        return cache.hash_key(self.config_dict.get(a_processor, dict()))
+
+    def _SaveCheckpoint(self, a_processor):
+        '''
+        Save the connected outputs of a processor after its execution
+        '''
+        if self._checkpoint is None or a_processor in self._resumed:
+            return
+        proc_object = self._processors_dict[a_processor]['object']
+        outputs = dict()
+        for var_name in self._processors_dict[a_processor]['variableToGive']:
+            outputs[var_name] = getattr(proc_object, var_name)
+        self._checkpoint.Save(a_processor, self._ConfigKey(a_processor), outputs)
+
+    def _RestoreFromCache(self, a_processor):
+        '''
+        Restore the outputs of a processor from the cache;
+        returns False if the processor needs to be run.
+        '''
+        if self._cache is None:
+            return False
+        if not self._IsCacheable(a_processor):
+            return False
+        entry = self._cache.Load(self._cache_keys[a_processor])
+        if entry is None:
+            logger.debug("No cache entry for <{}>".format(a_processor))
+            return False
+        outputs, self._output_hashes[a_processor] = entry
+        proc_object = self._processors_dict[a_processor]['object']
+        for var_name, value in outputs.items():
+            setattr(proc_object, var_name, value)
+        self._restored.add(a_processor)
+        logger.info("Outputs of <{}> restored from cache".format(a_processor))
+        return True
+
+    def _StoreInCache(self, a_processor):
+        '''
+        Store the outputs of a processor after its execution
+        '''
+        if self._cache is None or a_processor in self._restored:
+            return
+        proc_object = self._processors_dict[a_processor]['object']
+        outputs = dict()
+        for var_name in self._processors_dict[a_processor]['variableToGive']:
+            outputs[var_name] = getattr(proc_object, var_name)
+        if self._IsCacheable(a_processor):
+            logger.debug("Storing outputs of <{}> in cache".format(a_processor))
+            self._output_hashes[a_processor] = self._cache.Store(
+                self._cache_keys[a_processor], a_processor, outputs)
+        else:
+            self._output_hashes[a_processor] = {
+                var_name: cache.hash_object(value) for var_name, value in outputs.items()}
+
+    def _StopMemory(self, a_processor):
+        self._rss[a_processor] = (self._rss[a_processor][0], memory.current_rss())
+
+    def _LogMemory(self):
+        '''
+        Log the peak RSS and the RSS variation during each processor (including
+        the release of the variables not used anymore).
+        With several workers, the variations of concurrent processors overlap.
+        '''
+        logger.info("Peak RSS: {}".format(memory.format_size(memory.peak_rss())))
+        if self._executor_type == 'process':
+            logger.info("Peak RSS of worker processes: {}".format(
+                memory.format_size(memory.peak_rss(children=True))))
+        for a_processor in self._chain_processors:
+            if a_processor not in self._rss or None in self._rss[a_processor]:
+                continue
+            before, after = self._rss[a_processor]
+            logger.info("Memory <{}>: {:+.1f} MB".format(a_processor, (after - before)/1024./1024.))
+
+    def _CriticalPath(self):
+        '''
+        Returns the chain of dependent processors with the longest
+        total run time and this run time.
+        '''
+        finish = dict()
+        previous = dict()
+        for a_processor in self._chain_processors:
+            if a_processor not in self._timing:
+                continue
+            start, end = self._timing[a_processor]
+            previous[a_processor] = None
+            longest = 0.
+            for upstream in self._dependencies[a_processor]:
+                if upstream in finish and finish[upstream] > longest:
+                    longest = finish[upstream]
+                    previous[a_processor] = upstream
+            finish[a_processor] = longest + (end - start)
+        if len(finish) == 0:
+            return [], 0.
+        last = max(finish, key=finish.get)
+        path = [last]
+        while previous[path[0]] is not None:
+            path.insert(0, previous[path[0]])
+        return path, finish[last]
+
     def Run(self):
+        trace_allocations = self.config_dict["processors-toolbox"].get("trace_allocations", False)
+        if trace_allocations:
+            # Traced once for the whole run (tracemalloc is global to the process)
+            instrumentation.start_tracing()
+        try:
+            return self._Run()
+        finally:
+            if trace_allocations:
+                instrumentation.stop_tracing()
+
+    def _Run(self):
         import json
         logger.debug("Configuration:\n{}".format(
             json.dumps(self.config_dict, indent=4)))
@@ -189,9 +828,55 @@ class ToolBox:
         if not self._DefineChain():
             logger.error("Error while defining processors chain!")
             return False
-        if not self._RunChain():
+        self._SetUpCache()
+        self._SetUpCheckpoint()
+        background.set_max_workers(self.config_dict["processors-toolbox"].get("diagnostics_workers", 1))
+        success = False
+        try:
+            success = self._RunChain()
+        finally:
+            # Diagnostics made in the background by the processors (those of the
+            # processors run by the process executor are waited for in their worker)
+            success = background.wait() and success
+            self._Report(success)
+        if not success:
             logger.error("Error while running processors!")
             return False
+        return True
+
+    def Precompile(self, max_workers=None):
+        '''
+        Compile the models of the processors (e.g. Stan models) into their cache
+        in parallel processes, without running the chain (morpho --precompile).
+        max_workers processes (default: one per model) are used, at most the CPU budget.
+        '''
+        # The models are compiled by Precompile only, not during Configure as well
+        if not self._CreateAndConfigureProcessors({"background_compile": False}):
+            logger.error("Error while creating and configuring processors!")
+            return False
+        to_compile = [processor["object"] for processor in self._processors_dict.values()
+                      if hasattr(processor["object"], "Precompile")]
+        if len(to_compile) == 0:
+            logger.info("No model to compile")
+            return True
+        if max_workers is None:
+            max_workers = len(to_compile)
+        max_workers = max(min(max_workers, len(to_compile), cpubudget.get_budget().n_cpus), 1)
+        logger.info("Compiling {} models on {} processes".format(len(to_compile), max_workers))
+        success = True
+        with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            jobs = {executor.submit(_PrecompileInWorker, proc_object): proc_object.name
+                    for proc_object in to_compile}
+            for job in futures.as_completed(jobs):
+                try:
+                    result = job.result()
+                except Exception as err:
+                    logger.error("Compilation of <{}> failed:\n{}".format(jobs[job], err))
+                    result = False
+                if result:
+                    logger.info("Model of <{}> compiled".format(jobs[job]))
+                success = success and bool(result)
+        return success
 
     def GetProcessor(procName):
         if self._processors_dict[str(procName)]['deleted']:
@@ -209,3 +894,36 @@ class ToolBox:
         except:
             logger.warning("Attribute {} does not exist in {}".format(procValue, procName))
         return value
+
+
+def _drop_attribute(an_object, var_name):
+    if var_name in vars(an_object):
+        delattr(an_object, var_name)
+
+
+def _PrecompileInWorker(proc_object):
+    return proc_object.Precompile()
+
+
+def _RunInWorker(proc_object, inputs, variables, shared_memory=True):
+    '''
+    Run a processor in a worker process and send back the variables
+    connected to other processors.
+    The numpy arrays given and sent back are placed in shared memory.
+    The statistics of the processor are sent back as well.
+    The background tasks of the processor (only known by this worker) are done
+    before its outputs are sent back.
+    '''
+    for var_name, value in inputs:
+        setattr(proc_object, var_name, sharedmemory.attach_arrays(value))
+    result = proc_object.Run()
+    result = background.wait() and result
+    outputs = dict()
+    blocks = []
+    for var_name in variables:
+        if var_name not in outputs:
+            value = getattr(proc_object, var_name)
+            if shared_memory:
+                value = sharedmemory.export_arrays(value, blocks)
+            outputs[var_name] = value
+    return result, outputs, blocks, proc_object.stats
@@ -169,6 +169,33 @@ class IOTests(unittest.TestCase):
             logger.info("{} -> size = {}".format(key, len(data[key])))
             self.assertEqual(len(data[key]), 6)
 
+    def test_NPZIO(self):
+        logger.info("IONPZ test")
+        import numpy
+        from morpho.processors.IO import IONPZProcessor
+        writer_config = {
+            "action": "write",
+            "filename": "myFile.npz",
+            "variables": ["x", "list", "matrix"]
+        }
+        reader_config = {
+            "action": "read",
+            "filename": "myFile.npz",
+            "variables": ["x", "list", "matrix"]
+        }
+        a = IONPZProcessor("writer")
+        b = IONPZProcessor("reader")
+        a.Configure(writer_config)
+        b.Configure(reader_config)
+        a.data = dict(input_data)
+        a.data["matrix"] = numpy.arange(36.).reshape(6, 2, 3)
+        a.Run()
+        b.Run()
+        data = b.data
+        self.assertEqual(data["list"].shape, (6, 2))
+        self.assertEqual(data["matrix"].shape, (6, 2, 3))
+        self.assertEqual(data["matrix"][5, 1, 2], 35.)
+
 if __name__ == '__main__':
     args = parser.parse_args(False)
     logger = morphologging.getLogger('morpho',
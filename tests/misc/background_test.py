@@ -0,0 +1,102 @@
+'''
+This scripts aims at testing the background tasks (e.g. diagnostics).
+Author: agent
+Date: Oct 18 2026
+'''
+
+import os
+import threading
+import time
+import unittest
+
+from morpho.utilities import morphologging, parser
+logger = morphologging.getLogger(__name__)
+
+
+def write_after(filename, delay, values):
+    time.sleep(delay)
+    with open(filename, 'w') as a_file:
+        a_file.write(str(sum(values)))
+
+
+def write_pid(filename):
+    with open(filename, 'w') as a_file:
+        a_file.write(str(os.getpid()))
+
+
+def fail():
+    raise RuntimeError("Failing task")
+
+
+class BackgroundTests(unittest.TestCase):
+
+    def test_Tasks(self):
+        logger.info("Background tasks test")
+        from morpho.utilities import background
+        tasks = background.BackgroundTasks(max_workers=2)
+        # The fork server is started by the first task
+        tasks.Submit("start", time.sleep, 0)
+        self.assertTrue(tasks.Wait())
+        values = [1, 2, 3]
+        start = time.time()
+        for i in range(4):
+            tasks.Submit("task{}".format(i), write_after, "background_{}.txt".format(i), 0.2, values)
+            # The tasks work on a snapshot of the memory
+            values.append(10)
+        submitted = time.time() - start
+        self.assertTrue(tasks.Wait())
+        duration = time.time() - start
+        # The first 2 tasks are submitted at once, the next ones wait for a free worker
+        self.assertGreater(submitted, 0.15)
+        # Done 2 by 2 (the tasks would take 0.8 s one after the other)
+        self.assertLess(duration, 0.75)
+        for i in range(4):
+            with open("background_{}.txt".format(i), 'r') as a_file:
+                self.assertEqual(int(a_file.read()), 6 + 10*i)
+            os.remove("background_{}.txt".format(i))
+
+    def test_Threads(self):
+        logger.info("Background tasks with other threads test")
+        from morpho.utilities import background
+        tasks = background.BackgroundTasks()
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait)
+        thread.start()
+        try:
+            # Started by the fork server, not forked from this multi-threaded process
+            tasks.Submit("background", write_pid, "background.txt")
+            self.assertTrue(tasks.Wait())
+        finally:
+            release.set()
+            thread.join()
+        with open("background.txt", 'r') as a_file:
+            self.assertNotEqual(int(a_file.read()), os.getpid())
+        os.remove("background.txt")
+        # Not picklable: done when submitted
+        tasks.Submit("foreground", lambda: write_pid("foreground.txt"))
+        with open("foreground.txt", 'r') as a_file:
+            self.assertEqual(int(a_file.read()), os.getpid())
+        os.remove("foreground.txt")
+
+    def test_Failure(self):
+        logger.info("Background task failure test")
+        from morpho.utilities import background
+        tasks = background.BackgroundTasks()
+        tasks.Submit("failing", fail)
+        self.assertFalse(tasks.Wait())
+        self.assertTrue(tasks.Wait())
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args(False)
+    logger = morphologging.getLogger('morpho',
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    logger = morphologging.getLogger(__name__,
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+
+    unittest.main()
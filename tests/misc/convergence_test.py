@@ -0,0 +1,85 @@
+'''
+This scripts aims at testing the convergence diagnostics (R-hat, ESS) and the joining of chain segments.
+Author: agent
+Date: Oct 18 2026
+'''
+
+import unittest
+
+import numpy
+
+from morpho.utilities import morphologging, parser
+logger = morphologging.getLogger(__name__)
+
+
+def ar1(n_chains, n_draws, phi, seed=1):
+    '''
+    Autocorrelated chains (AR(1) process of unit variance)
+    '''
+    rng = numpy.random.RandomState(seed)
+    draws = numpy.zeros((n_chains, n_draws))
+    noise = rng.normal(scale=numpy.sqrt(1 - phi**2), size=(n_chains, n_draws))
+    draws[:, 0] = rng.normal(size=n_chains)
+    for i in range(1, n_draws):
+        draws[:, i] = phi * draws[:, i-1] + noise[:, i]
+    return draws
+
+
+class ConvergenceTests(unittest.TestCase):
+
+    def test_Independent(self):
+        logger.info("Convergence of independent draws test")
+        from morpho.utilities import convergence
+        draws = numpy.random.RandomState(2).normal(size=(4, 1000))
+        self.assertLess(convergence.rhat(draws), 1.01)
+        self.assertGreater(convergence.ess_bulk(draws), 3000)
+        self.assertGreater(convergence.ess_tail(draws), 2500)
+
+    def test_Autocorrelated(self):
+        logger.info("Convergence of autocorrelated draws test")
+        from morpho.utilities import convergence
+        draws = ar1(4, 4000, 0.9)
+        # ESS = N (1 - phi) / (1 + phi)
+        self.assertAlmostEqual(convergence.ess_bulk(draws) / (16000 * 0.1 / 1.9), 1, delta=0.2)
+        self.assertLess(convergence.ess_tail(draws), 16000 * 0.5)
+
+    def test_NotMixed(self):
+        logger.info("Convergence of chains not mixed test")
+        from morpho.utilities import convergence
+        draws = numpy.random.RandomState(3).normal(size=(4, 500))
+        draws[0] += 2
+        self.assertGreater(convergence.rhat(draws), 1.1)
+        # Different scales
+        draws = numpy.random.RandomState(3).normal(size=(4, 500))
+        draws[0] *= 5
+        self.assertGreater(convergence.rhat(draws), 1.05)
+
+    def test_Segments(self):
+        logger.info("Joining of chain segments test")
+        from morpho.utilities import convergence
+        from morpho.utilities.results import Results, concatenate_draws
+        draws = ar1(2, 600, 0.5)
+        segments = [Results({"x": draws[:, start:start+200].reshape(-1),
+                             "is_sample": numpy.ones(400)}, n_chains=2)
+                    for start in range(0, 600, 200)]
+        joined = concatenate_draws(segments)
+        numpy.testing.assert_allclose(joined["x"], draws.reshape(-1))
+        numpy.testing.assert_allclose(joined.chain(1)["draw"], numpy.arange(600))
+        summary = convergence.summary(joined, ["x"], 2)
+        self.assertAlmostEqual(summary["x"]["rhat"], convergence.rhat(draws))
+        self.assertAlmostEqual(summary["x"]["ess_bulk"], convergence.ess_bulk(draws))
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args(False)
+    logger = morphologging.getLogger('morpho',
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    logger = morphologging.getLogger(__name__,
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+
+    unittest.main()
@@ -0,0 +1,115 @@
+'''
+This scripts aims at testing the CPU budget shared by the samplers.
+Author: agent
+Date: Oct 18 2026
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from morpho.utilities import morphologging, parser
+logger = morphologging.getLogger(__name__)
+
+
+class CPUBudgetTests(unittest.TestCase):
+
+    def setUp(self):
+        # set_cpus changes the budget of the process and the BLAS variables:
+        # restored for the next tests
+        from morpho.utilities import cpubudget
+        self.previous_budget = cpubudget._budget
+        self.previous_variables = {name: os.environ.get(name) for name in cpubudget.blas_variables}
+
+    def tearDown(self):
+        from morpho.utilities import cpubudget
+        cpubudget._budget = self.previous_budget
+        for name, value in self.previous_variables.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def test_Acquire(self):
+        logger.info("CPU budget test")
+        from morpho.utilities import cpubudget
+        budget = cpubudget.CPUBudget(4)
+        with budget.Acquire(8) as n_cpus:
+            self.assertEqual(n_cpus, 4)
+            self.assertEqual(budget.used, 4)
+        self.assertEqual(budget.used, 0)
+        # Samplers asking for more cores than available wait for them
+        peak = []
+        order = []
+
+        def sampler(name, n_cpus):
+            with budget.Acquire(n_cpus, name):
+                order.append(name)
+                peak.append(budget.used)
+                time.sleep(0.05)
+
+        threads = []
+        for i in range(6):
+            threads.append(threading.Thread(target=sampler, args=("sampler{}".format(i), 3)))
+            threads[-1].start()
+            time.sleep(0.005)
+        for a_thread in threads:
+            a_thread.join()
+        self.assertEqual(len(peak), 6)
+        self.assertLessEqual(max(peak), 4)
+        # First come, first served
+        self.assertEqual(order, ["sampler{}".format(i) for i in range(6)])
+
+    def test_Limits(self):
+        logger.info("Available cores test")
+        from morpho.utilities import cpubudget
+        root = tempfile.mkdtemp()
+        try:
+            self.assertIsNone(cpubudget.cgroup_quota(root))
+            with open(os.path.join(root, "cpu.max"), 'w') as cpu_max:
+                cpu_max.write("250000 100000\n")
+            self.assertEqual(cpubudget.cgroup_quota(root), 3)
+            with open(os.path.join(root, "cpu.max"), 'w') as cpu_max:
+                cpu_max.write("max 100000\n")
+            self.assertIsNone(cpubudget.cgroup_quota(root))
+            os.remove(os.path.join(root, "cpu.max"))
+            os.makedirs(os.path.join(root, "cpu"))
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us"), 'w') as quota:
+                quota.write("200000\n")
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us"), 'w') as period:
+                period.write("100000\n")
+            self.assertEqual(cpubudget.cgroup_quota(root), 2)
+        finally:
+            shutil.rmtree(root)
+        previous = os.environ.get(cpubudget.cpus_variable)
+        os.environ[cpubudget.cpus_variable] = "3"
+        try:
+            self.assertEqual(cpubudget.available_cpus(), 3)
+        finally:
+            if previous is None:
+                del os.environ[cpubudget.cpus_variable]
+            else:
+                os.environ[cpubudget.cpus_variable] = previous
+        self.assertGreaterEqual(cpubudget.available_cpus(), 1)
+        cpubudget.set_cpus(8)
+        self.assertEqual(cpubudget.get_budget().n_cpus, 8)
+        self.assertEqual(cpubudget.share(3), 2)
+        self.assertEqual(cpubudget.share(16), 1)
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args(False)
+    logger = morphologging.getLogger('morpho',
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    logger = morphologging.getLogger(__name__,
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+
+    unittest.main()
@@ -0,0 +1,127 @@
+'''
+This scripts aims at testing the cache of compiled models.
+Author: agent
+Date: Oct 18 2026
+'''
+
+import multiprocessing
+import os
+import shutil
+import time
+import unittest
+
+from morpho.utilities import morphologging, parser
+logger = morphologging.getLogger(__name__)
+
+cache_dir = "modelcache_test"
+
+
+def build_model():
+    # Slow "compilation": records each build in a file
+    with open(os.path.join(cache_dir, "builds.txt"), 'a') as builds_file:
+        builds_file.write("{}\n".format(os.getpid()))
+    time.sleep(0.5)
+    return {"model": "compiled", "padding": "x" * 10000}
+
+
+def get_model(key):
+    from morpho.utilities.modelcache import ModelCache
+    return ModelCache(cache_dir, versions={"pystan": "2.17"}).Get(key, build_model)
+
+
+class ModelCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.makedirs(cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(cache_dir)
+
+    def n_builds(self):
+        with open(os.path.join(cache_dir, "builds.txt"), 'r') as builds_file:
+            return len(builds_file.readlines())
+
+    def test_Concurrent(self):
+        logger.info("Model cache concurrency test")
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            models = pool.map(get_model, ["model_a"] * 4)
+        self.assertTrue(all(model["model"] == "compiled" for model in models))
+        self.assertEqual(self.n_builds(), 1)
+
+    def test_Versions(self):
+        logger.info("Model cache versions test")
+        from morpho.utilities.modelcache import ModelCache
+        ModelCache(cache_dir, versions={"pystan": "2.17"}).Get("model_a", build_model)
+        ModelCache(cache_dir, versions={"pystan": "2.17"}).Get("model_a", build_model)
+        self.assertEqual(self.n_builds(), 1)
+        ModelCache(cache_dir, versions={"pystan": "2.19"}).Get("model_a", build_model)
+        self.assertEqual(self.n_builds(), 2)
+
+    def test_CompilerVersion(self):
+        logger.info("Compiler version test")
+        from morpho.utilities import modelcache
+        compiler = os.path.join(cache_dir, "fake_cxx")
+        with open(compiler, 'w') as compiler_file:
+            compiler_file.write("#!/bin/sh\necho $$ >> {}\necho fake_cxx 1.0\n".format(
+                os.path.join(cache_dir, "calls.txt")))
+        os.chmod(compiler, 0o755)
+        previous_cxx = os.environ.get("CXX")
+        os.environ["CXX"] = compiler
+        try:
+            self.assertIn("fake_cxx 1.0", modelcache.compiler_version())
+            self.assertEqual(modelcache.compiler_version(), modelcache.compiler_version())
+        finally:
+            if previous_cxx is None:
+                del os.environ["CXX"]
+            else:
+                os.environ["CXX"] = previous_cxx
+        # Run once by the process
+        with open(os.path.join(cache_dir, "calls.txt"), 'r') as calls_file:
+            self.assertEqual(len(calls_file.readlines()), 1)
+
+    def test_Eviction(self):
+        logger.info("Model cache eviction test")
+        from morpho.utilities.modelcache import ModelCache
+        # Room for two models only
+        model_cache = ModelCache(cache_dir, max_size=0.025)
+        for key in ["model_a", "model_b", "model_a", "model_c"]:
+            model_cache.Get(key, build_model)
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, "model_a.pkl")))
+        self.assertFalse(os.path.exists(os.path.join(cache_dir, "model_b.pkl")))
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, "model_c.pkl")))
+        self.assertEqual(self.n_builds(), 3)
+
+    def test_LoadedModels(self):
+        logger.info("Loaded models test")
+        from morpho.utilities import modelcache
+        max_loaded_models = modelcache.max_loaded_models
+        modelcache.max_loaded_models = 2
+        try:
+            model_cache = modelcache.ModelCache(cache_dir)
+            for key in ["model_a", "model_b", "model_c"]:
+                model_cache.Get(key, build_model)
+            # Loaded from the cache
+            for key in ["model_a", "model_b", "model_c"]:
+                model_cache.Get(key, build_model)
+            # Only the most recently used models are kept in memory
+            paths = list(modelcache._loaded_models.keys())
+            self.assertEqual([os.path.basename(path) for path in paths], ["model_b.pkl", "model_c.pkl"])
+        finally:
+            modelcache.max_loaded_models = max_loaded_models
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args(False)
+    logger = morphologging.getLogger('morpho',
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    logger = morphologging.getLogger(__name__,
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+
+    unittest.main()
@@ -7,4 +7,124 @@ logger = morphologging.getLogger(__name__)
 def myFunction(config_dict):
     logger.info("This is my function")
     logger.info("I will return: {}".format("value="+str(config_dict["value"])))
-    return "value="+str(config_dict["value"])
\ No newline at end of file
+    return "value="+str(config_dict["value"])
+
+import multiprocessing
+import threading
+
+from morpho.utilities import background
+
+# Meeting points of the processors (threads) and background tasks (processes) which must run at the same time
+rendezvous = threading.Barrier(2)
+diagnostics_rendezvous = (background.get_context() or multiprocessing).Barrier(2)
+
+def myRendezvousFunction(config_dict):
+    logger.info("Waiting for the other processor")
+    rendezvous.wait(timeout=10)
+    return "value="+str(config_dict["value"])
+
+def myKillingFunction(config_dict):
+    import os
+    import signal
+    logger.info("Killing the worker process")
+    os.kill(os.getpid(), signal.SIGKILL)
+
+def mySleepingFunction(config_dict):
+    import time
+    logger.info("Sleeping {} s".format(config_dict["duration"]))
+    time.sleep(config_dict["duration"])
+    return "value="+str(config_dict["value"])
+
+
+from morpho.processors import BaseProcessor
+
+
+class ArrayProcessor(BaseProcessor):
+    '''
+    Processor returning the input array multiplied by a factor
+    (or an arange array if not input is given)
+    '''
+
+    def InternalConfigure(self, params):
+        import numpy
+        self.factor = params.get("factor", 1)
+        self.data = {"x": numpy.arange(params.get("size", 10), dtype=float)}
+        return True
+
+    def InternalRun(self):
+        self.results = {"x": self.data["x"]*self.factor}
+        return True
+
+
+from morpho.processors import StreamingProcessor
+
+
+class ChunkProcessor(StreamingProcessor):
+    '''
+    Streaming processor yielding an arange array by chunks (producer),
+    multiplying the chunks by a factor (transform)
+    and counting the entries and their sum (sink)
+    '''
+
+    def InternalConfigure(self, params):
+        self.size = params.get("size", 10)
+        self.factor = params.get("factor", 1)
+        self.sink = params.get("sink", False)
+        return True
+
+    def InternalChunks(self):
+        import numpy
+        for start in range(0, self.size, self.chunk_size):
+            yield {"x": numpy.arange(start, min(start + self.chunk_size, self.size), dtype=float)}
+
+    def InternalStartStream(self):
+        self.results = {"n": 0, "sum": 0., "n_chunks": 0}
+        return True
+
+    def InternalRunChunk(self, chunk):
+        self.results["n"] += len(chunk["x"])
+        self.results["sum"] += float(chunk["x"].sum())*self.factor
+        self.results["n_chunks"] += 1
+        if self.sink:
+            return None
+        return {"x": chunk["x"]*self.factor}
+
+    def InternalRun(self):
+        return True
+
+
+class CompiledProcessor(ArrayProcessor):
+    '''
+    Processor whose "model" is compiled by morpho --precompile:
+    writes the compiling process id in <name>.compiled
+    '''
+
+    def InternalConfigure(self, params):
+        self.background_compile = params.get("background_compile", False)
+        return ArrayProcessor.InternalConfigure(self, params)
+
+    def Precompile(self):
+        import os
+        with open("{}.compiled".format(self.name), 'w') as compiled_file:
+            compiled_file.write(str(os.getpid()))
+        return True
+
+
+class DiagnosedProcessor(ArrayProcessor):
+    '''
+    Processor making "diagnostics" in the background: once another one is made
+    at the same time, writes the sum of its results (snapshot taken at the end of Run)
+    in <name>.diagnostics
+    '''
+
+    def InternalRun(self):
+        ArrayProcessor.InternalRun(self)
+        background.submit("{} diagnostics".format(self.name), self._Diagnostics, diagnostics_rendezvous)
+        # Changed after the submission: not seen by the diagnostics
+        self.results["x"] = self.results["x"] * 0
+        return True
+
+    def _Diagnostics(self, barrier):
+        barrier.wait(timeout=10)
+        with open("{}.diagnostics".format(self.name), 'w') as diagnostics_file:
+            diagnostics_file.write(str(self.data["x"].sum() * self.factor))
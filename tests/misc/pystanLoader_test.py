@@ -0,0 +1,321 @@
+'''
+This scripts aims at testing (and timing) the extraction of the PyStan outputs.
+Author: agent
+Date: Oct 18 2026
+'''
+
+import itertools
+import os
+import time
+import unittest
+
+import numpy
+
+from morpho.utilities import morphologging, parser
+logger = morphologging.getLogger(__name__)
+
+
+class FakeFit:
+    '''
+    Object with the same interface as a pystan StanFit4Model:
+    parameters "a" and "b[i]" (n_params values), or the parameters and dimensions given
+    '''
+
+    def __init__(self, n_draws, n_chains, n_params, seed=1, par_dims=None, pars=None):
+        rng = numpy.random.RandomState(seed)
+        if par_dims is None:
+            par_dims = [("a", []), ("b", [n_params])]
+        self.model_pars = [name for name, _ in par_dims]
+        self.par_dims = [dims for _, dims in par_dims]
+        # Elements of the arrays in column-major order (as Stan)
+        self.flatnames = []
+        for name, dims in par_dims:
+            if len(dims) == 0:
+                self.flatnames.append(name)
+                continue
+            for index in itertools.product(*[range(dim) for dim in reversed(dims)]):
+                self.flatnames.append("{}[{}]".format(name, ",".join(str(i) for i in reversed(index))))
+        # draws, chains, flatnames + lp__
+        self._samples = rng.normal(size=(n_draws, n_chains, len(self.flatnames) + 1))
+        if pars is not None:
+            # Only the parameters given with pars are kept (flatnames and model_pars are unchanged)
+            kept = [i for i, flatname in enumerate(self.flatnames) if flatname.split("[")[0] in pars]
+            self._samples = self._samples[:, :, kept + [len(self.flatnames)]]
+            self.sim = {"fnames_oi": [self.flatnames[i] for i in kept] + ["lp__"],
+                        "pars_oi": [name for name, _ in par_dims if name in pars] + ["lp__"],
+                        "dims_oi": [dims for name, dims in par_dims if name in pars] + [[]]}
+        self._sampler_params = [{
+            "accept_stat__": rng.uniform(size=n_draws),
+            "stepsize__": rng.uniform(size=n_draws),
+            "n_leapfrog__": rng.randint(1, 10, size=n_draws).astype(float),
+            "treedepth__": rng.randint(1, 5, size=n_draws).astype(float),
+            "divergent__": rng.randint(0, 2, size=n_draws).astype(float),
+            "energy__": rng.normal(size=n_draws)
+        } for _ in range(n_chains)]
+
+    def extract(self, permuted=False, inc_warmup=True):
+        return self._samples
+
+    def get_sampler_params(self, inc_warmup=True):
+        return self._sampler_params
+
+    def get_adaptation_info(self):
+        return ["# Adaptation terminated\n# Step size = 0.{}\n# Diagonal elements of inverse mass matrix:\n# {}\n".format(
+            iChain + 1, ", ".join(["1.5"] * (len(self.flatnames)))) for iChain in range(self._samples.shape[1])]
+
+
+def loop_extraction(conf, theOutput):
+    '''
+    Previous (one value at a time) extraction, used as reference
+    '''
+    theOutputDiagnostics = theOutput.get_sampler_params(inc_warmup=conf['inc_warmup'])
+    diagnosticVariableName = ['accept_stat__', 'stepsize__',
+                              'n_leapfrog__', 'treedepth__', 'divergent__', 'energy__']
+    theOutputData = theOutput.extract(permuted=False, inc_warmup=conf['inc_warmup'])
+    nEventsPerChain = len(theOutputData)
+    flatnames = list(theOutput.flatnames) + diagnosticVariableName
+    desired_var = [a_name for a_name in flatnames for a_key in conf['interestParams']
+                   if a_name.startswith(a_key+'[') or a_name == a_key]
+    theOutputDataDict = {key: [] for key in desired_var + diagnosticVariableName +
+                         ["lp_prob", "delta_energy__", "is_sample"]}
+    for iChain in range(0, conf['chains']):
+        for iEvents in range(0, nEventsPerChain):
+            for iKey, key in enumerate(flatnames):
+                if key in diagnosticVariableName:
+                    theOutputDataDict[key].append(theOutputDiagnostics[iChain][key][iEvents])
+                elif key in desired_var:
+                    theOutputDataDict[key].append(theOutputData[iEvents][iChain][iKey])
+            if iEvents != 0:
+                theOutputDataDict["delta_energy__"].append(
+                    theOutputDiagnostics[iChain]['energy__'][iEvents]-theOutputDiagnostics[iChain]['energy__'][iEvents-1])
+            else:
+                theOutputDataDict["delta_energy__"].append(0)
+            theOutputDataDict["lp_prob"].append(theOutputData[iEvents][iChain][len(theOutput.flatnames)])
+            theOutputDataDict["is_sample"].append(0 if iEvents < conf['warmup'] else 1)
+    return theOutputDataDict
+
+
+class PyStanLoaderTests(unittest.TestCase):
+
+    def test_Extraction(self):
+        logger.info("PyStan outputs extraction test")
+        from morpho.utilities import pystanLoader
+        fit = FakeFit(50, 3, 4)
+        conf = {"inc_warmup": True, "warmup": 20, "chains": 3, "interestParams": ["a", "b"]}
+        results = pystanLoader.extract_data_from_outputdata(conf, fit)
+        reference = loop_extraction(conf, fit)
+        self.assertEqual(list(results.keys()), list(reference.keys()) + ["chain", "draw"])
+        # The reference rows (chain by chain) in the order of the Results:
+        # the warmup draws of the chains, then the other draws of the chains
+        order = sorted(range(150), key=lambda row: (row % 50 >= 20, row // 50, row % 50))
+        for key in reference:
+            numpy.testing.assert_allclose(results[key], numpy.asarray(reference[key])[order], err_msg=key)
+        self.assertEqual(fit.flatnames, ["a"] + ["b[{}]".format(i) for i in range(4)])
+
+    def test_NoWarmup(self):
+        logger.info("PyStan outputs extraction without warmup test")
+        from morpho.utilities import pystanLoader
+        fit = FakeFit(50, 2, 1)
+        conf = {"inc_warmup": False, "warmup": 20, "chains": 2, "interestParams": ["a"]}
+        results = pystanLoader.extract_data_from_outputdata(conf, fit)
+        self.assertEqual(int(results["is_sample"].sum()), 100)
+
+    def test_LowMemory(self):
+        logger.info("PyStan outputs extraction with pars, thin and float32 test")
+        from morpho.utilities import pystanLoader
+        par_dims = [("a", []), ("v", [4]), ("m", [2, 3])]
+        fit = FakeFit(30, 2, 0, par_dims=par_dims)
+        reduced_fit = FakeFit(30, 2, 0, par_dims=par_dims, pars=["a", "m"])
+        conf = {"inc_warmup": True, "warmup": 10, "chains": 2, "interestParams": ["a", "m"]}
+        reference = pystanLoader.extract_data_from_outputdata(conf, fit)
+        results = pystanLoader.extract_data_from_outputdata(conf, reduced_fit)
+        for key in ["a", "m[1,2]", "lp_prob"]:
+            numpy.testing.assert_allclose(results[key], reference[key], err_msg=key)
+        conf["array_params"] = True
+        results = pystanLoader.extract_data_from_outputdata(conf, reduced_fit)
+        numpy.testing.assert_allclose(results["m"][:, 1, 2], reference["m[1,2]"])
+        # 30 draws kept (one in 3) of which 4 of warmup (iterations 0, 3, 6, 9)
+        conf.update({"thin": 3, "results_dtype": "float32"})
+        results = pystanLoader.extract_data_from_outputdata(conf, reduced_fit)
+        self.assertEqual(int(results["is_sample"].sum()), 2*26)
+        self.assertEqual(results["m"].dtype, numpy.float32)
+        self.assertEqual(results["lp_prob"].dtype, numpy.float32)
+        self.assertEqual(results["chain"].dtype.kind, 'i')
+        from morpho.utilities import adaptation
+        last_draw = adaptation.from_fit(reduced_fit, 2)["last_draws"][1]
+        self.assertEqual(sorted(last_draw.keys()), ["a", "m"])
+        self.assertEqual(last_draw["m"][1][2], reference["m[1,2]"][-1])
+
+    def test_FixedParam(self):
+        logger.info("PyStan Fixed_param outputs extraction test")
+        from morpho.utilities import pystanLoader
+        fit = FakeFit(40, 2, 3)
+        # The Fixed_param sampler has no NUTS diagnostics
+        fit._sampler_params = [{"accept_stat__": numpy.zeros(40)} for _ in range(2)]
+        conf = {"inc_warmup": True, "warmup": 0, "chains": 2, "interestParams": ["a", "b"]}
+        results = pystanLoader.extract_data_from_outputdata(conf, fit)
+        self.assertNotIn("energy__", results)
+        self.assertNotIn("delta_energy__", results)
+        self.assertEqual(len(results["accept_stat__"]), 80)
+        self.assertEqual(int(results["is_sample"].sum()), 80)
+
+    def test_ArrayParams(self):
+        logger.info("PyStan array parameters extraction test")
+        from morpho.utilities import pystanLoader, reader
+        fit = FakeFit(30, 2, 0, par_dims=[("a", []), ("v", [4]), ("m", [2, 3])])
+        conf = {"inc_warmup": True, "warmup": 10, "chains": 2, "interestParams": ["a", "v", "m"]}
+        reference = pystanLoader.extract_data_from_outputdata(conf, fit)
+        conf["array_params"] = True
+        results = pystanLoader.extract_data_from_outputdata(conf, fit)
+        self.assertEqual(results["v"].shape, (60, 4))
+        self.assertEqual(results["m"].shape, (60, 2, 3))
+        self.assertNotIn("m[1,2]", results)
+        self.assertEqual(results["a"].shape, (60,))
+        for i in range(2):
+            for j in range(3):
+                numpy.testing.assert_allclose(results["m"][:, i, j], reference["m[{},{}]".format(i, j)])
+                numpy.testing.assert_allclose(reader.get_variable(results, "m[{},{}]".format(i, j)),
+                                              reference["m[{},{}]".format(i, j)])
+        numpy.testing.assert_allclose(results["v"][:, 3], reference["v[3]"])
+
+    def test_Draws(self):
+        logger.info("Approximate methods draws extraction test")
+        from morpho.utilities import pystanLoader
+        fit = FakeFit(30, 1, 0, par_dims=[("a", []), ("m", [2, 3])])
+        conf = {"inc_warmup": False, "warmup": 0, "chains": 1, "interestParams": ["a", "m"]}
+        reference = pystanLoader.extract_data_from_outputdata(conf, fit)
+        values = {"a": reference["a"], "m": numpy.zeros((30, 2, 3))}
+        for i in range(2):
+            for j in range(3):
+                values["m"][:, i, j] = reference["m[{},{}]".format(i, j)]
+        draws = pystanLoader.flatten_values(values)
+        self.assertEqual(list(draws.keys()), fit.flatnames)
+        results = pystanLoader.extract_data_from_draws(conf, draws, reference["lp_prob"])
+        for key in ["a", "m[1,2]", "lp_prob", "is_sample", "chain", "draw"]:
+            numpy.testing.assert_allclose(results[key], reference[key], err_msg=key)
+        conf["array_params"] = True
+        results = pystanLoader.extract_data_from_draws(conf, draws)
+        numpy.testing.assert_allclose(results["m"], values["m"])
+        self.assertEqual(pystanLoader.zero_based_name("m.2.3"), "m[1,2]")
+        self.assertEqual(pystanLoader.zero_based_name("m[2,3]"), "m[1,2]")
+        self.assertEqual(pystanLoader.zero_based_name("a"), "a")
+
+    def test_Results(self):
+        logger.info("Results views test")
+        from morpho.utilities import pystanLoader
+        fit = FakeFit(50, 3, 4)
+        conf = {"inc_warmup": True, "warmup": 20, "chains": 3, "interestParams": ["a", "b"]}
+        results = pystanLoader.extract_data_from_outputdata(conf, fit)
+        self.assertEqual(results.n_chains, 3)
+        chain = results.chain(1)
+        self.assertEqual(len(chain["a"]), 50)
+        numpy.testing.assert_allclose(chain["a"], fit.extract()[:, 1, 0])
+        numpy.testing.assert_allclose(chain["draw"], numpy.arange(50))
+        samples = results.post_warmup()
+        self.assertEqual(len(samples["a"]), 90)
+        self.assertTrue(numpy.all(samples["is_sample"] == 1))
+        # Draws after the warmup of the 3 chains: a slice of the arrays
+        self.assertTrue(numpy.shares_memory(samples["a"], results["a"]))
+        self.assertTrue(numpy.shares_memory(samples.chain(1)["a"], results["a"]))
+        self.assertEqual(samples.draws("b[2]").shape, (3, 30))
+        self.assertTrue(numpy.shares_memory(samples.draws("b[2]"), results["b[2]"]))
+        numpy.testing.assert_allclose(results.draws("a"), fit.extract()[:, :, 0].T)
+        self.assertEqual(len(results.warmup()["a"]), 60)
+        projection = results.columns(["a"])
+        self.assertEqual(sorted(projection.keys()), ["a", "chain", "draw", "is_sample"])
+        self.assertIs(projection["a"], results["a"])
+        # Batch of fits: the columns have a first axis (dataset)
+        from morpho.utilities.results import stack
+        batch = stack([results, results])
+        self.assertEqual(batch["a"].shape, (2, 150))
+        self.assertEqual(batch.post_warmup()["a"].shape, (2, 90))
+        self.assertTrue(numpy.shares_memory(batch.post_warmup()["a"], batch["a"]))
+        self.assertEqual(batch.post_warmup().draws("a").shape, (2, 3, 30))
+
+    def test_Adaptation(self):
+        logger.info("Adaptation of the chains test")
+        from morpho.utilities import adaptation
+        fit = FakeFit(30, 2, 0, par_dims=[("a", []), ("m", [2, 3])])
+        fit_adaptation = adaptation.from_fit(fit, 2)
+        self.assertEqual(fit_adaptation["stepsize"], [0.1, 0.2])
+        self.assertEqual(len(fit_adaptation["inv_metric"][1]), 7)
+        last_draw = fit_adaptation["last_draws"][1]
+        self.assertEqual(last_draw["a"], fit.extract()[-1, 1, 0])
+        # m[1,2] is the last element (column-major order)
+        self.assertEqual(last_draw["m"][1][2], fit.extract()[-1, 1, 6])
+        adaptation.save(fit_adaptation, "adaptation_test.json")
+        self.assertEqual(adaptation.load("adaptation_test.json"), fit_adaptation)
+        os.remove("adaptation_test.json")
+
+    def test_Diagnostics(self):
+        logger.info("Single-pass convergence diagnostics test")
+        from morpho.utilities import stanConvergenceChecker, convergence
+        fit = FakeFit(200, 4, 3)
+        calls = []
+        extract, get_sampler_params = fit.extract, fit.get_sampler_params
+        fit.extract = lambda **kwargs: calls.append("extract") or extract(**kwargs)
+        fit.get_sampler_params = lambda **kwargs: calls.append("params") or get_sampler_params(**kwargs)
+        diagnostics = stanConvergenceChecker.diagnose(fit, max_depth=4)
+        self.assertEqual(sorted(calls), ["extract", "params"])
+        self.assertEqual(diagnostics.names, ["a", "b[0]", "b[1]", "b[2]", "lp__"])
+        self.assertEqual(diagnostics.n_iter, 800)
+        # Same values as each variable on its own
+        draws = numpy.swapaxes(extract(), 0, 1)
+        for i_name in range(len(diagnostics.names)):
+            self.assertAlmostEqual(diagnostics.rhat[i_name], convergence.split_rhat(draws[:, :, i_name]))
+            self.assertAlmostEqual(diagnostics.n_eff[i_name], convergence.split_ess(draws[:, :, i_name]))
+        params = get_sampler_params()
+        divergent = int(sum(numpy.sum(chain["divergent__"]) for chain in params))
+        saturated = sum(numpy.sum(chain["treedepth__"] == 4) for chain in params)
+        self.assertEqual(diagnostics.n_divergent, divergent)
+        self.assertEqual(diagnostics.n_max_treedepth, saturated)
+        energy = params[1]["energy__"]
+        self.assertAlmostEqual(diagnostics.ebfmi[1], numpy.sum(numpy.diff(energy)**2) / len(energy) / numpy.var(energy))
+        checks = diagnostics.checks()
+        self.assertTrue(checks["divergence"])
+        self.assertFalse(checks["rhat"])
+        self.assertTrue(diagnostics.warning)
+        lines = diagnostics.text().split("\n")
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[1], "Rhat looks reasonable for all parameters.")
+        self.assertTrue(lines[2].startswith("{} of 800 iterations ended with a divergence".format(divergent)))
+        self.assertEqual(stanConvergenceChecker.check_all_diagnostics(fit, max_depth=4),
+                         (True, diagnostics.text()))
+        self.assertEqual(stanConvergenceChecker.check_div(fit), diagnostics.check_div())
+        self.assertEqual(diagnostics.to_dict()["n_divergent"], divergent)
+        # A variable that does not move fails the Rhat check
+        fit._samples[:, :, 0] = 1.
+        diagnostics = stanConvergenceChecker.diagnose(fit)
+        self.assertEqual([name for name, _ in diagnostics.high_rhat], ["a"])
+        self.assertIn("Rhat for parameter a is nan!", diagnostics.details())
+        self.assertIsNone(diagnostics.to_dict()["rhat_values"]["a"])
+
+    def test_Benchmark(self):
+        logger.info("PyStan outputs extraction benchmark")
+        from morpho.utilities import pystanLoader
+        fit = FakeFit(2000, 4, 100)
+        conf = {"inc_warmup": True, "warmup": 1000, "chains": 4, "interestParams": ["a", "b"]}
+        start = time.perf_counter()
+        loop_extraction(conf, fit)
+        loop_duration = time.perf_counter() - start
+        start = time.perf_counter()
+        pystanLoader.extract_data_from_outputdata(conf, fit)
+        duration = time.perf_counter() - start
+        logger.info("Loop extraction: {:.3f} s; vectorized extraction: {:.4f} s (x{:.0f})".format(
+            loop_duration, duration, loop_duration/duration))
+        self.assertLess(duration, loop_duration)
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args(False)
+    logger = morphologging.getLogger('morpho',
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    logger = morphologging.getLogger(__name__,
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+
+    unittest.main()
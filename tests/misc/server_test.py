@@ -0,0 +1,104 @@
+'''
+This scripts aims at testing the morpho server (morpho serve/submit).
+Author: agent
+Date: Oct 18 2026
+'''
+
+import json
+import os
+import shutil
+import time
+import unittest
+
+from morpho.utilities import morphologging, parser
+logger = morphologging.getLogger(__name__)
+
+
+def job_config(value):
+    return {
+        "processors-toolbox": {
+            "processors": [
+                {"type": "ProcessorAssistant", "name": "assistant"}
+            ],
+            "connections": []
+        },
+        "assistant": {
+            "module_name": "myModule",
+            "function_name": "myFunction",
+            "value": value
+        }
+    }
+
+
+class ServerTests(unittest.TestCase):
+
+    def test_Socket(self):
+        logger.info("Server socket test")
+        from morpho.utilities.server import Server, submit
+        server = Server("server_test.sock", n_workers=2, preload=["myModule"])
+        server.Start()
+        try:
+            request = {"config": job_config(1), "cwd": os.getcwd(), "options": {}}
+            for _ in range(2):
+                result = submit(request, "server_test.sock")
+                self.assertTrue(result["success"])
+            request["config"]["assistant"]["function_name"] = "missingFunction"
+            self.assertFalse(submit(request, "server_test.sock")["success"])
+        finally:
+            server.Stop()
+        self.assertFalse(os.path.exists("server_test.sock"))
+
+    def test_WorkerDied(self):
+        logger.info("Server worker death test")
+        from morpho.utilities.server import Server, submit
+        server = Server("server_test.sock", preload=["myModule"])
+        server.Start()
+        try:
+            request = {"config": job_config(1), "cwd": os.getcwd(), "options": {}}
+            request["config"]["assistant"]["function_name"] = "myKillingFunction"
+            result = submit(request, "server_test.sock")
+            self.assertFalse(result["success"])
+            self.assertIsNotNone(result["job"])
+            # The workers were started again
+            request["config"]["assistant"]["function_name"] = "myFunction"
+            self.assertTrue(submit(request, "server_test.sock")["success"])
+        finally:
+            server.Stop()
+
+    def test_Spool(self):
+        logger.info("Server spool test")
+        from morpho.utilities.server import Server, spool
+        shutil.rmtree("server_spool", ignore_errors=True)
+        server = Server(spool="server_spool", preload=[])
+        server.Start()
+        try:
+            with open("server_spool/plain.json", 'w') as config_file:
+                json.dump(job_config(2), config_file)
+            spool({"config": job_config(3), "cwd": os.getcwd(), "options": {}}, "server_spool")
+            server._PollSpool()
+            for _ in range(100):
+                if len(os.listdir("server_spool/running")) == 0:
+                    break
+                time.sleep(0.1)
+        finally:
+            server.Stop()
+        done = sorted(os.listdir("server_spool/done"))
+        self.assertEqual(len(done), 4)
+        self.assertIn("plain.result.json", done)
+        with open("server_spool/done/plain.result.json", 'r') as result_file:
+            self.assertTrue(json.load(result_file)["success"])
+        shutil.rmtree("server_spool", ignore_errors=True)
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args(False)
+    logger = morphologging.getLogger('morpho',
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    logger = morphologging.getLogger(__name__,
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    unittest.main()
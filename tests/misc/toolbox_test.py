@@ -0,0 +1,497 @@
+'''
+This scripts aims at testing the ToolBox: chain definition and execution.
+Author: agent
+Date: Oct 18 2026
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from morpho.utilities import morphologging, parser
+logger = morphologging.getLogger(__name__)
+
+
+def sleeping_processor(value, duration=0.2):
+    return {
+        "module_name": "myModule",
+        "function_name": "mySleepingFunction",
+        "value": value,
+        "duration": duration,
+        "delete": False
+    }
+
+
+def rendezvous_processor(value):
+    return {
+        "module_name": "myModule",
+        "function_name": "myRendezvousFunction",
+        "value": value,
+        "delete": False
+    }
+
+
+class ToolBoxTests(unittest.TestCase):
+
+    def setUp(self):
+        # The files written by the tests (and their processors) go to a temporary directory
+        self._cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        # The ProcessorAssistant loads myModule.py from the working directory
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "myModule.py"), self.directory)
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _make_toolbox(self, toolbox_config, filename="toolbox_test.json"):
+        from morpho.utilities.toolbox import ToolBox
+        with open(filename, 'w') as config_file:
+            json.dump(toolbox_config, config_file)
+        args = parser.parse_args(False)
+        args.config = filename
+        return ToolBox(args)
+
+    def _fan_out_config(self, max_workers):
+        return {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "ProcessorAssistant", "name": "source"},
+                    {"type": "ProcessorAssistant", "name": "branch1"},
+                    {"type": "ProcessorAssistant", "name": "branch2"}
+                ],
+                "connections": [
+                    {"signal": "source:results", "slot": "branch1:upstream"},
+                    {"signal": "source", "slot": "branch2"}
+                ],
+                "max_workers": max_workers
+            },
+            "source": sleeping_processor(1),
+            "branch1": sleeping_processor(2),
+            "branch2": sleeping_processor(3)
+        }
+
+    def test_Sequential(self):
+        logger.info("ToolBox sequential test")
+        toolbox = self._make_toolbox(self._fan_out_config(1))
+        self.assertTrue(toolbox.Run())
+        self.assertEqual(toolbox._chain_processors, ["source", "branch1", "branch2"])
+        # Each processor starts once the previous one is done
+        for previous, a_processor in [("source", "branch1"), ("branch1", "branch2")]:
+            self.assertGreaterEqual(toolbox._timing[a_processor][0], toolbox._timing[previous][1])
+        branch1 = toolbox._processors_dict["branch1"]["object"]
+        self.assertEqual(branch1.upstream, "value=1")
+
+    def test_Parallel(self):
+        logger.info("ToolBox parallel test")
+        config = self._fan_out_config(2)
+        # The branches only return if they run at the same time
+        config["branch1"] = rendezvous_processor(2)
+        config["branch2"] = rendezvous_processor(3)
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        branch1 = toolbox._processors_dict["branch1"]["object"]
+        self.assertEqual(branch1.upstream, "value=1")
+        path, _ = toolbox._CriticalPath()
+        self.assertEqual(len(path), 2)
+        self.assertEqual(path[0], "source")
+
+    def test_ProcessExecutor(self):
+        logger.info("ToolBox process executor test")
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "myModule:ArrayProcessor", "name": "source"},
+                    {"type": "myModule:ArrayProcessor", "name": "double"},
+                    {"type": "myModule:ArrayProcessor", "name": "triple"},
+                    {"type": "myModule:ArrayProcessor", "name": "sink"}
+                ],
+                "connections": [
+                    {"signal": "source:results", "slot": "double:data"},
+                    {"signal": "source:results", "slot": "triple:data"},
+                    {"signal": "triple:results", "slot": "sink:data"}
+                ],
+                "max_workers": 2,
+                "executor": "process"
+            },
+            "source": {"size": 1000},
+            "double": {"factor": 2, "delete": False},
+            "triple": {"factor": 3, "delete": False}
+        }
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        triple = toolbox._processors_dict["triple"]["object"]
+        self.assertEqual(triple.results["x"][10], 30.)
+        self.assertFalse(triple.results["x"].flags.writeable)
+        self.assertEqual(len(toolbox._shared_blocks), 0)
+
+    def test_ReleaseMemory(self):
+        logger.info("ToolBox memory release test")
+        for max_workers in [1, 2]:
+            config = self._fan_out_config(max_workers)
+            config["processors-toolbox"]["release_memory"] = True
+            toolbox = self._make_toolbox(config)
+            self.assertTrue(toolbox.Run())
+            self.assertEqual(len(toolbox._live_outputs), 0)
+            source = toolbox._processors_dict["source"]["object"]
+            self.assertFalse(hasattr(source, "results"))
+            branch1 = toolbox._processors_dict["branch1"]["object"]
+            self.assertFalse(hasattr(branch1, "upstream"))
+            self.assertEqual(branch1.results, "value=2")
+            self.assertEqual(len(toolbox._rss), 3)
+
+    def test_Report(self):
+        logger.info("ToolBox run report test")
+        config = self._fan_out_config(1)
+        config["processors-toolbox"]["report"] = "toolbox_report.json"
+        config["processors-toolbox"]["trace_allocations"] = True
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        with open("toolbox_report.json", 'r') as report_file:
+            report = json.load(report_file)
+        self.assertTrue(report["success"])
+        self.assertEqual(list(report["processors"].keys()), ["source", "branch1", "branch2"])
+        source = report["processors"]["source"]
+        # The source sleeps: its CPU time is a fraction of its wall time
+        self.assertGreaterEqual(source["run"]["wall"], 0.2)
+        self.assertLess(source["run"]["cpu"], source["run"]["wall"])
+        self.assertIn("top_allocations", source["run"])
+        self.assertIn("wall", source["configure"])
+
+    def test_Registry(self):
+        logger.info("Processors registry test")
+        from morpho.processors import registry
+        self.assertIn("IOROOTProcessor", registry.names())
+        self.assertTrue(registry.register("MyArrayProcessor", "myModule:ArrayProcessor"))
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "MyArrayProcessor", "name": "array"},
+                    {"type": "ProcessorAssistant", "name": "assistant"}
+                ],
+                "connections": []
+            },
+            "array": {"factor": 2, "delete": False},
+            "assistant": sleeping_processor(1, 0.)
+        }
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        array = toolbox._processors_dict["array"]["object"]
+        self.assertEqual(array.results["x"][1], 2.)
+
+    def test_Precompile(self):
+        logger.info("Precompile test")
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "myModule:CompiledProcessor", "name": "model_a"},
+                    {"type": "myModule:CompiledProcessor", "name": "model_b"},
+                    {"type": "myModule:ArrayProcessor", "name": "array"}
+                ],
+                "connections": []
+            }
+        }
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Precompile(2))
+        pids = []
+        for name in ["model_a", "model_b"]:
+            with open("{}.compiled".format(name), 'r') as compiled_file:
+                pids.append(int(compiled_file.read()))
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_PrecompileWorkers(self):
+        logger.info("Precompile workers test")
+        from morpho.utilities import cpubudget
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "myModule:CompiledProcessor", "name": "model_a"},
+                    {"type": "myModule:CompiledProcessor", "name": "model_b"}
+                ],
+                "connections": []
+            },
+            "model_a": {"background_compile": True},
+            "model_b": {"background_compile": True}
+        }
+        previous_budget = cpubudget._budget
+        try:
+            for max_workers, n_cpus in [(1, 4), (2, 1)]:
+                cpubudget._budget = cpubudget.CPUBudget(n_cpus)
+                toolbox = self._make_toolbox(config)
+                self.assertTrue(toolbox.Precompile(max_workers))
+                # Compiled by Precompile only
+                for name in ["model_a", "model_b"]:
+                    self.assertFalse(toolbox._processors_dict[name]["object"].background_compile)
+                # -j 1 or a budget of 1 core: a single worker process
+                pids = set()
+                for name in ["model_a", "model_b"]:
+                    with open("{}.compiled".format(name), 'r') as compiled_file:
+                        pids.add(int(compiled_file.read()))
+                self.assertEqual(len(pids), 1)
+                self.assertNotIn(os.getpid(), pids)
+        finally:
+            cpubudget._budget = previous_budget
+
+    def test_BackgroundDiagnostics(self):
+        logger.info("Background diagnostics test")
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "myModule:DiagnosedProcessor", "name": "diagnosed_a"},
+                    {"type": "myModule:DiagnosedProcessor", "name": "diagnosed_b"}
+                ],
+                "connections": [{"signal": "diagnosed_a", "slot": "diagnosed_b"}],
+                "diagnostics_workers": 2
+            },
+            "diagnosed_a": {"size": 10},
+            "diagnosed_b": {"size": 10, "factor": 2}
+        }
+        toolbox = self._make_toolbox(config)
+        # The diagnostics only finish if they run at the same time
+        self.assertTrue(toolbox.Run())
+        # The toolbox waited for them
+        for name, expected in [("diagnosed_a", 45), ("diagnosed_b", 90)]:
+            with open("{}.diagnostics".format(name), 'r') as diagnostics_file:
+                self.assertEqual(float(diagnostics_file.read()), expected)
+
+    def test_BackgroundDiagnosticsProcess(self):
+        logger.info("Background diagnostics in the process executor test")
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "myModule:DiagnosedProcessor", "name": "diagnosed_a"},
+                    {"type": "myModule:DiagnosedProcessor", "name": "diagnosed_b"}
+                ],
+                "connections": [],
+                "max_workers": 2,
+                "executor": "process"
+            },
+            "diagnosed_a": {"size": 10},
+            "diagnosed_b": {"size": 10, "factor": 2}
+        }
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        # The workers waited for the diagnostics of their processor
+        for name, expected in [("diagnosed_a", 45), ("diagnosed_b", 90)]:
+            with open("{}.diagnostics".format(name), 'r') as diagnostics_file:
+                self.assertEqual(float(diagnostics_file.read()), expected)
+
+    def test_Cycle(self):
+        logger.info("ToolBox cycle test")
+        config = self._fan_out_config(1)
+        config["processors-toolbox"]["connections"].append(
+            {"signal": "branch2", "slot": "source"})
+        toolbox = self._make_toolbox(config)
+        self.assertFalse(toolbox.Run())
+
+    def test_Cache(self):
+        logger.info("ToolBox result cache test")
+        config = self._fan_out_config(1)
+        config["processors-toolbox"]["cache"] = {"directory": "toolbox_cache"}
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        self.assertEqual(len(toolbox._restored), 0)
+
+        # Changing a downstream processor does not re-run the source
+        config["branch2"]["value"] = 4
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        self.assertEqual(toolbox._restored, {"source"})
+        branch1 = toolbox._processors_dict["branch1"]["object"]
+        self.assertEqual(branch1.upstream, "value=1")
+
+        toolbox = self._make_toolbox(config)
+        toolbox._invalidate = ["source"]
+        self.assertTrue(toolbox.Run())
+        self.assertEqual(len(toolbox._restored), 0)
+
+    def test_CacheInputFiles(self):
+        logger.info("ToolBox result cache of readers test")
+        data_file = "data.json"
+        with open(data_file, 'w') as a_file:
+            json.dump({"x": [1, 2]}, a_file)
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "IOJSONProcessor", "name": "reader"},
+                    {"type": "ProcessorAssistant", "name": "after"}
+                ],
+                "connections": [{"signal": "reader:data", "slot": "after:upstream"}],
+                "cache": {"directory": "toolbox_cache"}
+            },
+            "reader": {"filename": data_file, "variables": ["x"]},
+            "after": sleeping_processor(1, 0.)
+        }
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        self.assertEqual(toolbox._restored, {"reader"})
+
+        # The file read changed: the reader is run again
+        with open(data_file, 'w') as a_file:
+            json.dump({"x": [1, 2, 3]}, a_file)
+        toolbox = self._make_toolbox(config)
+        self.assertTrue(toolbox.Run())
+        self.assertEqual(len(toolbox._restored), 0)
+
+    def test_CacheModelFiles(self):
+        logger.info("ToolBox result cache of Stan models test")
+        os.makedirs("functions")
+        with open("model.stan", 'w') as model_file:
+            model_file.write("functions {\n    include=myFunctions;\n}\nparameters {\n    real x;\n}\n")
+        with open(os.path.join("functions", "myFunctions.functions"), 'w') as functions_file:
+            functions_file.write("real f(real x) { return x; }\n")
+        config = {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "PyStanSamplingProcessor", "name": "sampler"},
+                    {"type": "ProcessorAssistant", "name": "after"}
+                ],
+                "connections": [{"signal": "sampler:results", "slot": "after:upstream"}],
+                "cache": {"directory": "toolbox_cache"}
+            },
+            "sampler": {"model_code": "model.stan", "function_files_location": "functions", "iter": 100},
+            "after": sleeping_processor(1, 0.)
+        }
+
+        def cache_key():
+            toolbox = self._make_toolbox(config)
+            self.assertTrue(toolbox._CreateAndConfigureProcessors())
+            self.assertTrue(toolbox._DefineChain())
+            return toolbox._CacheKey("sampler")
+
+        key = cache_key()
+        self.assertEqual(cache_key(), key)
+        # Editing the model or one of its function files changes the key: the cache misses
+        with open("model.stan", 'a') as model_file:
+            model_file.write("model {\n    x ~ normal(0, 1);\n}\n")
+        model_key = cache_key()
+        self.assertNotEqual(model_key, key)
+        with open(os.path.join("functions", "myFunctions.functions"), 'a') as functions_file:
+            functions_file.write("real g(real x) { return 2*x; }\n")
+        self.assertNotEqual(cache_key(), model_key)
+
+    def test_Resume(self):
+        logger.info("ToolBox checkpoint and resume test")
+        config = self._fan_out_config(1)
+        config["processors-toolbox"]["checkpoint"] = "toolbox_checkpoint"
+        config["branch2"]["function_name"] = "missingFunction"
+        toolbox = self._make_toolbox(config)
+        self.assertFalse(toolbox.Run())
+
+        config["branch2"]["function_name"] = "mySleepingFunction"
+        toolbox = self._make_toolbox(config)
+        toolbox._resume = True
+        self.assertTrue(toolbox.Run())
+        self.assertEqual(toolbox._resumed, {"source", "branch1"})
+        branch1 = toolbox._processors_dict["branch1"]["object"]
+        self.assertEqual(branch1.upstream, "value=1")
+
+    def test_CheckpointFormat(self):
+        logger.info("Checkpoint format test")
+        from morpho.utilities.checkpoint import save_outputs, load_outputs
+        outputs = {
+            "results": {
+                "x": [1., 2., 3.],
+                "is_sample": [0, 1, 1],
+                "ragged": [[1], [2, 3]]
+            },
+            "name": "a_string"
+        }
+        save_outputs("checkpoint_test.npz", outputs)
+        self.assertEqual(load_outputs("checkpoint_test.npz"), outputs)
+
+    def test_Ensemble(self):
+        logger.info("Ensemble test")
+        from morpho.utilities.ensemble import Ensemble, read_manifest
+        config = self._fan_out_config(1)
+        config["processors-toolbox"]["ensemble"] = {
+            "seed_parameters": ["source.value"],
+            "output_parameters": ["branch1.filename"],
+            "manifest": "ensemble_manifest.json"
+        }
+        config["branch1"]["filename"] = "output.root"
+        with open("toolbox_test.json", 'w') as config_file:
+            json.dump(config, config_file)
+        args = parser.parse_args(False)
+        args.config = "toolbox_test.json"
+        args.ensemble = 3
+        args.jobs = 2
+        args.seed = 10
+        self.assertTrue(Ensemble(args).Run())
+        self.assertEqual(read_manifest("ensemble_manifest.json"),
+                         ["output_0.root", "output_1.root", "output_2.root"])
+
+    def test_EnsembleCopyPaths(self):
+        logger.info("Ensemble copy paths test")
+        from morpho.utilities.ensemble import Ensemble
+        config = self._fan_out_config(1)
+        config["processors-toolbox"]["ensemble"] = {
+            "seed_parameters": ["source.value"]
+        }
+        with open("toolbox_test.json", 'w') as config_file:
+            json.dump(config, config_file)
+        args = parser.parse_args(False)
+        args.config = "toolbox_test.json"
+        args.ensemble = 2
+        args.checkpoint = "checkpoints"
+        args.report = "report.json"
+        an_ensemble = Ensemble(args)
+        # Without output_parameters, the copies would overwrite each other
+        self.assertFalse(an_ensemble.Run())
+        config_dict, _ = an_ensemble._MakeCopyConfig(1)
+        self.assertEqual(config_dict["processors-toolbox"]["checkpoint"],
+                         os.path.join("checkpoints", "copy_1"))
+        self.assertEqual(config_dict["processors-toolbox"]["report"], "report_1.json")
+        self.assertIsNone(an_ensemble.args.checkpoint)
+
+    def _stream_config(self, max_workers):
+        return {
+            "processors-toolbox": {
+                "processors": [
+                    {"type": "myModule:ChunkProcessor", "name": "reader"},
+                    {"type": "myModule:ChunkProcessor", "name": "transform"},
+                    {"type": "myModule:ChunkProcessor", "name": "writer"},
+                    {"type": "ProcessorAssistant", "name": "after"}
+                ],
+                "connections": [
+                    {"signal": "reader", "slot": "transform", "stream": True},
+                    {"signal": "transform", "slot": "writer", "stream": True},
+                    {"signal": "writer:results", "slot": "after:upstream"}
+                ],
+                "max_workers": max_workers
+            },
+            "reader": {"size": 1000, "chunk_size": 64},
+            "transform": {"factor": 2, "delete": False},
+            "writer": {"sink": True, "delete": False},
+            "after": sleeping_processor(1, 0.)
+        }
+
+    def test_Stream(self):
+        logger.info("ToolBox streaming test")
+        for max_workers in [1, 2]:
+            toolbox = self._make_toolbox(self._stream_config(max_workers))
+            self.assertTrue(toolbox.Run())
+            self.assertEqual(toolbox._pipelines, {"reader": ["reader", "transform", "writer"]})
+            writer = toolbox._processors_dict["writer"]["object"]
+            self.assertEqual(writer.results, {"n": 1000, "sum": 2*999*1000/2, "n_chunks": 16})
+            after = toolbox._processors_dict["after"]["object"]
+            self.assertEqual(after.upstream, writer.results)
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args(False)
+    logger = morphologging.getLogger('morpho',
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    logger = morphologging.getLogger(__name__,
+                                     level=args.verbosity,
+                                     stderr_lb=args.stderr_verbosity,
+                                     propagate=False)
+    unittest.main()
@@ -6,6 +6,8 @@ Date: Feb 27 2018
 
 import unittest
 
+import numpy
+
 from morpho.utilities import morphologging, parser
 logger = morphologging.getLogger(__name__)
 
@@ -60,6 +62,192 @@ class SamplingTests(unittest.TestCase):
         # iter-warmup = 1000-900 = 100
         self.assertEqual(len(pystanProcessor.results["y"]), 100)
 
+    def test_PyStanBackgroundCompile(self):
+        logger.info("PyStanSampling background compilation test")
+        from morpho.processors.sampling import PyStanSamplingProcessor
+
+        pystan_config = {
+            "model_code": "model.stan",
+            "input_data": {
+                "slope": 1,
+                "intercept": -2,
+                "xmin": 1,
+                "xmax": 10,
+                "sigma": 1.6
+            },
+            "iter": 100,
+            "interestParams": ['x', 'y', 'residual'],
+            "background_compile": True
+        }
+        pystanProcessor = PyStanSamplingProcessor("pystanProcessor")
+        self.assertTrue(pystanProcessor.Configure(pystan_config))
+        self.assertTrue(pystanProcessor.Run())
+        self.assertEqual(len(pystanProcessor.results["y"]), 100)
+
+    def test_PyStanWarmStart(self):
+        logger.info("PyStanSampling warm start test")
+        from morpho.processors.sampling import PyStanSamplingProcessor
+
+        pystan_config = {
+            "model_code": "model.stan",
+            "input_data": {
+                "slope": 1,
+                "intercept": -2,
+                "xmin": 1,
+                "xmax": 10,
+                "sigma": 1.6
+            },
+            "iter": 200,
+            "interestParams": ['x', 'y', 'residual'],
+            "save_adaptation": "adaptation.json"
+        }
+        pystanProcessor = PyStanSamplingProcessor("pystanProcessor")
+        self.assertTrue(pystanProcessor.Configure(pystan_config))
+        self.assertTrue(pystanProcessor.Run())
+        del pystan_config["save_adaptation"]
+        pystan_config["load_adaptation"] = "adaptation.json"
+        warmStartProcessor = PyStanSamplingProcessor("warmStartProcessor")
+        self.assertTrue(warmStartProcessor.Configure(pystan_config))
+        self.assertTrue(warmStartProcessor.Run())
+        # No warmup (except with pystan < 2.19, which adapts the metric again): the 100 draws after the warmup are made
+        self.assertEqual(len(warmStartProcessor.results["y"]), 100 + warmStartProcessor.warmup)
+
+    def test_PyStanBatch(self):
+        logger.info("PyStanSampling batch test")
+        from morpho.processors.sampling import PyStanSamplingProcessor
+
+        pystan_config = {
+            "model_code": "model.stan",
+            "input_data": {
+                "intercept": -2,
+                "xmin": 1,
+                "xmax": 10,
+                "sigma": 1.6
+            },
+            "datasets": [{"slope": slope} for slope in [0.5, 1, 2]],
+            "batch_jobs": 2,
+            "iter": 100,
+            "interestParams": ['x', 'y', 'residual'],
+            "diagnostics_folder": "batch_diagnostics"
+        }
+        pystanProcessor = PyStanSamplingProcessor("pystanProcessor")
+        self.assertTrue(pystanProcessor.Configure(pystan_config))
+        self.assertTrue(pystanProcessor.Run())
+        self.assertEqual(pystanProcessor.results["y"].shape, (3, 100))
+        self.assertEqual(len(pystanProcessor.diagnostics), 3)
+
+    def test_PyStanAdaptiveRunLength(self):
+        logger.info("PyStanSampling adaptive run length test")
+        from morpho.processors.sampling import PyStanSamplingProcessor
+
+        pystan_config = {
+            "model_code": "model.stan",
+            "input_data": {
+                "slope": 1,
+                "intercept": -2,
+                "xmin": 1,
+                "xmax": 10,
+                "sigma": 1.6
+            },
+            "iter": 200,
+            "warmup": 100,
+            "chain": 2,
+            "seed": 1,
+            "segment_draws": 100,
+            "target_ess": 400,
+            "max_draws": 1000,
+            "interestParams": ['x', 'y', 'residual'],
+            "no_diagnostics": True
+        }
+        pystanProcessor = PyStanSamplingProcessor("pystanProcessor")
+        self.assertTrue(pystanProcessor.Configure(pystan_config))
+        self.assertTrue(pystanProcessor.Run())
+        results = pystanProcessor.results
+        n_draws = len(results.chain(0)["y"]) - 100
+        self.assertEqual(n_draws % 100, 0)
+        self.assertLessEqual(n_draws, 1000)
+        self.assertIn("y", pystanProcessor.convergence)
+
+    def test_PyStanFixedParam(self):
+        logger.info("PyStanSampling Fixed_param generation test")
+        from morpho.processors.sampling import PyStanSamplingProcessor
+
+        generator_config = {
+            "model_code": "generator.stan",
+            "input_data": {
+                "N": 20,
+                "slope": 1,
+                "intercept": -2,
+                "sigma": 1.6
+            },
+            "algorithm": "Fixed_param",
+            "iter": 1,
+            "n_datasets": 10,
+            "seed": 1,
+            "array_params": True,
+            "interestParams": ['x', 'y']
+        }
+        generator = PyStanSamplingProcessor("generator")
+        self.assertTrue(generator.Configure(generator_config))
+        self.assertTrue(generator.Run())
+        self.assertEqual(generator.results["y"].shape, (10, 20))
+        self.assertEqual(len(generator.generated_datasets), 10)
+        self.assertEqual(generator.generated_datasets[3]["y"].shape, (20,))
+
+    def test_PyStanLowMemory(self):
+        logger.info("PyStanSampling low-memory test")
+        from morpho.processors.sampling import PyStanSamplingProcessor
+
+        pystan_config = {
+            "model_code": "model.stan",
+            "input_data": {
+                "slope": 1,
+                "intercept": -2,
+                "xmin": 1,
+                "xmax": 10,
+                "sigma": 1.6
+            },
+            "iter": 400,
+            "thin": 2,
+            "low_memory": True,
+            "results_dtype": "float32",
+            "interestParams": ['y'],
+            "diagnostics_folder": "low_memory_diagnostics"
+        }
+        pystanProcessor = PyStanSamplingProcessor("pystanProcessor")
+        self.assertTrue(pystanProcessor.Configure(pystan_config))
+        self.assertTrue(pystanProcessor.Run())
+        self.assertEqual(len(pystanProcessor.results["y"]), 200)
+        self.assertNotIn("residual", pystanProcessor.results)
+        self.assertEqual(pystanProcessor.results["y"].dtype, numpy.float32)
+
+    def test_PyStanMethods(self):
+        logger.info("PyStanSampling approximate methods test")
+        from morpho.processors.sampling import PyStanSamplingProcessor
+
+        for method in ["optimizing", "laplace", "vb"]:
+            pystan_config = {
+                "model_code": "model.stan",
+                "input_data": {
+                    "slope": 1,
+                    "intercept": -2,
+                    "xmin": 1,
+                    "xmax": 10,
+                    "sigma": 1.6
+                },
+                "method": method,
+                "approx_draws": 500,
+                "iter": 200,
+                "seed": 1,
+                "interestParams": ['x', 'y', 'residual']
+            }
+            pystanProcessor = PyStanSamplingProcessor("pystanProcessor")
+            self.assertTrue(pystanProcessor.Configure(pystan_config))
+            self.assertTrue(pystanProcessor.Run())
+            n_draws = 1 if method == "optimizing" else 500
+            self.assertEqual(len(pystanProcessor.results["y"]), n_draws)
+            self.assertEqual(len(pystanProcessor.results["lp_prob"]), n_draws)
+
     def test_LinearFitRooFitSampler(self):
         logger.info("LinearFitRooFitSampler test")
         from morpho.processors.sampling.LinearFitRooFitProcessor import LinearFitRooFitProcessor
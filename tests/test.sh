@@ -11,6 +11,13 @@ cd ..
 echo "Misc testing"
 cd misc
 python3 misc_test.py -vv || true
+python3 toolbox_test.py -vv || true
+python3 server_test.py -vv || true
+python3 modelcache_test.py -vv || true
+python3 pystanLoader_test.py -vv || true
+python3 convergence_test.py -vv || true
+python3 cpubudget_test.py -vv || true
+python3 background_test.py -vv || true
 cd ..
 
 echo "Sampling testing"